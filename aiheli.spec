@@ -1,14 +1,25 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+import os
+import sys
+
 block_cipher = None
 
+# 打包前预处理县级边界数据（只在 GeoJSON 内容变化时重新生成），exe 启动后直接使用这些产物
+sys.path.insert(0, SPECPATH)
+from utils.geo_assets import build_geo_assets
+build_geo_assets(os.path.join(SPECPATH, 'data', '中国_县.geojson'))
+
 a = Analysis(
     ['app.py'],
     pathex=[],
     binaries=[],
     datas=[
         ('static', 'static'),
-        ('data', 'data'),
+        # 只打包源数据与预处理产物，不带运行时生成的缓存（tile_cache、.geobin）
+        ('data/中国_县.geojson', 'data'),
+        ('data/爱河狸数据_地址拆分.csv', 'data'),
+        ('data/geo_assets', 'data/geo_assets'),
         ('cert.pem', '.'),
         ('key.pem', '.'),
     ],
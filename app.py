@@ -5,13 +5,27 @@ import jwt
 import uuid
 import time
 import hashlib
-import csv
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_from_directory, session
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, g, request, jsonify, send_from_directory, session
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
 from functools import wraps
 import secrets
+import multiprocessing
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from utils.agent_join import STATUS_ENCODINGS, AgentJoinIndex, encode_status
+from utils.agent_store import add_op, create_agent_storage, delete_op, op_county, upsert_op
+from utils.change_feed import ChangeFeed
+from utils.geo_cache import EncodedPayload, GeoJSONCache, encode_json
+from utils.geo_dissolve import (DISSOLVE_LEVELS, build_dissolved_features, canonical_province, dissolve,
+                                 feature_hierarchy, feature_province, normalize_name)
+from utils.geo_simplify import SIMPLIFY_LEVELS, level_for_tolerance, level_for_zoom
+from utils.login_verify import LoginVerifier, LoginVerifierBusy
+from utils.mutation_queue import MutationQueue
+from utils.raster import RENDER_DEFAULT_SIZE, RENDER_MAX_SIZE, RenderCache, render_png
+from utils.token_cache import TokenRevocationList, VerifiedTokenCache, token_id
+from utils.topojson import build_topojson
+from utils.vector_tiles import MAX_TILE_ZOOM, TILE_FORMATS, TileCache, build_tile
 
 # 添加这个函数来获取正确的资源路径（优先外部，其次打包内部，最后项目目录）
 def get_data_path(relative_path):
@@ -117,6 +131,14 @@ users = {
     }
 }
 
+# 已校验令牌的缓存与退出登录后撤销的令牌
+verified_tokens = VerifiedTokenCache()
+revoked_tokens = TokenRevocationList()
+
+# 登录密码校验进程池：队列满或等待超时（秒）时返回 503
+login_verifier = LoginVerifier()
+LOGIN_VERIFY_TIMEOUT = 10
+
 # 注意：get_data_path 已上移到文件顶部，避免重复定义
 
 # 生成CSRF令牌
@@ -129,62 +151,223 @@ def generate_csrf_token():
 def validate_csrf_token(token):
     return token and 'csrf_token' in session and token == session['csrf_token']
 
-# 加载县总代数据
-def load_agent_data():
-    agents_data = {}
-    csv_path = get_data_path('data/爱河狸数据_地址拆分.csv')
-    try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            try:
-                header = next(reader)  # Skip header
-            except StopIteration:
-                return {} # Empty file
+# 县总代数据文件（相对路径，经 get_data_path 解析）
+AGENT_CSV = 'data/爱河狸数据_地址拆分.csv'
 
-            # Assuming column order: 县总代, 联系电话, 省份, 城市, 县名, ...
-            for row in reader:
-                if not row or len(row) < 5:
-                    continue
+# SQLite 存储引擎使用的数据库文件（python -m utils.agent_sqlite migrate 由CSV导入）
+AGENT_DB = 'data/agents.db'
 
-                agent_name = row[0].strip()
-                phone = row[1].strip()
-                province = row[2].strip()
-                city = row[3].strip()
-                county = row[4].strip()
+# 按省分片存储使用的目录（python -m utils.agent_shards split 由CSV拆分）
+AGENT_SHARD_DIR = 'data/agents_by_province'
 
-                if not province or not county:
-                    continue
+# 县总代数据存储引擎：csv（默认，打包后的exe使用）、sqlite 或 partitioned，由环境变量 AGENT_STORAGE 指定
+AGENT_STORAGE = os.environ.get('AGENT_STORAGE', 'csv')
 
-                if not city:
-                    city = province
+# 县总代数据存储；CSV 引擎常驻内存，仅在文件 mtime/size 变化时重新解析
+agent_store = create_agent_storage(AGENT_STORAGE, lambda: get_data_path(AGENT_CSV), lambda: get_data_path(AGENT_DB),
+                                   lambda: get_data_path(AGENT_SHARD_DIR))
 
-                if province not in agents_data:
-                    agents_data[province] = {}
-                
-                if city not in agents_data[province]:
-                    agents_data[province][city] = {}
-                
-                agents_data[province][city][county] = {
-                    'name': agent_name,
-                    'phone': phone,
-                    'has_agent': bool(agent_name)
-                }
-
-    except FileNotFoundError:
-        print(f"警告: 代理数据文件 {csv_path} 未找到。将创建一个空文件。")
-        try:
-            os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['县总代', '联系电话', '省份', '城市', '县名', 'GDP', '人口'])
-        except Exception as e:
-            print(f"创建代理数据文件 {csv_path} 失败: {e}")
-        return {}
+# 县级要素与县总代记录的连接索引（按省份区分同名县）
+agent_join_index = AgentJoinIndex()
+
+# 县总代数据变更日志：事件序号即数据版本（/api/agents 的 ETag 与 since 参数、/api/agents/stream）
+change_feed = ChangeFeed()
+
+
+# 每次提交后（在写线程中）增量更新连接索引、让涉及的切片与渲染缓存失效，
+# 并为涉及的每个县发布一条事件，内容为该县提交后的全部记录，客户端按县整体替换
+def publish_agent_changes(ops, results, before):
+    snapshot = agent_store.snapshot()
+    counties = dict.fromkeys(op_county(op) for op, (status, _) in zip(ops, results) if status != 'not_found')
+    if counties:
+        agent_join_index.update(before, snapshot, counties)
+    refresh_county_caches(before, snapshot, counties)
+    # 提交前的数据与最近一次发布的不同，说明期间数据文件被外部修改，先记入全量重新加载的标记
+    change_feed.sync(before)
+    change_feed.publish([{
+        'county': county,
+        'agents': [{'province': record.province, 'city': record.display_city, **record.to_dict()}
+                   for record in snapshot.find_all(county) if record.province]
+    } for county in counties], snapshot.signature)
+
+
+# 所有修改经由唯一的写线程组提交；读请求直接访问 agent_store
+mutation_queue = MutationQueue(agent_store, on_commit=publish_agent_changes)
+
+# 等待修改落盘的最长时间（秒）
+WRITE_TIMEOUT = 30
+
+
+def commit_mutations(ops):
+    """提交修改并等待其所在的组提交落盘，返回与 ops 对应的 (结果, 记录数) 列表"""
+    return mutation_queue.submit(ops).result(timeout=WRITE_TIMEOUT)
+
+
+# 取得相互一致的 (快照, 变更日志序号)。读取快照期间有本进程的提交时重新读取；
+# 持续写入导致多次读取都不一致时，退回到先取序号再读数据（之后的修改会在增量中补发，重复应用无害）
+CURRENT_VERSION_ATTEMPTS = 5
+
+
+def current_agent_version():
+    """返回 (快照, 序号, 是否一致)；一致时快照要么是本进程已完成 on_commit 的提交结果，要么来自外部修改"""
+    for _ in range(CURRENT_VERSION_ATTEMPTS):
+        generation = mutation_queue.generation
+        snapshot = agent_store.snapshot()
+        seq = change_feed.current(snapshot.signature,
+                                  lambda: generation % 2 == 0 and mutation_queue.generation == generation)
+        if seq is not None:
+            return snapshot, seq, True
+    seq = change_feed.last_seq
+    return agent_store.snapshot(), seq, False
+
+# 县级行政区划GeoJSON文件
+GEOJSON_FILE = 'data/中国_县.geojson'
+
+# 离线预处理产物目录（python -m utils.geo_assets 生成，打包时一并带上）
+GEO_ASSET_DIR = 'data/geo_assets'
+
+# 解析一次、按文件mtime缓存的GeoJSON及其预编码变体；存在匹配的预处理产物时优先使用
+geo_cache = GeoJSONCache(lambda: get_data_path(GEOJSON_FILE), lambda: get_data_path(GEO_ASSET_DIR))
+
+# 矢量切片缓存（内存LRU + data/tile_cache 磁盘目录）
+tile_cache = TileCache()
+
+# 服务端渲染的覆盖图缓存（内存LRU）
+render_cache = RenderCache()
+
+# 返回 status_lookup(要素下标, 县名)：该要素对应的县是否已有县总代（按连接索引，同名县按省份区分）
+# snapshot 用于在一次计算中固定数据版本
+def agent_status_lookup(dataset, snapshot=None):
+    snapshot = snapshot or agent_store.snapshot()
+    join = agent_join_index.get(dataset, snapshot)
+
+    def county_has_agent(feature_index, county_name):
+        record = join.agent(snapshot, feature_index)
+        return record is not None and record.has_agent
+
+    return county_has_agent
+
+
+# 要素对应的县总代记录（按连接索引，同名县按省份区分），用于在几何查询结果中附带代理信息
+def feature_agent_info(join, snapshot, feature_index):
+    record = join.agent(snapshot, feature_index)
+    if record is None:
+        return None
+    return {
+        'province': record.province,
+        'city': record.display_city,
+        'name': record.name,
+        'phone': record.phone,
+        'has_agent': record.has_agent
+    }
+
+
+# 每个县级要素所属的 (省, 市)，随县总代数据版本缓存；要素自身无法确定的部分取连接索引匹配到的记录
+def feature_groups(dataset, snapshot=None):
+    snapshot = snapshot or agent_store.snapshot()
+
+    def build():
+        join = agent_join_index.get(dataset, snapshot)
+
+        def matched_hierarchy(index, province):
+            record = join.agent(snapshot, index)
+            return (record.province, record.display_city) if record is not None else None
+
+        return feature_hierarchy(dataset.features, matched_hierarchy)
+
+    return dataset.latest('hierarchy', snapshot.signature, build)
+
+
+# 省份（标准全称）-> 要素下标列表。省份取自要素自身的属性或行政区划代码，与县总代数据无关；
+# 两者都没有的要素不属于任何省份切片
+def province_features(dataset):
+    def build():
+        provinces = {}
+        for index, feature in enumerate(dataset.features):
+            province = feature_province(feature.get('properties') or {})
+            if province:
+                provinces.setdefault(canonical_province(province), []).append(index)
+        return provinces
+
+    return dataset.derived('province_features', build)
+
+
+# 融合后的省/市级图层，附带每个分组的县数量与已覆盖县数量
+def dissolved_layer(dataset, level, simplify_level):
+    snapshot = agent_store.snapshot()
+    hierarchy = feature_groups(dataset, snapshot)
+    # 市无法确定的县不参与市级融合
+    if level == 'city':
+        groups = [entry if entry and entry[1] else None for entry in hierarchy]
+    else:
+        groups = [entry[0] if entry else None for entry in hierarchy]
+
+    # 几何只依赖分组方式，分组不变时县总代数据更新不会触发重新融合
+    geometry = dataset.latest(('dissolved', level, simplify_level), tuple(groups), lambda: dissolve(
+        dataset.topology(), dataset.simplified_arcs(simplify_level), groups))
+
+    def build():
+        county_has_agent = agent_status_lookup(dataset, snapshot)
+        coverage = {}
+        for index, (key, feature) in enumerate(zip(groups, dataset.features)):
+            if key is None:
+                continue
+            total, covered = coverage.get(key, (0, 0))
+            name = (feature.get('properties') or {}).get('name') or ''
+            coverage[key] = (total + 1, covered + int(county_has_agent(index, name)))
+        return {'type': 'FeatureCollection', 'features': build_dissolved_features(geometry, level, coverage)}
+
+    return dataset.latest(('dissolved_payload', level, simplify_level), snapshot.signature,
+                          lambda: EncodedPayload(encode_json(build()), datetime.now(timezone.utc)))
+
+
+# 切片缓存目录随GeoJSON文件版本切换
+def bind_tile_cache(dataset):
+    tile_cache.bind(os.path.join(os.path.dirname(dataset.path), 'tile_cache', dataset.tag))
+
+
+# 一次提交后在写线程中调用：只让涉及这些县的切片、渲染等缓存失效，并把缓存标记为提交后的数据版本。
+# 提交前的数据（before）与缓存版本不同时说明数据文件被外部修改过，先整体清空
+def refresh_county_caches(before, snapshot, county_names):
+    try:
+        dataset = geo_cache.dataset()
+        bind_tile_cache(dataset)
+        render_cache.bind(dataset.tag)
+        tile_cache.sync_source(before)
+        render_cache.sync_source(before)
+        # 按规范化县名找出受影响的要素（与连接索引一致）
+        join = agent_join_index.get(dataset, snapshot)
+        indices = [i for name in county_names for i in join.features_by_county.get(normalize_name(name), ())]
+        tile_cache.invalidate_bboxes(dataset.feature_bboxes()[indices])
+        tile_cache.mark_source(snapshot.signature)
+        render_cache.invalidate_features(indices)
+        render_cache.mark_source(snapshot.signature)
     except Exception as e:
-        print(f"从CSV加载代理数据时出错: {e}")
-        return {}
-    
-    return agents_data
+        app.logger.error(f'刷新县级缓存失败: {str(e)}')
+
+
+# 读取切片/渲染缓存前调用：返回用于生成的快照；读到的数据来自外部修改时整体清空缓存
+def cache_snapshot(cache):
+    snapshot, _, consistent = current_agent_version()
+    if consistent:
+        cache.sync_source(snapshot.signature)
+    return snapshot
+
+
+# 发送预编码的响应体：支持 If-None-Match 协商缓存（304）与 gzip 压缩
+def payload_response(payload):
+    if payload.etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        use_gzip = request.accept_encodings['gzip'] > 0
+        response = Response(payload.gzip_body if use_gzip else payload.body, mimetype=payload.mimetype)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(payload.etag)
+    response.last_modified = payload.last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
 
 
 # 验证Token的装饰器
@@ -203,19 +386,27 @@ def token_required(f):
             return jsonify({'status': 'error', 'message': '缺少认证令牌'}), 401
         
         try:
-            # 解码token，添加更多验证选项
-            data = jwt.decode(
-                token, 
-                app.config['SECRET_KEY'], 
-                algorithms=['HS256'],
-                options={
-                    'verify_signature': True,
-                    'verify_exp': True,
-                    'verify_nbf': True,
-                    'verify_iat': True,
-                    'require': ['exp', 'iat', 'username']
-                }
-            )
+            # 同一令牌校验通过后缓存其声明（到 exp 为止），之后的请求不再重复校验签名
+            data = verified_tokens.get(token)
+            if data is None:
+                # 解码token，添加更多验证选项
+                data = jwt.decode(
+                    token, 
+                    app.config['SECRET_KEY'], 
+                    algorithms=['HS256'],
+                    options={
+                        'verify_signature': True,
+                        'verify_exp': True,
+                        'verify_nbf': True,
+                        'verify_iat': True,
+                        'require': ['exp', 'iat', 'username']
+                    }
+                )
+                verified_tokens.put(token, data)
+            
+            # 检查令牌是否已通过退出登录撤销
+            if revoked_tokens.is_revoked(token_id(data, token)):
+                return jsonify({'status': 'error', 'message': '令牌已失效，请重新登录'}), 401
             
             current_user = data['username']
             
@@ -225,8 +416,9 @@ def token_required(f):
                 
             is_admin = users.get(current_user, {}).get('is_admin', False)
             
-            # 检查令牌是否在黑名单中（如果实现了令牌撤销功能）
-            # 这里可以添加令牌黑名单检查逻辑
+            # 供 /api/logout 撤销当前令牌
+            g.token = token
+            g.token_claims = data
             
         except jwt.ExpiredSignatureError:
             return jsonify({'status': 'error', 'message': '令牌已过期，请重新登录'}), 401
@@ -300,9 +492,9 @@ def logout(current_user, is_admin):
             app.logger.warning(f'退出时CSRF验证失败: 用户 {current_user}')
             return jsonify({'status': 'error', 'message': 'CSRF验证失败'}), 403
     
-    # 在实际应用中，这里可以实现令牌黑名单
-    # 例如将当前token添加到Redis黑名单，设置过期时间为token的剩余有效期
-    # 这里简化处理，仅记录日志
+    # 撤销当前令牌，保留到其原本的过期时间
+    revoked_tokens.revoke(token_id(g.token_claims, g.token), g.token_claims['exp'])
+    verified_tokens.discard(g.token)
     app.logger.info(f'用户安全退出: {current_user}')
     
     # 生成新的CSRF令牌供下次登录使用
@@ -361,103 +553,39 @@ def login():
         app.logger.warning(f'登录失败: 用户名不存在 - {username} 来自IP {ip}')
         return jsonify({'status': 'error', 'message': '用户名或密码错误'}), 401
     
-    # 解密前端加密的密码
+    # 解密前端加密的密码并校验：在独立的校验进程池中执行，不占用处理其它请求的线程
     try:
-        # 前端使用CryptoJS进行了加密，这里需要解密
-        # 使用与前端相同的盐值和密钥
-        salt = "aiheliSalt2023"
-        secret_key = "aiheli2023SecretKey"
-        
-        # 尝试解密前端加密的密码
-        try:
-            # 使用pycryptodome库解密AES加密的密码
-            from Crypto.Cipher import AES
-            from Crypto.Util.Padding import unpad
-            import base64
-            
-            # CryptoJS AES加密默认使用CBC模式和随机生成的IV
-            # 加密后的数据格式为: Salted__ + 8字节盐值 + 加密数据
-            
-            # 解码前端传来的Base64加密数据
-            encrypted_data = base64.b64decode(encrypted_password)
-            
-            # 检查是否是CryptoJS的Salted格式
-            if encrypted_data[:8] == b'Salted__':
-                # 提取盐值
-                salt_value = encrypted_data[8:16]
-                ciphertext = encrypted_data[16:]
-                
-                # 使用EVP_BytesToKey派生密钥和IV（CryptoJS默认方式）
-                from Crypto.Hash import MD5
-                key_iv = b""
-                while len(key_iv) < 32 + 16:  # 32字节密钥 + 16字节IV
-                    h = MD5.new()
-                    h.update(key_iv[-MD5.digest_size:] if key_iv else b"")
-                    h.update(secret_key.encode('utf-8'))
-                    h.update(salt_value)
-                    key_iv += h.digest()
-                
-                key = key_iv[:32]  # 32字节密钥用于AES-256
-                iv = key_iv[32:32+16]  # 16字节IV
-                
-                # 创建AES解密器
-                cipher = AES.new(key, AES.MODE_CBC, iv)
-                
-                # 解密并去除填充
-                decrypted_data = unpad(cipher.decrypt(ciphertext), AES.block_size)
-                
-                # 获取解密后的哈希值
-                hashed_password = decrypted_data.decode('utf-8')
-            else:
-                # 如果不是Salted格式，尝试使用旧的解密方式
-                # AES解密需要16字节的密钥
-                # 使用与前端相同的密钥处理方式
-                key = secret_key.encode('utf-8')
-                # 如果密钥长度不是16/24/32字节，需要调整
-                if len(key) > 32:
-                    key = key[:32]
-                elif len(key) > 24:
-                    key = key[:24]
-                elif len(key) > 16:
-                    key = key[:16]
-                
-                # 提取IV（前16字节）和加密数据
-                iv = encrypted_data[:16]
-                ciphertext = encrypted_data[16:]
-                
-                # 创建AES解密器
-                cipher = AES.new(key, AES.MODE_CBC, iv)
-                
-                # 解密并去除填充
-                decrypted_data = unpad(cipher.decrypt(ciphertext), AES.block_size)
-                
-                # 获取解密后的哈希值
-                hashed_password = decrypted_data.decode('utf-8')
-            
-            # 验证密码是否正确
-            # 现在数据库中存储的是密码+salt的SHA256哈希值的哈希
-            # 而前端传来的hashed_password也是密码+salt的SHA256哈希值
-            # 两者可以直接比较
-            if not check_password_hash(user['password'], hashed_password):
-                app.logger.warning(f'登录失败: 密码错误 - 用户 {username} 来自IP {ip}')
-                return jsonify({'status': 'error', 'message': '用户名或密码错误'}), 401
-        except Exception as decrypt_error:
-            # 如果解密失败，记录错误并返回错误信息
-            app.logger.error(f'密码解密失败: {str(decrypt_error)}')
-            return jsonify({
-                'status': 'error', 
-                'message': '密码格式错误',
-                'csrf_token': generate_csrf_token()
-            }), 400
+        future = login_verifier.submit(user['password'], encrypted_password)
+        (result, error), timings = future.result(timeout=LOGIN_VERIFY_TIMEOUT)
+    except (LoginVerifierBusy, FutureTimeoutError):
+        app.logger.warning(f'登录校验繁忙: 用户 {username} 来自IP {ip}')
+        response = jsonify({
+            'status': 'error',
+            'message': '登录请求过多，请稍后重试',
+            'csrf_token': generate_csrf_token()
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
     except Exception as e:
         app.logger.error(f'密码验证错误: {str(e)}')
-        app.logger.error(f'密码解密或验证失败，可能是加密算法不匹配: {str(e)}')
         return jsonify({
             'status': 'error', 
             'message': '登录处理失败',
             'csrf_token': generate_csrf_token() # 返回新的CSRF令牌以便前端继续使用
         }), 500
     
+    if result == 'invalid':
+        # 如果解密失败，记录错误并返回错误信息
+        app.logger.error(f'密码解密失败: {error}')
+        return jsonify({
+            'status': 'error', 
+            'message': '密码格式错误',
+            'csrf_token': generate_csrf_token()
+        }), 400
+    if result != 'ok':
+        app.logger.warning(f'登录失败: 密码错误 - 用户 {username} 来自IP {ip}')
+        return jsonify({'status': 'error', 'message': '用户名或密码错误'}), 401
+    
     # 登录成功，重置尝试次数
     if ip in login_attempts:
         login_attempts[ip]['attempts'] = 0
@@ -468,20 +596,23 @@ def login():
     
     # 生成更安全的token
     now = datetime.utcnow()
-    token_id = str(uuid.uuid4())
+    jti = str(uuid.uuid4())
     token_payload = {
         'username': username,
         'is_admin': user['is_admin'],
         'iat': now,
         'nbf': now,  # Not Before
         'exp': now + timedelta(hours=24),
-        'jti': token_id  # JWT ID
+        'jti': jti  # JWT ID
     }
     
+    signing_started = time.perf_counter()
     token = jwt.encode(token_payload, app.config['SECRET_KEY'], algorithm='HS256')
+    timings['jwt'] = (time.perf_counter() - signing_started) * 1000
     
-    # 记录成功登录
-    app.logger.info(f'登录成功: 用户 {username} 来自IP {ip}')
+    # 记录成功登录及各阶段耗时（毫秒）
+    stage_timings = ', '.join(f'{stage} {ms:.1f}ms' for stage, ms in timings.items())
+    app.logger.info(f'登录成功: 用户 {username} 来自IP {ip}（{stage_timings}）')
     
     # 返回新的CSRF令牌
     new_csrf_token = generate_csrf_token()
@@ -489,71 +620,117 @@ def login():
     # 记录登录成功的日志，包含加密方式信息
     app.logger.info(f'用户 {username} 使用增强加密方式成功登录，IP: {ip}')
     
-    return jsonify({
+    response = jsonify({
         'status': 'success',
         'token': token,
         'is_admin': user['is_admin'],
         'csrf_token': new_csrf_token
     })
+    response.headers['Server-Timing'] = ', '.join(f'{stage};dur={ms:.1f}' for stage, ms in timings.items())
+    return response
 
 # 路由：获取所有县总代数据
 @app.route('/api/agents')
 def get_agents():
-    agents_data = load_agent_data()
+    # 数据文件被外部修改时先记入变更日志（使之前的版本号失效），再取与数据一致的版本号
+    snapshot, seq, _ = current_agent_version()
     
     # 生成新的CSRF令牌
     new_csrf_token = generate_csrf_token()
     
-    return jsonify({
-        'status': 'success',
-        'data': agents_data,
-        'csrf_token': new_csrf_token
-    })
+    # ?since=<版本号>：只返回之后新增、修改或删除的县；无法补齐时退回全量数据
+    since = request.args.get('since')
+    if since:
+        events = change_feed.since(change_feed.parse_id(since))
+        if events is not None:
+            changes = {}
+            for _, data in events:
+                changes.pop(data['county'], None)
+                changes[data['county']] = data
+            return jsonify({
+                'status': 'success',
+                'delta': True,
+                'changes': list(changes.values()),
+                'version': change_feed.event_id(events[-1][0] if events else change_feed.parse_id(since)),
+                'csrf_token': new_csrf_token
+            })
+    
+    version = change_feed.event_id(seq)
+    if version in request.if_none_match:
+        response = Response(status=304)
+    else:
+        # data 由快照按省份缓存的编码片段拼接，修改后只重新编码涉及的省份
+        head = encode_json({
+            'status': 'success',
+            'version': version,
+            'csrf_token': new_csrf_token
+        })
+        response = Response(head[:-1] + b',"data":' + snapshot.tree_json() + b'}', mimetype='application/json')
+    response.set_etag(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    # 响应中的CSRF令牌属于当前会话
+    response.vary.add('Cookie')
+    return response
+
+# 变更流连接保持的最长时间与心跳间隔（秒）；连接到期关闭后浏览器会带 Last-Event-ID 自动重连
+STREAM_MAX_SECONDS = 300
+STREAM_KEEPALIVE_SECONDS = 15
+
+# 路由：县总代数据变更流（Server-Sent Events）
+@app.route('/api/agents/stream')
+def stream_agents():
+    # 浏览器重连时通过 Last-Event-ID 头带上最后收到的事件；首次连接可用 last_event_id 参数（/api/agents 返回的 version）
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    # 先记入可能的外部修改，使带旧 ID 的重连收到 reset
+    _, current, _ = current_agent_version()
+    start = change_feed.parse_id(last_id) if last_id else current
+
+    def generate():
+        yield 'retry: 3000\n\n'
+        seq = start
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        # 先补发错过的事件，之后等待新事件
+        events = change_feed.since(seq)
+        while True:
+            if events is None:
+                # 无法补齐错过的事件，通知客户端重新加载全量数据
+                seq = change_feed.last_seq
+                yield f'id: {change_feed.event_id(seq)}\nevent: reset\ndata: {{}}\n\n'
+            elif events:
+                for seq, data in events:
+                    yield f'id: {change_feed.event_id(seq)}\nevent: change\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+            else:
+                yield ': keepalive\n\n'
+            if time.monotonic() >= deadline:
+                break
+            events = change_feed.wait(seq, STREAM_KEEPALIVE_SECONDS)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # 路由：获取单个县信息
 @app.route('/api/county/<county_name>', methods=['GET'])
 def get_county(county_name):
-    csv_path = get_data_path('data/爱河狸数据_地址拆分.csv')
     try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            header = next(reader) # skip header
-            
-            try:
-                name_col = header.index('县总代')
-                phone_col = header.index('联系电话')
-                county_col = header.index('县名')
-            except ValueError:
-                # Fallback to hardcoded indices
-                name_col, phone_col, county_col = 0, 1, 4
-
-            for row in reader:
-                if len(row) > county_col and row[county_col].strip() == county_name:
-                    agent_name = row[name_col].strip()
-                    agent_phone = row[phone_col].strip()
-                    return jsonify({
-                        'status': 'success',
-                        'data': {
-                            'name': county_name,
-                            'agent_name': agent_name,
-                            'agent_phone': agent_phone,
-                            'has_agent': bool(agent_name)
-                        },
-                        'csrf_token': generate_csrf_token()
-                    })
-        
+        record = agent_store.find_county(county_name)
+        if record is not None:
+            return jsonify({
+                'status': 'success',
+                'data': {
+                    'name': county_name,
+                    'agent_name': record.name,
+                    'agent_phone': record.phone,
+                    'has_agent': record.has_agent
+                },
+                'csrf_token': generate_csrf_token()
+            })
+
         return jsonify({
             'status': 'error',
             'message': f'未找到县: {county_name}',
             'csrf_token': generate_csrf_token()
         }), 404
 
-    except FileNotFoundError:
-         return jsonify({
-            'status': 'error',
-            'message': f'代理数据文件不存在',
-            'csrf_token': generate_csrf_token()
-        }), 500
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -579,53 +756,23 @@ def delete_county(current_user, is_admin, county_name):
                 'csrf_token': generate_csrf_token()
             }), 403
 
-    csv_path = get_data_path('data/爱河狸数据_地址拆分.csv')
-    temp_csv_path = csv_path + '.tmp'
-    deleted = False
-
     try:
-        with open(csv_path, 'r', encoding='utf-8') as infile, open(temp_csv_path, 'w', newline='', encoding='utf-8') as outfile:
-            reader = csv.reader(infile)
-            writer = csv.writer(outfile)
-
-            header = next(reader)
-            writer.writerow(header)
-
-            try:
-                county_col = header.index('县名')
-            except ValueError:
-                county_col = 4 # Fallback
-
-            for row in reader:
-                if len(row) > county_col and row[county_col].strip() == county_name:
-                    deleted = True
-                else:
-                    writer.writerow(row)
-
+        # 修改以日志形式追加写入，不再复制整个CSV文件
+        deleted = commit_mutations([delete_op(county_name)])[0][1]
         if deleted:
-            os.replace(temp_csv_path, csv_path)
             return jsonify({
                 'status': 'success',
                 'message': f'已成功删除县: {county_name}',
                 'csrf_token': generate_csrf_token()
             })
         else:
-            os.remove(temp_csv_path)
             return jsonify({
                 'status': 'error',
                 'message': f'未找到要删除的县: {county_name}',
                 'csrf_token': generate_csrf_token()
             }), 404
 
-    except FileNotFoundError:
-        return jsonify({
-            'status': 'error',
-            'message': '代理数据文件不存在',
-            'csrf_token': generate_csrf_token()
-        }), 500
     except Exception as e:
-        if os.path.exists(temp_csv_path):
-            os.remove(temp_csv_path)
         return jsonify({
             'status': 'error',
             'message': f'删除县信息失败: {str(e)}',
@@ -658,6 +805,12 @@ def add_county(current_user, is_admin):
             'message': '缺少必要的字段',
             'csrf_token': generate_csrf_token()
         }), 400
+    if not str(data['county']).strip():
+        return jsonify({
+            'status': 'error',
+            'message': '县名不能为空',
+            'csrf_token': generate_csrf_token()
+        }), 400
 
     province = data['province']
     city = data['city']
@@ -671,14 +824,8 @@ def add_county(current_user, is_admin):
         # 记录操作日志
         app.logger.info(f'用户 {current_user} 正在添加新的县总代数据: {province}-{city}-{county}')
 
-        # 读取现有的CSV文件
-        csv_path = get_data_path('data/爱河狸数据_地址拆分.csv')
-        new_row = [agent_name, agent_phone, province, city, county, '', ''] # GDP和人口留空
-
-        # 将新数据追加到CSV文件
-        with open(csv_path, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(new_row)
+        # 追加到修改日志（GDP和人口留空），由后台合并写回CSV
+        commit_mutations([add_op(province, city, county, agent_name, agent_phone)])
 
         # 返回成功响应
         return jsonify({
@@ -720,41 +867,12 @@ def update_county(current_user, is_admin, county_name):
             'csrf_token': generate_csrf_token()
         }), 400
     
-    csv_path = get_data_path('data/爱河狸数据_地址拆分.csv')
     try:
         app.logger.info(f'用户 {current_user} 正在更新县 {county_name} 的总代信息')
-        
-        rows = []
-        county_found = False
-        
-        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            header = next(reader)
-            rows.append(header)
-            
-            try:
-                name_col = header.index('县总代')
-                phone_col = header.index('联系电话')
-                county_col = header.index('县名')
-            except ValueError:
-                name_col, phone_col, county_col = 0, 1, 4
-
-            for row in reader:
-                if len(row) > county_col and row[county_col].strip() == county_name:
-                    row[name_col] = data['agent_name']
-                    row[phone_col] = data['agent_phone']
-                    county_found = True
-                rows.append(row)
-
-        if not county_found:
-            province = data.get('province', '')
-            city = data.get('city', '')
-            new_row = [data['agent_name'], data['agent_phone'], province, city, county_name, '', '']
-            rows.append(new_row)
-
-        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerows(rows)
+
+        # 县不存在时按请求中的省/市新增一行
+        commit_mutations([upsert_op(county_name, data['agent_name'], data['agent_phone'],
+                                    data.get('province', ''), data.get('city', ''))])
         
         new_csrf_token = generate_csrf_token()
         
@@ -763,32 +881,174 @@ def update_county(current_user, is_admin, county_name):
             'message': '更新成功',
             'csrf_token': new_csrf_token
         })
-    except FileNotFoundError:
+    except Exception as e:
+        app.logger.error(f'更新县总代信息失败: 用户 {current_user}, 县 {county_name}, 错误: {str(e)}')
+        
         return jsonify({
             'status': 'error',
-            'message': f'代理数据文件不存在',
+            'message': f'更新县总代信息失败: {str(e)}',
             'csrf_token': generate_csrf_token()
         }), 500
+
+
+# 单次批量修改的最大条目数
+MAX_BATCH_ITEMS = 1000
+
+
+# 校验批量修改中的一项，返回 (存储层修改, 错误信息)
+def parse_batch_item(item):
+    if not isinstance(item, dict):
+        return None, '每一项应为对象'
+    op = item.get('op')
+    county = item.get('county')
+    if not isinstance(county, str) or not county.strip():
+        return None, '缺少县名(county)'
+    county = county.strip()
+    if op == 'delete':
+        return delete_op(county), None
+    if op == 'upsert':
+        if not item.get('agent_name') or not item.get('agent_phone'):
+            return None, '请提供县总代姓名和电话'
+        return upsert_op(county, item['agent_name'], item['agent_phone'],
+                         item.get('province', ''), item.get('city', '')), None
+    return None, f'不支持的操作: {op}（可选 upsert、delete）'
+
+
+# 路由：批量新增/更新/删除县总代（需要管理员权限）
+# 请求体 {"items": [{"op": "upsert", "county": .., "agent_name": .., "agent_phone": .., "province": .., "city": ..},
+#                  {"op": "delete", "county": ..}, ...]}
+# 全部校验通过后在一次提交中应用，返回每一项的结果；任一项校验失败则不做任何修改
+@app.route('/api/county/batch', methods=['POST'])
+@token_required
+@admin_required
+def batch_update_counties(current_user, is_admin):
+    data = request.get_json(silent=True) or {}
+
+    # 验证CSRF令牌
+    if app.config.get('CSRF_ENABLED', True):
+        csrf_token = data.get('csrf_token')
+        if not validate_csrf_token(csrf_token):
+            app.logger.warning(f'批量修改县总代数据时CSRF验证失败: 用户 {current_user}')
+            return jsonify({
+                'status': 'error',
+                'message': 'CSRF验证失败',
+                'csrf_token': generate_csrf_token()
+            }), 403
+
+    items = data.get('items')
+    if not isinstance(items, list) or not items or len(items) > MAX_BATCH_ITEMS:
+        return jsonify({
+            'status': 'error',
+            'message': f'items 应为非空数组，且不超过 {MAX_BATCH_ITEMS} 项',
+            'csrf_token': generate_csrf_token()
+        }), 400
+
+    ops = []
+    errors = []
+    for index, item in enumerate(items):
+        op, error = parse_batch_item(item)
+        if error:
+            errors.append({'index': index, 'message': error})
+        ops.append(op)
+    if errors:
+        return jsonify({
+            'status': 'error',
+            'message': '批量请求校验失败，未做任何修改',
+            'errors': errors,
+            'csrf_token': generate_csrf_token()
+        }), 400
+
+    try:
+        app.logger.info(f'用户 {current_user} 正在批量修改 {len(ops)} 条县总代数据')
+        results = commit_mutations(ops)
+        return jsonify({
+            'status': 'success',
+            'results': [{
+                'index': index,
+                'op': items[index]['op'],
+                'county': op[1],
+                'result': status,
+                'count': count
+            } for index, (op, (status, count)) in enumerate(zip(ops, results))],
+            'csrf_token': generate_csrf_token()
+        })
     except Exception as e:
-        app.logger.error(f'更新县总代信息失败: 用户 {current_user}, 县 {county_name}, 错误: {str(e)}')
-        
+        app.logger.error(f'批量修改县总代数据失败: 用户 {current_user}, 错误: {str(e)}')
         return jsonify({
             'status': 'error',
-            'message': f'更新县总代信息失败: {str(e)}',
+            'message': f'批量修改县总代数据失败: {str(e)}',
             'csrf_token': generate_csrf_token()
         }), 500
 
 
+# 按请求参数选择预设的简化级别：zoom（地图缩放级别）或 tolerance（容差，单位度）
+def requested_simplify_level():
+    zoom = request.args.get('zoom', type=float)
+    if zoom is not None:
+        return level_for_zoom(zoom)
+    tolerance = request.args.get('tolerance', type=float)
+    if tolerance is not None and tolerance > 0:
+        return level_for_tolerance(tolerance)
+    return None
+
+
 # 路由：提供GeoJSON数据
 @app.route('/api/geojson', methods=['GET'])
 def get_geojson():
     try:
-        with open(get_data_path('data/中国_县.geojson'), 'r', encoding='utf-8') as f:
-            geojson_data = json.load(f)
-        
+        dataset = geo_cache.dataset()
+        level = requested_simplify_level()
+        output_format = request.args.get('format', 'geojson')
+        if output_format not in ('geojson', 'topojson'):
+            return jsonify({
+                'status': 'error',
+                'message': f'不支持的格式: {output_format}',
+                'csrf_token': generate_csrf_token()
+            }), 400
+
+        boundary_level = request.args.get('level', 'county')
+        if boundary_level != 'county' and (boundary_level not in DISSOLVE_LEVELS or output_format != 'geojson'):
+            return jsonify({
+                'status': 'error',
+                'message': f'不支持的边界级别: {boundary_level}',
+                'csrf_token': generate_csrf_token()
+            }), 400
+
+        bbox = request.args.get('bbox')
+        if bbox is not None:
+            try:
+                bbox = tuple(float(v) for v in bbox.split(','))
+                if len(bbox) != 4 or boundary_level != 'county' or output_format != 'geojson':
+                    raise ValueError(bbox)
+            except ValueError:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'bbox格式应为 minx,miny,maxx,maxy，且仅支持县级GeoJSON',
+                    'csrf_token': generate_csrf_token()
+                }), 400
+            # 视口查询：空间索引筛出外包矩形相交的县，由预编码片段直接拼接响应体
+            indices = dataset.spatial_index().candidates(bbox).tolist()
+            payload = dataset.viewport(indices, level)
+        elif boundary_level != 'county':
+            # 省/市级融合边界：低缩放级别下用几十、几百个面代替全部县
+            payload = dissolved_layer(dataset, boundary_level, level)
+        elif output_format == 'topojson':
+            # 共享弧段 + 量化差分编码的TopoJSON，同样按文件版本和简化级别缓存
+            tolerance = SIMPLIFY_LEVELS[level][1] if level is not None else None
+            payload = dataset.variant(('topojson', level), lambda: build_topojson(
+                dataset.features, dataset.topology(), dataset.simplified_arcs(level), tolerance))
+        elif level is None:
+            payload = dataset.full()
+        else:
+            # 各简化级别在首次请求时基于共享弧段生成，由逐要素预编码的片段拼接，之后直接使用缓存
+            payload = dataset.variant(('simplified', level), lambda: dataset.feature_collection(None, level))
+
+        # 文件只解析、序列化、压缩一次；客户端携带相同ETag时直接返回304
+        response = payload_response(payload)
+        # 告知前端当前几何适用的最大缩放级别，超过后应重新请求更精细的数据
+        response.headers['X-Simplify-Max-Zoom'] = str(SIMPLIFY_LEVELS[level][0]) if level is not None else ''
         # 为了保持前端兼容性，直接返回GeoJSON数据
         # 但在响应头中添加CSRF令牌
-        response = jsonify(geojson_data)
         response.headers['X-CSRF-Token'] = generate_csrf_token()
         return response
     except Exception as e:
@@ -798,7 +1058,246 @@ def get_geojson():
             'csrf_token': generate_csrf_token()
         }), 500
 
+# 路由：按省份提供县级GeoJSON（支持 zoom/tolerance 简化参数）
+@app.route('/api/geojson/<province>', methods=['GET'])
+def get_province_geojson(province):
+    try:
+        dataset = geo_cache.dataset()
+        provinces = province_features(dataset)
+        # 允许省略“省”“市”“自治区”等后缀
+        name = canonical_province(province)
+        if name not in provinces:
+            return jsonify({
+                'status': 'error',
+                'message': f'未找到省份: {province}',
+                'csrf_token': generate_csrf_token()
+            }), 404
+
+        level = requested_simplify_level()
+        indices = provinces[name]
+        payload = dataset.derived(('province', name, level), lambda: EncodedPayload(
+            dataset.feature_collection(indices, level), dataset.last_modified))
+
+        response = payload_response(payload)
+        response.headers['X-Simplify-Max-Zoom'] = str(SIMPLIFY_LEVELS[level][0]) if level is not None else ''
+        response.headers['X-CSRF-Token'] = generate_csrf_token()
+        return response
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'加载GeoJSON数据失败: {str(e)}',
+            'csrf_token': generate_csrf_token()
+        }), 500
+
+# 路由：矢量切片（默认MVT，可通过扩展名或format参数请求GeoJSON）
+@app.route('/api/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+@app.route('/api/tiles/<int:z>/<int:x>/<int:y>.<fmt>', methods=['GET'])
+def get_tile(z, x, y, fmt=None):
+    fmt = fmt or request.args.get('format', 'mvt')
+    if fmt not in TILE_FORMATS or not 0 <= z <= MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({'status': 'error', 'message': '无效的切片请求'}), 404
+
+    try:
+        dataset = geo_cache.dataset()
+        bind_tile_cache(dataset)
+        # 县总代数据被外部修改时无法精确失效，整体清空切片缓存
+        snapshot = cache_snapshot(tile_cache)
+
+        key = (z, x, y, fmt)
+        payload = tile_cache.get(key)
+        if payload is None:
+            tile = build_tile(dataset, z, x, y, fmt, agent_status_lookup(dataset, snapshot))
+            body = tile if isinstance(tile, bytes) else encode_json(tile)
+            payload = EncodedPayload(body, datetime.now(timezone.utc), TILE_FORMATS[fmt])
+            # 生成期间数据已更新时不缓存
+            tile_cache.put(key, payload, snapshot.signature)
+        return payload_response(payload)
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'生成切片失败: {str(e)}'
+        }), 500
+
+# 路由：县级要素元数据表（外包矩形、质心、面积、标注点），行顺序与 /api/geojson 要素顺序一致
+@app.route('/api/counties/meta', methods=['GET'])
+def get_counties_meta():
+    try:
+        dataset = geo_cache.dataset()
+        payload = dataset.variant('meta', lambda: {
+            'status': 'success',
+            'data': dataset.meta_table()
+        })
+        return payload_response(payload)
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'加载县级元数据失败: {str(e)}'
+        }), 500
+
+# 路由：县级要素与县总代记录的连接结果
+# agents 为全部县总代记录，features 按 /api/geojson 的要素顺序给出每个要素对应的记录下标（无则为 null），
+# mapped / unmapped 为已连接到要素、未连接到要素的记录下标
+@app.route('/api/agents/join', methods=['GET'])
+def get_agent_join():
+    try:
+        dataset = geo_cache.dataset()
+        snapshot = agent_store.snapshot()
+        join = agent_join_index.get(dataset, snapshot)
+
+        def build():
+            keyed = snapshot.keyed_records()
+            position = {key: index for index, key in enumerate(keyed)}
+            mapped, unmapped = join.partition(keyed)
+            return EncodedPayload(encode_json({
+                'status': 'success',
+                'agents': [{'province': key[0], 'city': key[1], 'county': key[2], **record.to_dict()}
+                           for key, record in keyed.items()],
+                'features': [position[key] if key is not None else None for key in join.feature_agents],
+                'mapped': [position[key] for key in mapped],
+                'unmapped': [position[key] for key in unmapped]
+            }), datetime.now(timezone.utc))
+
+        return payload_response(dataset.latest('agent_join', join.signature, build))
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'加载县总代连接结果失败: {str(e)}'
+        }), 500
+
+# 路由：按要素顺序（与 /api/geojson 一致）的“是否已有县总代”位图，重新着色时代替完整的 /api/agents
+# encoding=bitset（默认，base64，每个要素1位）或 rle（游程长度）；结果缓存到下一次修改
+@app.route('/api/agents/status', methods=['GET'])
+def get_agent_status():
+    encoding = request.args.get('encoding', 'bitset')
+    if encoding not in STATUS_ENCODINGS:
+        return jsonify({
+            'status': 'error',
+            'message': f'不支持的编码: {encoding}（可选: {", ".join(STATUS_ENCODINGS)}）'
+        }), 400
+    try:
+        dataset = geo_cache.dataset()
+        # 与 /api/agents 相同的版本号
+        snapshot, seq, _ = current_agent_version()
+        version = change_feed.event_id(seq)
+        join = agent_join_index.get(dataset, snapshot)
+
+        def build():
+            flags = join.has_agent_flags(snapshot)
+            return EncodedPayload(encode_json({
+                'status': 'success',
+                'version': version,
+                'count': len(flags),
+                'encoding': encoding,
+                'data': encode_status(flags, encoding)
+            }), datetime.now(timezone.utc))
+
+        return payload_response(dataset.latest(('agent_status', encoding), (join.signature, version), build))
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'加载县总代状态失败: {str(e)}'
+        }), 500
+
+# 路由：服务端渲染的县总代覆盖图（PNG，Web墨卡托），供渲染能力较弱的设备作为图片图层叠加
+@app.route('/api/render.png', methods=['GET'])
+def render_map():
+    try:
+        bbox = tuple(float(v) for v in request.args.get('bbox', '').split(','))
+        width = request.args.get('width', RENDER_DEFAULT_SIZE, type=int)
+        height = request.args.get('height', RENDER_DEFAULT_SIZE, type=int)
+        if len(bbox) != 4 or not (bbox[0] < bbox[2] and bbox[1] < bbox[3]):
+            raise ValueError(bbox)
+        if not (0 < width <= RENDER_MAX_SIZE and 0 < height <= RENDER_MAX_SIZE):
+            raise ValueError((width, height))
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': f'参数格式应为 bbox=minx,miny,maxx,maxy&width=..&height=..（宽高不超过{RENDER_MAX_SIZE}）'
+        }), 400
+
+    try:
+        dataset = geo_cache.dataset()
+        render_cache.bind(dataset.tag)
+        # 县总代数据被外部修改时无法精确失效，整体清空
+        snapshot = cache_snapshot(render_cache)
+
+        key = (tuple(round(v, 6) for v in bbox), width, height)
+        payload = render_cache.get(key)
+        if payload is None:
+            # 按像素跨度选择简化级别：简化误差不超过半个像素
+            level = level_for_tolerance((bbox[2] - bbox[0]) / width / 2)
+            candidates = dataset.spatial_index().candidates(bbox).tolist()
+            body, visible = render_png(dataset.simplified_features(level), candidates, bbox, width, height,
+                                       agent_status_lookup(dataset, snapshot))
+            payload = EncodedPayload(body, datetime.now(timezone.utc), 'image/png')
+            render_cache.put(key, visible, payload, snapshot.signature)
+        return payload_response(payload)
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'渲染地图失败: {str(e)}'
+        }), 500
+
+# 单次批量定位的最大点数
+MAX_LOCATE_POINTS = 10000
+
+
+# 解析定位请求中的坐标：[lng, lat] 或 {"lng": .., "lat": ..}
+def parse_locate_point(item):
+    if isinstance(item, dict):
+        item = [item.get('lng', item.get('lon')), item.get('lat')]
+    lng, lat = float(item[0]), float(item[1])
+    if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+        raise ValueError('坐标超出范围')
+    return lng, lat
+
+
+# 路由：坐标落区查询。GET 查询单点（lng、lat参数），POST 批量查询（{"points": [[lng, lat], ...]}）
+# 只读接口，与 /api/agents 一样无需登录
+@app.route('/api/locate', methods=['GET', 'POST'])
+def locate():
+    try:
+        if request.method == 'GET':
+            raw_points = [(request.args.get('lng'), request.args.get('lat'))]
+        else:
+            data = request.get_json(silent=True) or {}
+            raw_points = data.get('points')
+            if not isinstance(raw_points, list):
+                return jsonify({'status': 'error', 'message': '请提供points坐标数组'}), 400
+            if len(raw_points) > MAX_LOCATE_POINTS:
+                return jsonify({'status': 'error', 'message': f'单次最多查询{MAX_LOCATE_POINTS}个坐标'}), 400
+        points = [parse_locate_point(item) for item in raw_points]
+    except (TypeError, ValueError, IndexError):
+        return jsonify({'status': 'error', 'message': '坐标格式错误'}), 400
+
+    try:
+        dataset = geo_cache.dataset()
+        snapshot = agent_store.snapshot()
+        join = agent_join_index.get(dataset, snapshot)
+        matches = dataset.spatial_index().locate(points).tolist() if points else []
+        results = []
+        for (lng, lat), index in zip(points, matches):
+            result = {'lng': lng, 'lat': lat, 'feature_index': None, 'county': None, 'agent': None}
+            if index >= 0:
+                feature = dataset.features[index]
+                result['feature_index'] = index
+                result['county'] = (feature.get('properties') or {}).get('name')
+                result['agent'] = feature_agent_info(join, snapshot, index)
+            results.append(result)
+
+        return jsonify({
+            'status': 'success',
+            'data': results[0] if request.method == 'GET' else results
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'坐标定位失败: {str(e)}'
+        }), 500
+
 if __name__ == '__main__':
+    # 打包后的程序启动登录校验进程时需要
+    multiprocessing.freeze_support()
     try:
         # 确保外部数据文件存在
         from utils.pack_utils import ensure_external_data_exists
@@ -7,6 +7,12 @@ let token = localStorage.getItem('token');
 let mappedCounties = []; // 已在地图上正确映射的县
 let unmappedCounties = []; // 未在地图上正确映射的县
 let csrfToken = localStorage.getItem('csrfToken'); // CSRF令牌
+let geojsonMaxZoom = null; // 当前已加载的简化几何适用的最大缩放级别（null 表示原始精度）
+let agentStream = null; // 县总代数据变更流（/api/agents/stream）
+let agentsVersion = null; // 已加载的县总代数据版本，用于增量同步
+let agentJoin = null; // 服务端计算的要素与县总代记录的连接结果（/api/agents/join）
+let featureIndexes = new Map(); // GeoJSON要素对象 -> 要素下标（与连接结果对齐）
+let agentJoinTimer = null;
 
 // Toast通知元素
 let toastContainer = null;
@@ -57,6 +63,9 @@ async function init() {
     // 加载GeoJSON数据
     await loadGeoJSON();
     
+    // 加载县级元数据（外包矩形、标注点等）
+    await loadCountyMeta();
+    
     // 加载县总代数据
     await loadAgentsData();
     
@@ -232,7 +241,9 @@ async function loadGeoJSON() {
             headers['X-CSRF-Token'] = csrfToken;
         }
         
-        const response = await fetch('/api/geojson', { headers });
+        // 按当前缩放级别请求服务端预简化的几何，国家级视图无需下载全精度边界
+        const zoom = Math.floor(map.getZoom());
+        const response = await fetch(`/api/geojson?zoom=${zoom}`, { headers });
         
         // 检查并更新CSRF令牌（如果在响应头中）
         const newCsrfToken = response.headers.get('X-CSRF-Token');
@@ -241,22 +252,53 @@ async function loadGeoJSON() {
             localStorage.setItem('csrfToken', csrfToken);
         }
         
+        const maxZoomHeader = response.headers.get('X-Simplify-Max-Zoom');
+        geojsonMaxZoom = maxZoomHeader ? Number(maxZoomHeader) : null;
+        
         const data = await response.json();
         
-        // 创建GeoJSON图层但暂不添加数据
-        geojsonLayer = L.geoJSON(null, {
-            style: styleCounty,
-            onEachFeature: onEachCounty
-        }).addTo(map);
+        // 创建GeoJSON图层但暂不添加数据（重新加载更精细的几何时复用已有图层）
+        if (!geojsonLayer) {
+            geojsonLayer = L.geoJSON(null, {
+                style: styleCounty,
+                onEachFeature: onEachCounty
+            }).addTo(map);
+        }
         
         // 存储GeoJSON数据以便后续使用
         window.geojsonData = data;
+        featureIndexes = new Map(data.features.map((feature, index) => [feature, index]));
     } catch (error) {
         console.error('加载GeoJSON数据失败:', error);
         alert('加载地图数据失败，请刷新页面重试');
     }
 }
 
+// 加载县级元数据表，用于缩放定位，无需遍历多边形
+async function loadCountyMeta() {
+    try {
+        const response = await fetch('/api/counties/meta');
+        const result = await response.json();
+        if (result.status === 'success') {
+            window.countyMeta = result.data;
+        }
+    } catch (error) {
+        console.error('加载县级元数据失败:', error);
+    }
+}
+
+// 放大到超出当前简化级别时，重新加载更精细的几何并重绘（不改变当前视图）
+async function refreshGeoJSONForZoom() {
+    if (geojsonMaxZoom === null || map.getZoom() <= geojsonMaxZoom) return;
+    
+    await loadGeoJSON();
+    
+    if (!window.geojsonData || !window.agentsData) return;
+    geojsonLayer.clearLayers();
+    geojsonLayer.addData(window.geojsonData);
+    selectedCounty = null;
+}
+
 // 加载县总代数据
 async function loadAgentsData() {
     try {
@@ -272,17 +314,32 @@ async function loadAgentsData() {
             headers['X-CSRF-Token'] = csrfToken;
         }
         
-        // 添加时间戳参数防止缓存
-        const timestamp = new Date().getTime();
-        const response = await fetch(`/api/agents?_t=${timestamp}`, { 
+        // 已有数据时只请求该版本之后的变化；全量请求由浏览器按ETag重新验证，数据未变时服务端返回304
+        const query = window.agentsData && agentsVersion ? `?since=${encodeURIComponent(agentsVersion)}` : '';
+        const response = await fetch(`/api/agents${query}`, { 
             headers,
-            cache: 'no-cache' // 禁用缓存
+            cache: 'no-cache' // 每次都向服务端验证
         });
         const result = await response.json();
         
-        if (result.status === 'success') {
+        if (result.status === 'success' && result.delta) {
+            agentsVersion = result.version;
+            result.changes.forEach(applyAgentChange);
+            
+            if (result.csrf_token) {
+                csrfToken = result.csrf_token;
+                localStorage.setItem('csrfToken', csrfToken);
+            }
+        } else if (result.status === 'success') {
             // 存储县总代数据
             window.agentsData = result.data;
+            agentsVersion = result.version;
+            
+            // 订阅变更流，之后其他管理员的修改会实时推送过来
+            subscribeAgentChanges(result.version);
+            
+            // 加载要素与县总代记录的连接结果，用于着色和已映射/未映射分类
+            await loadAgentJoin();
             
             // 更新GeoJSON图层，应用县总代数据
             updateGeoJSONWithAgents();
@@ -307,10 +364,103 @@ async function loadAgentsData() {
     }
 }
 
+// 订阅县总代数据变更流（只建立一次连接，断线后浏览器会带 Last-Event-ID 自动重连并补发）
+function subscribeAgentChanges(eventId) {
+    if (agentStream || !window.EventSource) return;
+    
+    const query = eventId ? `?last_event_id=${encodeURIComponent(eventId)}` : '';
+    agentStream = new EventSource(`/api/agents/stream${query}`);
+    
+    agentStream.addEventListener('change', (event) => {
+        agentsVersion = event.lastEventId;
+        applyAgentChange(JSON.parse(event.data));
+    });
+    
+    // 服务端无法补齐错过的修改（如服务重启），重新加载全量数据
+    agentStream.addEventListener('reset', () => {
+        loadAgentsData();
+    });
+}
+
+// 应用一条变更：该县的全部记录整体替换为事件中的记录
+function applyAgentChange(change) {
+    if (!window.agentsData) return;
+    
+    const county = change.county;
+    for (const province in window.agentsData) {
+        for (const city in window.agentsData[province]) {
+            delete window.agentsData[province][city][county];
+            if (Object.keys(window.agentsData[province][city]).length === 0) {
+                delete window.agentsData[province][city];
+            }
+        }
+        if (Object.keys(window.agentsData[province]).length === 0) {
+            delete window.agentsData[province];
+        }
+    }
+    for (const agent of change.agents) {
+        const province = window.agentsData[agent.province] || (window.agentsData[agent.province] = {});
+        const city = province[agent.city] || (province[agent.city] = {});
+        city[county] = {
+            name: agent.name,
+            phone: agent.phone,
+            has_agent: agent.has_agent
+        };
+    }
+    
+    // 连接结果由服务端重新计算，稍后统一刷新（连续多条变更只请求一次）
+    scheduleAgentJoinRefresh();
+}
+
+// 加载要素与县总代记录的连接结果（同名县已由服务端按省份区分）
+async function loadAgentJoin() {
+    try {
+        const response = await fetch('/api/agents/join', { cache: 'no-cache' });
+        const result = await response.json();
+        if (result.status === 'success') {
+            agentJoin = result;
+        }
+    } catch (error) {
+        console.error('加载县总代连接结果失败:', error);
+    }
+}
+
+function scheduleAgentJoinRefresh() {
+    clearTimeout(agentJoinTimer);
+    agentJoinTimer = setTimeout(async () => {
+        await loadAgentJoin();
+        
+        // 重绘各县（保留当前选中县的高亮），不重新加载图层、不改变地图视图
+        if (geojsonLayer) {
+            geojsonLayer.eachLayer((layer) => {
+                if (layer !== selectedCounty) {
+                    geojsonLayer.resetStyle(layer);
+                }
+            });
+        }
+        categorizeCountyData();
+        updateDrawerTables();
+    }, 200);
+}
+
+// 要素对应的县总代记录（来自连接结果）；连接结果不可用时返回 undefined
+function getFeatureAgent(feature) {
+    if (!agentJoin || !feature || !featureIndexes.has(feature)) return undefined;
+    const agentIndex = agentJoin.features[featureIndexes.get(feature)];
+    return agentIndex === null ? null : agentJoin.agents[agentIndex];
+}
+
 // 分类县总代数据为已映射和未映射
 function categorizeCountyData() {
     if (!window.agentsData || !window.geojsonData) return;
     
+    // 优先使用服务端的连接结果
+    if (agentJoin) {
+        mappedCounties = agentJoin.mapped.map(index => agentJoin.agents[index]);
+        unmappedCounties = agentJoin.unmapped.map(index => agentJoin.agents[index]);
+        return;
+    }
+    
     // 重置数组
     mappedCounties = [];
     unmappedCounties = [];
@@ -353,8 +503,13 @@ function updateGeoJSONWithAgents() {
     // 添加带有县总代信息的GeoJSON数据
     geojsonLayer.addData(window.geojsonData);
     
-    // 调整地图视图以适应GeoJSON图层
-    map.fitBounds(geojsonLayer.getBounds());
+    // 调整地图视图以适应全部县（优先使用服务端预计算的外包矩形）
+    if (window.countyMeta && window.countyMeta.bbox) {
+        const [minx, miny, maxx, maxy] = window.countyMeta.bbox;
+        map.fitBounds([[miny, minx], [maxy, maxx]]);
+    } else {
+        map.fitBounds(geojsonLayer.getBounds());
+    }
 }
 
 // 县区域样式函数
@@ -363,7 +518,7 @@ function styleCounty(feature) {
     const countyName = feature.properties.name;
     
     // 检查是否有县总代
-    const hasAgent = checkCountyHasAgent(countyName);
+    const hasAgent = checkCountyHasAgent(countyName, feature);
     
     return {
         fillColor: hasAgent ? '#27ae60' : '#bdc3c7',
@@ -375,8 +530,11 @@ function styleCounty(feature) {
     };
 }
 
-// 检查县是否有县总代
-function checkCountyHasAgent(countyName) {
+// 检查县是否有县总代（传入要素时按连接结果查找，否则按县名遍历）
+function checkCountyHasAgent(countyName, feature) {
+    const joined = getFeatureAgent(feature);
+    if (joined !== undefined) return Boolean(joined && joined.has_agent);
+    
     if (!window.agentsData) return false;
     
     // 遍历所有省市县数据查找匹配
@@ -395,8 +553,11 @@ function checkCountyHasAgent(countyName) {
     return false;
 }
 
-// 获取县总代信息
-function getCountyAgentInfo(countyName) {
+// 获取县总代信息（传入要素时按连接结果查找，否则按县名遍历）
+function getCountyAgentInfo(countyName, feature) {
+    const joined = getFeatureAgent(feature);
+    if (joined !== undefined) return joined;
+    
     if (!window.agentsData) return null;
     
     // 遍历所有省市县数据查找匹配
@@ -418,10 +579,10 @@ function getCountyAgentInfo(countyName) {
 // 为每个县添加交互
 function onEachCounty(feature, layer) {
     const countyName = feature.properties.name;
-    const agentInfo = getCountyAgentInfo(countyName);
     
     // 添加弹出框
     layer.bindPopup(() => {
+        const agentInfo = getCountyAgentInfo(countyName, feature);
         const popupContent = document.createElement('div');
         popupContent.className = 'county-popup';
         
@@ -461,13 +622,13 @@ function onEachCounty(feature, layer) {
             selectedCounty = layer;
             
             // 直接显示县详情，省略点击查看详情按钮的步骤
-            showCountyDetails(countyName);
+            showCountyDetails(countyName, feature);
         }
     });
 }
 
 // 显示县详细信息
-function showCountyDetails(countyName) {
+function showCountyDetails(countyName, feature) {
     // 显示信息面板
     infoPanel.classList.remove('hidden');
     
@@ -476,7 +637,7 @@ function showCountyDetails(countyName) {
     console.log('显示县详情:', countyName);
     
     // 获取县总代信息
-    const agentInfo = getCountyAgentInfo(countyName);
+    const agentInfo = getCountyAgentInfo(countyName, feature);
     console.log('获取到的代理信息:', agentInfo);
     
     if (agentInfo && agentInfo.has_agent) {
@@ -765,6 +926,9 @@ function initDrawerResizer() {
 
 // 绑定事件
 function bindEvents() {
+    // 缩放后按需加载更精细的县级边界
+    map.on('zoomend', refreshGeoJSONForZoom);
+    
     // 登录按钮点击事件
     loginBtn.addEventListener('click', async () => {
         const username = document.getElementById('username').value;
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import csv
+import importlib
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 与 app.py 一样以仓库根目录为导入起点（from utils.xxx import ...）
+sys.path.insert(0, ROOT)
+
+# 测试用县级要素：北京、吉林各有一个朝阳区（同名县），(名称, 行政区划代码, 左下角经度, 纬度)
+COUNTIES = [
+    ('东城区', '156110101', 116.0, 39.0),
+    ('朝阳区', '156110105', 116.1, 39.0),
+    ('南关区', '156220102', 125.0, 43.0),
+    ('朝阳区', '156220104', 125.1, 43.0),
+]
+
+# 县总代数据中只有北京的朝阳区
+AGENT_ROWS = [
+    ['张三', '13800000000', '北京市', '北京市', '朝阳区', '', ''],
+    ['', '', '北京市', '北京市', '东城区', '', ''],
+    ['李四', '13900000000', '吉林省', '长春市', '南关区', '', ''],
+]
+
+
+def square(lng, lat, size=0.1):
+    return [[lng, lat], [lng + size, lat], [lng + size, lat + size], [lng, lat + size], [lng, lat]]
+
+
+def county_features():
+    return [{'type': 'Feature', 'properties': {'name': name, 'gb': gb},
+             'geometry': {'type': 'Polygon', 'coordinates': [square(lng, lat)]}}
+            for name, gb, lng, lat in COUNTIES]
+
+
+def issue_token(app_module, **claims):
+    """签发测试用的 JWT（默认是管理员），值为 None 的声明不写入"""
+    now = datetime.now(timezone.utc)
+    payload = {'username': 'admin', 'is_admin': True, 'iat': now, 'nbf': now,
+               'exp': now + timedelta(hours=1), 'jti': str(uuid.uuid4())}
+    payload.update(claims)
+    payload = {key: value for key, value in payload.items() if value is not None}
+    return jwt.encode(payload, app_module.app.config['SECRET_KEY'], algorithm='HS256')
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """在临时目录中准备数据文件后导入 app（数据路径按 sys.argv[0] 所在目录解析）"""
+    base = tmp_path_factory.mktemp('aiheli')
+    data_dir = base / 'data'
+    data_dir.mkdir()
+    with open(data_dir / '中国_县.geojson', 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': county_features()}, f, ensure_ascii=False)
+    with open(data_dir / '爱河狸数据_地址拆分.csv', 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['县总代', '联系电话', '省份', '城市', '县名', 'GDP', '人口'])
+        writer.writerows(AGENT_ROWS)
+
+    cwd, argv = os.getcwd(), sys.argv
+    os.chdir(base)
+    sys.argv = [str(base / 'app.py')]
+    os.environ.setdefault('SECRET_KEY', 'test-secret-key-for-the-pytest-suite')
+    try:
+        module = importlib.import_module('app')
+        module.app.config['CSRF_ENABLED'] = False
+        module.app.testing = True
+        yield module
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
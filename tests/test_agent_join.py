@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from conftest import AGENT_ROWS, county_features
+
+from utils.agent_join import AgentJoin
+from utils.agent_store import AgentSnapshot, CsvLayout, add_op, delete_op
+
+LAYOUT = CsvLayout(['县总代', '联系电话', '省份', '城市', '县名', 'GDP', '人口'])
+
+
+def snapshot_of(rows):
+    return AgentSnapshot.build(LAYOUT, [LAYOUT.parse(row) for row in rows])
+
+
+def agent_names(join, snapshot):
+    return [record.name if record else None
+            for record in (join.agent(snapshot, index) for index in range(len(join.feature_agents)))]
+
+
+def test_same_name_county_joins_only_within_its_province():
+    snapshot = snapshot_of(AGENT_ROWS)
+    join = AgentJoin.build(county_features(), snapshot)
+    # 吉林的朝阳区不会连接到北京朝阳区的县总代
+    assert agent_names(join, snapshot) == ['', '张三', '李四', None]
+    mapped, unmapped = join.partition(snapshot.keyed_records())
+    assert len(mapped) == 3 and unmapped == []
+
+
+def test_incremental_update_matches_full_build():
+    features = county_features()
+    snapshot = snapshot_of(AGENT_ROWS)
+    join = AgentJoin.build(features, snapshot)
+    ops = [add_op('吉林省', '长春市', '朝阳区', '王五', '137'), delete_op('南关区')]
+    following, _ = snapshot.apply(ops)
+    updated = join.update(following, ['朝阳区', '南关区'])
+    rebuilt = AgentJoin.build(features, following)
+    assert updated.feature_agents == rebuilt.feature_agents
+    assert updated.matched == rebuilt.matched
+    assert agent_names(updated, following) == ['', '张三', None, '王五']
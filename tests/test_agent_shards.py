@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import csv
+import os
+
+from utils.agent_shards import MANIFEST_FILE, ShardedAgentStore, merge_shards_to_csv, read_manifest, split_csv_to_shards
+from utils.agent_store import WAL_SUFFIX, CsvAgentStore, add_op, delete_op, upsert_op
+
+HEADER = ['县总代', '联系电话', '省份', '城市', '县名', 'GDP', '人口']
+
+ROWS = [
+    ['张三', '13800000000', '北京市', '北京市', '朝阳区', '7000', '345'],
+    ['李四', '13900000000', '吉林省', '长春市', '南关区', '800', '60'],
+    ['', '', '北京市', '北京市', '东城区', '3000', '70'],
+    ['', '', '吉林省', '长春市', '朝阳区', '600', '40'],
+    ['王五', '137', '天津市', '天津市', '和平区', '900', '30'],
+]
+
+# 同一批次涉及多个省份；新增省份（新分片）与删光一个省份（删除分片）
+OPS = [
+    [upsert_op('朝阳区', '赵六', '136'), delete_op('和平区')],
+    [add_op('河北省', '石家庄市', '正定县', '孙七', '135'), upsert_op('宽城区', '周八', '134', '吉林省', '长春市')],
+    [delete_op('东城区'), delete_op('不存在县')],
+]
+
+
+def data_file(path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(ROWS)
+    return str(path)
+
+
+def by_province(store):
+    """省份 -> 该省的行（分片存储按省分组，各省之内的顺序应与单文件一致）"""
+    snapshot = store.snapshot()
+    groups = {}
+    for record in store.records():
+        groups.setdefault(record.province, []).append(snapshot.layout.format(record))
+    return groups
+
+
+def test_split_apply_merge_matches_csv_engine(tmp_path):
+    csv_path = data_file(tmp_path / 'agents.csv')
+    csv_store = CsvAgentStore(lambda: csv_path)
+    # 拆分前先留下一条未合并的修改日志，拆分时应包含在内
+    csv_store.apply_batch([upsert_op('东城区', '吴九', '133')])
+    assert os.path.exists(csv_path + WAL_SUFFIX)
+
+    directory = str(tmp_path / 'shards')
+    assert split_csv_to_shards(csv_path, directory) == (len(ROWS), 3)
+    sharded = ShardedAgentStore(lambda: directory)
+    assert by_province(sharded) == by_province(csv_store)
+
+    for ops in OPS:
+        assert sharded.apply_batch(ops) == csv_store.apply_batch(ops)
+        assert by_province(sharded) == by_province(csv_store)
+        assert sharded.snapshot().tree == csv_store.snapshot().tree
+    assert sorted(province for province, _ in read_manifest(directory)[1]) == ['北京市', '吉林省', '河北省']
+    assert set(os.listdir(directory)) == {MANIFEST_FILE} | {name for _, name in read_manifest(directory)[1]}
+
+    # 其它进程（新实例）读到的分片与本实例一致；合并回单文件后由 CSV 引擎读取结果不变
+    assert by_province(ShardedAgentStore(lambda: directory)) == by_province(csv_store)
+    merged = str(tmp_path / 'merged.csv')
+    assert merge_shards_to_csv(directory, merged) == len(csv_store.records())
+    with open(merged, newline='', encoding='utf-8') as f:
+        assert next(csv.reader(f)) == HEADER
+    assert by_province(CsvAgentStore(lambda: merged)) == by_province(csv_store)
+    assert CsvAgentStore(lambda: merged).snapshot().tree == csv_store.snapshot().tree
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from utils.agent_store import AgentSnapshot, CsvLayout, add_op, apply_mutation, delete_op, upsert_op
+
+LAYOUT = CsvLayout(['县总代', '联系电话', '省份', '城市', '县名', 'GDP', '人口'])
+
+PROVINCES = ['北京市', '吉林省', '河北省', '']
+CITIES = ['', '长春市', '石家庄市']
+COUNTIES = ['朝阳区', '东城区', '南关区', '正定县', '宽城区']
+
+
+def random_op(rng):
+    county = rng.choice(COUNTIES)
+    kind = rng.random()
+    if kind < 0.4:
+        return add_op(rng.choice(PROVINCES), rng.choice(CITIES), county, rng.choice(['张三', '']), '138')
+    if kind < 0.75:
+        return upsert_op(county, rng.choice(['李四', '王五']), '139', rng.choice(PROVINCES), rng.choice(CITIES))
+    return delete_op(county)
+
+
+def state(snapshot):
+    return {
+        'records': [(r.name, r.phone, r.province, r.city, r.county) for r in snapshot.records],
+        'counties': {county: [(r.name, r.province, r.city) for r in snapshot.find_all(county)]
+                     for county in snapshot.counties()},
+        'keyed': [(key, record.name) for key, record in snapshot.keyed_records().items()],
+        'provinces': {province: [(r.name, r.county) for r in snapshot.province_records(province)]
+                      for province in PROVINCES},
+        'tree': snapshot.tree,
+        'tree_json': snapshot.tree_json(),
+    }
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_apply_matches_build(seed):
+    rng = random.Random(seed)
+    rows = [[rng.choice(['张三', '']), '137', rng.choice(PROVINCES), rng.choice(CITIES), rng.choice(COUNTIES + ['']),
+             '', ''] for _ in range(30)]
+    records = [LAYOUT.parse(row) for row in rows]
+    snapshot = AgentSnapshot.build(LAYOUT, records)
+    for _ in range(15):
+        ops = [random_op(rng) for _ in range(rng.randint(1, 4))]
+        expected = []
+        following, results = snapshot.apply(ops)
+        for op in ops:
+            expected.append(apply_mutation(records, op))
+        assert results == expected
+        assert state(following) == state(AgentSnapshot.build(LAYOUT, records))
+        # 未涉及的省份分组与上一版本共享（涉及的省份包括新增行所在的省份，即使同批中又被删除）
+        counties = {op[3] if op[0] == 'a' else op[1] for op in ops}
+        touched = {r.province for r in snapshot.records + following.records if r.county in counties}
+        touched.update(op[1] if op[0] == 'a' else op[4] for op in ops if op[0] != 'd')
+        for province, bucket in following.provinces.items():
+            if province not in touched and province in snapshot.provinces:
+                assert bucket is snapshot.provinces[province]
+        snapshot = following
+
+
+def test_empty_county_is_rejected():
+    with pytest.raises(ValueError):
+        add_op('北京市', '北京市', ' ', '张三', '138')
+    with pytest.raises(ValueError):
+        upsert_op('', '张三', '138')
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import csv
+
+from utils.agent_sqlite import SqliteAgentStore, export_sqlite_to_csv, migrate_csv_to_sqlite
+from utils.agent_store import CsvAgentStore, add_op, delete_op, upsert_op
+
+HEADER = ['县总代', '联系电话', '省份', '城市', '县名', 'GDP', '人口']
+
+# 非核心列带值，检查迁移与导出是否无损
+ROWS = [
+    ['张三', '13800000000', '北京市', '北京市', '朝阳区', '7000', '345'],
+    ['', '', '北京市', '北京市', '东城区', '3000', '70'],
+    ['李四', '13900000000', '吉林省', '长春市', '南关区', '800', '60'],
+    ['', '', '吉林省', '长春市', '朝阳区', '600', '40'],
+]
+
+# 覆盖 新增 / 更新（多行）/ 不存在时新增 / 删除 / 删除不存在的县
+OPS = [
+    [upsert_op('朝阳区', '王五', '137')],
+    [add_op('河北省', '石家庄市', '正定县', '赵六', '136'), upsert_op('宽城区', '孙七', '135', '吉林省', '长春市')],
+    [delete_op('东城区'), delete_op('不存在县')],
+    [upsert_op('正定县', '', '')],
+]
+
+
+def data_file(path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(ROWS)
+    return str(path)
+
+
+def state(store):
+    snapshot = store.snapshot()
+    return {
+        # 按表头格式化后的整行（新增的行没有非核心列，写出后读回为空字符串）
+        'records': [snapshot.layout.format(record) for record in store.records()],
+        'tree': snapshot.tree,
+        'found': {county: snapshot.layout.format(record) if (record := store.find_county(county)) else None
+                  for county in ('朝阳区', '东城区', '南关区', '正定县', '宽城区', '')},
+    }
+
+
+def test_sqlite_engine_matches_csv_engine(tmp_path):
+    csv_path = data_file(tmp_path / 'agents.csv')
+    db_path = str(tmp_path / 'agents.db')
+    migrate_csv_to_sqlite(csv_path, db_path)
+    csv_store = CsvAgentStore(lambda: csv_path)
+    sqlite_store = SqliteAgentStore(lambda: db_path)
+    try:
+        assert state(sqlite_store) == state(csv_store)
+        for ops in OPS:
+            assert sqlite_store.apply_batch(ops) == csv_store.apply_batch(ops)
+            assert state(sqlite_store) == state(csv_store)
+    finally:
+        sqlite_store.close()
+
+
+def test_migrate_and_export_round_trip(tmp_path):
+    csv_path = data_file(tmp_path / 'agents.csv')
+    source = CsvAgentStore(lambda: csv_path)
+    for ops in OPS:
+        source.apply_batch(ops)
+    expected = state(source)
+
+    # 迁移包含修改日志中尚未合并的修改；导出后由 CSV 引擎重新读取，数据与表头不变
+    db_path = str(tmp_path / 'agents.db')
+    exported = str(tmp_path / 'exported.csv')
+    assert migrate_csv_to_sqlite(csv_path, db_path) == len(expected['records'])
+    assert export_sqlite_to_csv(db_path, exported) == len(expected['records'])
+    with open(exported, newline='', encoding='utf-8') as f:
+        assert next(csv.reader(f)) == HEADER
+    assert state(CsvAgentStore(lambda: exported)) == expected
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import csv
+import threading
+import time
+
+from conftest import AGENT_ROWS
+
+from utils.agent_store import WAL_SUFFIX, CsvAgentStore, MutationLog, add_op, delete_op, upsert_op
+
+HEADER = ['县总代', '联系电话', '省份', '城市', '县名', 'GDP', '人口']
+
+
+def data_file(tmp_path):
+    path = tmp_path / 'agents.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(AGENT_ROWS)
+    return str(path)
+
+
+def rows(store):
+    return [(r.name, r.province, r.county) for r in store.records()]
+
+
+def test_replay_ignores_truncated_tail(tmp_path):
+    path = data_file(tmp_path)
+    store = CsvAgentStore(lambda: path)
+    store.apply_batch([upsert_op('东城区', '王五', '137')])
+    store.apply_batch([add_op('河北省', '石家庄市', '正定县', '赵六', '136')])
+    expected = rows(store)
+    # 模拟写到一半时崩溃：日志末尾留下不完整的一行
+    with open(path + WAL_SUFFIX, 'ab') as f:
+        f.write(b'["d","\xe6\x9c\x9d')
+
+    reloaded = CsvAgentStore(lambda: path)
+    assert rows(reloaded) == expected
+
+    # 之后的追加先截掉残缺的行，再次重放时新旧修改都在
+    reloaded.apply_batch([delete_op('南关区')])
+    assert rows(CsvAgentStore(lambda: path)) == [row for row in expected if row[2] != '南关区']
+
+
+def test_append_keeps_records_written_by_another_process(tmp_path):
+    path = tmp_path / 'agents.csv.wal'
+    first = MutationLog(str(path))
+    second = MutationLog(str(path))
+    assert first.read('base') == [] and second.read('base') == []
+    assert first.append('base', [delete_op('朝阳区')])
+    # second 读取时的有效长度已过期：在锁内重新计算，不截掉 first 的修改，并提示调用方重新加载
+    assert not second.append('base', [delete_op('南关区')])
+    assert MutationLog(str(path)).read('base') == [['d', '朝阳区'], ['d', '南关区']]
+
+
+def test_concurrent_stores_keep_each_others_changes(tmp_path):
+    path = data_file(tmp_path)
+    first = CsvAgentStore(lambda: path)
+    second = CsvAgentStore(lambda: path)
+    first.records()
+    second.records()
+    first.apply_batch([upsert_op('东城区', '王五', '137')])
+    second.apply_batch([add_op('河北省', '石家庄市', '正定县', '赵六', '136')])
+    expected = [('张三', '北京市', '朝阳区'), ('王五', '北京市', '东城区'), ('李四', '吉林省', '南关区'),
+                ('赵六', '河北省', '正定县')]
+    assert rows(second) == expected
+
+    # first 在锁内重新加载后再合并，合并后的 CSV 包含 second 的修改；second 随后的追加基于新的 CSV
+    assert first.compact()
+    second.apply_batch([delete_op('朝阳区')])
+    assert rows(CsvAgentStore(lambda: path)) == expected[1:]
+
+
+def test_readers_do_not_wait_for_a_write_in_progress(tmp_path):
+    path = data_file(tmp_path)
+    store = CsvAgentStore(lambda: path)
+    before = store.snapshot()
+    writing, finish = threading.Event(), threading.Event()
+
+    def writer():
+        # 模拟写入方持有锁、日志只写了一半（例如正在 fsync）
+        with store._lock:
+            with open(path + WAL_SUFFIX, 'ab') as f:
+                f.write(b'{"base":')
+            writing.set()
+            finish.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    writing.wait(5)
+    started = time.monotonic()
+    assert store.snapshot() is before
+    assert time.monotonic() - started < 1
+    finish.set()
+    thread.join()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from conftest import issue_token
+
+
+def logout(client, token):
+    return client.post('/api/logout', json={}, headers={'Authorization': f'Bearer {token}'})
+
+
+def test_revoked_token_is_rejected(app_module, client):
+    token = issue_token(app_module)
+    other = issue_token(app_module)
+    assert logout(client, token).status_code == 200
+
+    # 已缓存校验结果的令牌退出后同样被拒绝
+    response = logout(client, token)
+    assert response.status_code == 401
+    assert response.get_json()['message'] == '令牌已失效，请重新登录'
+    # 只撤销退出的那个令牌
+    assert logout(client, other).status_code == 200
+
+
+def test_token_without_jti_is_revoked_by_digest(app_module, client):
+    token = issue_token(app_module, jti=None)
+    assert logout(client, token).status_code == 200
+    assert logout(client, token).status_code == 401
+
+
+def test_login_returns_503_when_verifier_queue_is_full(app_module, client):
+    slots = app_module.login_verifier._slots
+    taken = 0
+    while slots.acquire(blocking=False):
+        taken += 1
+    try:
+        assert taken == app_module.login_verifier.max_pending
+        response = client.post('/api/login', json={'username': 'admin', 'password': 'x'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert response.get_json()['status'] == 'error'
+    finally:
+        for _ in range(taken):
+            slots.release()
+        app_module.login_attempts.clear()
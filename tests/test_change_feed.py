@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from utils.change_feed import ChangeFeed
+
+
+def test_external_change_invalidates_earlier_versions():
+    feed = ChangeFeed()
+    assert feed.current('v1', lambda: True) == 0
+    seq = feed.publish([{'county': '朝阳区', 'agents': []}], 'v2')
+    assert feed.current('v2', lambda: True) == seq
+    # 数据版本与最近一次发布的不同：追加重新加载标记，之前的版本号无法再增量补齐
+    assert feed.current('v3', lambda: True) == seq + 1
+    assert feed.since(seq) is None
+    assert feed.since(seq + 1) == []
+
+
+def test_unstable_read_neither_syncs_nor_returns_version():
+    feed = ChangeFeed()
+    feed.publish([], 'v1')
+    # 写线程提交中（快照已替换、事件尚未发布）读到的新版本不能当作外部修改
+    assert feed.current('v2', lambda: False) is None
+    feed.publish([{'county': '朝阳区', 'agents': []}], 'v2')
+    assert feed.since(0) == [(1, {'county': '朝阳区', 'agents': []})]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from conftest import issue_token
+
+
+def test_invalid_item_rejects_the_whole_batch(app_module, client):
+    before = client.get('/api/agents').get_json()['data']
+    signature = app_module.agent_store.signature
+    token = issue_token(app_module)
+
+    response = client.post('/api/county/batch', headers={'Authorization': f'Bearer {token}'}, json={'items': [
+        {'op': 'upsert', 'county': '东城区', 'agent_name': '王五', 'agent_phone': '13700000000'},
+        {'op': 'delete', 'county': '南关区'},
+        {'op': 'upsert', 'county': '朝阳区', 'agent_name': '赵六'},
+    ]})
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['status'] == 'error'
+    assert [error['index'] for error in body['errors']] == [2]
+
+    # 前两项校验通过，但同样没有写入
+    assert app_module.agent_store.signature == signature
+    assert client.get('/api/agents').get_json()['data'] == before
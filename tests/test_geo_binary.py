@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import json
+
+from conftest import county_features
+
+from utils.geo_binary import FeatureSequence, GeometryStore, encode_geometry_store
+from utils.geo_cache import encode_json
+from utils.geo_simplify import simplify_features
+from utils.geo_topology import Topology
+
+
+def store_of(features):
+    return GeometryStore(encode_geometry_store({'type': 'FeatureCollection', 'features': features}, (1, 2)))
+
+
+def test_full_precision_and_extra_dimensions_round_trip():
+    features = county_features()
+    features[0]['geometry']['coordinates'][0][0] = [116.123456789012345, 39.000000000000004]
+    features[0]['geometry']['coordinates'][0][-1] = [116.123456789012345, 39.000000000000004]
+    features[1]['geometry']['coordinates'] = [[[x, y, 42.5] for x, y in ring]
+                                              for ring in features[1]['geometry']['coordinates']]
+    store = store_of(features)
+    served = [json.loads(encode_json(feature)) for feature in FeatureSequence(store)]
+    assert [feature['geometry'] for feature in served] == [feature['geometry'] for feature in features]
+    # 坐标数组只保存经纬度，索引等使用的外包矩形不受第三维影响
+    ring = features[1]['geometry']['coordinates'][0]
+    assert store.feature_bboxes()[1].tolist() == [min(p[0] for p in ring), min(p[1] for p in ring),
+                                                  max(p[0] for p in ring), max(p[1] for p in ring)]
+
+
+def test_simplified_features_are_built_on_access():
+    features = FeatureSequence(store_of(county_features()))
+    topology = Topology.from_features(features)
+    simplified = simplify_features(features, topology, 0.01)
+    assert len(simplified) == len(features)
+    first = simplified[0]
+    assert first['properties'] == features[0]['properties']
+    assert json.loads(encode_json(first))['geometry']['type'] == 'Polygon'
+    assert simplified[-1]['properties']['gb'] == '156220104'
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from utils.geo_dissolve import canonical_province, feature_hierarchy
+
+
+def county(name, gb=None, **properties):
+    properties['name'] = name
+    if gb:
+        properties['gb'] = gb
+    return {'type': 'Feature', 'properties': properties, 'geometry': None}
+
+
+def lookup_from(rows):
+    """模拟按县名查县总代数据：rows 为 (省, 市, 县)，给出省份时只取同省的记录"""
+    def lookup(features, index, province):
+        name = features[index]['properties']['name']
+        for row_province, row_city, row_county in rows:
+            if row_county == name and (not province or canonical_province(row_province) == canonical_province(province)):
+                return row_province, row_city
+        return None
+    return lookup
+
+
+def test_code_wins_over_same_name_record_in_other_province():
+    features = [county('朝阳区', '156110105'), county('朝阳区', '156220104'),
+                county('南关区', '156220102'), county('东城区', '156110101')]
+    # 县总代数据中只有北京的朝阳区
+    lookup = lookup_from([('北京市', '北京市', '朝阳区')])
+    hierarchy = feature_hierarchy(features, lambda index, province: lookup(features, index, province))
+    assert hierarchy == [('北京市', '北京市'), ('吉林省', None), ('吉林省', None), ('北京市', '北京市')]
+
+
+def test_city_filled_from_same_province_record_only():
+    features = [county('朝阳区', '156220104'), county('宽城区', '156220103')]
+    lookup = lookup_from([('北京市', '北京市', '朝阳区'), ('吉林省', '长春市', '朝阳区')])
+    hierarchy = feature_hierarchy(features, lambda index, province: lookup(features, index, province))
+    assert hierarchy == [('吉林省', '长春市'), ('吉林省', None)]
+
+
+def test_record_used_only_without_code_and_no_voting():
+    features = [county('朝阳区'), county('县甲', '156220199'), county('县乙')]
+    lookup = lookup_from([('吉林', '长春市', '朝阳区')])
+    hierarchy = feature_hierarchy(features, lambda index, province: lookup(features, index, province))
+    # 无代码的朝阳区取记录的省份（统一为全称）；无代码也无记录的县乙不会被邻近代码“投票”归组
+    assert hierarchy == [('吉林省', '长春市'), ('吉林省', None), None]
+
+
+def test_province_property_is_canonicalized():
+    features = [county('东城区', province='北京'), county('南关区', province='吉林省', city='长春市')]
+    hierarchy = feature_hierarchy(features, lambda index, province: None)
+    assert hierarchy == [('北京市', None), ('吉林省', '长春市')]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+
+
+def test_viewport_payload_is_cached_and_compressed_on_demand(app_module, client):
+    url = '/api/geojson?bbox=116.0,39.0,116.3,39.2'
+    first = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert first.status_code == 200
+    assert [f['properties']['name'] for f in json.loads(first.data)['features']] == ['东城区', '朝阳区']
+
+    dataset = app_module.geo_cache.dataset()
+    payload = dataset.viewport(dataset.spatial_index().candidates((116.0, 39.0, 116.3, 39.2)).tolist(), None)
+    assert payload.etag == first.headers['ETag'].strip('"')
+    # 客户端不接受 gzip 时不压缩
+    assert payload._gzip_body is None
+
+    second = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert second.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(second.data) == first.data
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+
+def locate(client, lng, lat):
+    response = client.get(f'/api/locate?lng={lng}&lat={lat}')
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+
+def test_locate_same_name_county_uses_its_own_province(client):
+    beijing = locate(client, 116.15, 39.05)
+    assert beijing['county'] == '朝阳区'
+    assert beijing['agent']['province'] == '北京市' and beijing['agent']['name'] == '张三'
+
+    # 吉林的朝阳区没有县总代记录，不能返回北京朝阳区的县总代
+    jilin = locate(client, 125.15, 43.05)
+    assert jilin['county'] == '朝阳区' and jilin['feature_index'] == 3
+    assert jilin['agent'] is None
+
+
+def test_dissolve_and_province_slices_use_feature_codes(client):
+    provinces = client.get('/api/geojson?level=province').get_json()['features']
+    assert {f['properties']['name']: f['properties']['county_count'] for f in provinces} == {'北京市': 2, '吉林省': 2}
+
+    jilin = client.get('/api/geojson/吉林')
+    assert jilin.status_code == 200
+    assert sorted(f['properties']['gb'] for f in jilin.get_json()['features']) == ['156220102', '156220104']
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import os
+from datetime import datetime, timezone
+
+from utils.geo_cache import EncodedPayload
+from utils.vector_tiles import MVT_BUFFER, MVT_EXTENT, MVT_LAYER, TileCache, tile_range
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def read_message(data):
+    """protobuf 消息 -> [(字段号, 值)]；varint 为整数，length-delimited 为字节，fixed64 为 8 字节"""
+    fields = []
+    offset = 0
+    while offset < len(data):
+        key, offset = read_varint(data, offset)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, offset = read_varint(data, offset)
+        elif wire_type == 2:
+            length, offset = read_varint(data, offset)
+            value, offset = data[offset:offset + length], offset + length
+        elif wire_type == 1:
+            value, offset = data[offset:offset + 8], offset + 8
+        else:
+            raise ValueError(wire_type)
+        fields.append((number, value))
+    return fields
+
+
+def read_packed(data):
+    values, offset = [], 0
+    while offset < len(data):
+        value, offset = read_varint(data, offset)
+        values.append(value)
+    return values
+
+
+def unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def decode_rings(commands):
+    """几何指令 -> 切片坐标下的环列表"""
+    rings, x, y, i = [], 0, 0, 0
+    while i < len(commands):
+        command, count = commands[i] & 7, commands[i] >> 3
+        i += 1
+        if command == 7:
+            continue
+        for _ in range(count):
+            x += unzigzag(commands[i])
+            y += unzigzag(commands[i + 1])
+            i += 2
+            if command == 1:
+                rings.append([])
+            rings[-1].append((x, y))
+    return rings
+
+
+def decode_value(data):
+    number, value = read_message(data)[0]
+    return bool(value) if number == 7 else value.decode('utf-8')
+
+
+def test_mvt_tile_decodes(client):
+    z = 8
+    x, y, _, _ = tile_range((116.0, 39.0, 116.2, 39.1), z)
+    response = client.get(f'/api/tiles/{z}/{x}/{y}.mvt')
+    assert response.status_code == 200
+
+    layers = [value for number, value in read_message(response.data) if number == 3]
+    assert len(layers) == 1
+    layer = read_message(layers[0])
+    assert dict(layer)[15] == 2
+    assert dict(layer)[1].decode('utf-8') == MVT_LAYER
+    assert dict(layer)[5] == MVT_EXTENT
+    keys = [value.decode('utf-8') for number, value in layer if number == 3]
+    values = [decode_value(value) for number, value in layer if number == 4]
+
+    decoded = {}
+    for body in (value for number, value in layer if number == 2):
+        feature = read_message(body)
+        tags = read_packed(dict(feature)[2])
+        properties = {keys[tags[k]]: values[tags[k + 1]] for k in range(0, len(tags), 2)}
+        assert dict(feature)[3] == 3
+        rings = decode_rings(read_packed(dict(feature)[4]))
+        assert rings and all(len(ring) >= 3 for ring in rings)
+        assert all(-MVT_BUFFER <= px <= MVT_EXTENT + MVT_BUFFER and -MVT_BUFFER <= py <= MVT_EXTENT + MVT_BUFFER
+                   for ring in rings for px, py in ring)
+        decoded[dict(feature)[1]] = properties
+
+    # 北京的东城区（无县总代）与朝阳区（张三）
+    assert decoded == {0: {'name': '东城区', 'has_agent': False}, 1: {'name': '朝阳区', 'has_agent': True}}
+
+
+def test_disk_read_racing_an_invalidation_is_discarded(tmp_path, monkeypatch):
+    cache = TileCache()
+    cache.bind(str(tmp_path / 'tiles' / 'v1'))
+    cache.mark_source('s1')
+    key = (8,) + tile_range((116.0, 39.0, 116.2, 39.1), 8)[:2] + ('mvt',)
+    cache.put(key, EncodedPayload(b'old', datetime.now(timezone.utc)), 's1')
+
+    # 冷读取（内存中没有）从磁盘读出
+    cache._entries.clear()
+    assert cache.get(key).body == b'old'
+
+    # 读完文件后、放回内存前该切片被失效：丢弃读到的内容，也不放回内存
+    cache._entries.clear()
+    getmtime = os.path.getmtime
+
+    def getmtime_then_invalidate(path):
+        modified = getmtime(path)
+        cache.invalidate_bboxes([(116.0, 39.0, 116.2, 39.1)])
+        return modified
+
+    monkeypatch.setattr(os.path, 'getmtime', getmtime_then_invalidate)
+    assert cache.get(key) is None
+    monkeypatch.undo()
+    assert cache.get(key) is None and not cache._entries
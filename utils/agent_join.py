@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+县级要素与县总代记录的连接索引
+
+按规范化后的复合键 (省, 县名) 把 中国_县.geojson 的要素与县总代记录对应起来：县名做 NFKC 规范化并去掉空白；
+要素的省份取自属性，没有时取行政区划代码前两位（GB/T 2260），省、市名去掉“省/市/自治区”等后缀后比较。
+同名县（如北京市与吉林省的朝阳区）只与同省的记录连接；同省内仍有多条时再按城市区分，无法区分时取第一条；
+要素无法确定省份时退回到只按县名匹配（与前端原先的行为一致）。
+
+提交修改后只重新计算涉及的县名对应的要素与记录（AgentJoin.update），其余部分与上一版本共享。
+"""
+import base64
+import threading
+
+import numpy as np
+
+from utils.geo_dissolve import CITY_KEYS, feature_province, first_property, normalize_name, normalize_region
+
+# /api/agents/status 支持的编码
+STATUS_ENCODINGS = ('bitset', 'rle')
+
+
+def feature_key(properties):
+    """要素的规范化键 (省, 市, 县名)，无法确定的部分为空字符串"""
+    return (normalize_region(feature_province(properties)), normalize_region(first_property(properties, CITY_KEYS)),
+            normalize_name(properties.get('name')))
+
+
+class AgentJoin:
+    """某一数据版本下要素与县总代记录的连接结果，发布后不再修改。记录以 (省, 市, 县) 键表示"""
+    __slots__ = ('signature', 'feature_keys', 'features_by_county', 'names', 'feature_agents', 'matched')
+
+    def __init__(self, signature, feature_keys, features_by_county, names, feature_agents, matched):
+        self.signature = signature
+        self.feature_keys = feature_keys
+        self.features_by_county = features_by_county
+        # 规范化县名 -> 县总代数据中对应的原始县名
+        self.names = names
+        # 要素下标 -> 连接到的记录键或 None
+        self.feature_agents = feature_agents
+        # 记录键 -> 连接到该记录的要素数
+        self.matched = matched
+
+    @classmethod
+    def build(cls, features, snapshot):
+        feature_keys = [feature_key(feature.get('properties') or {}) for feature in features]
+        features_by_county = {}
+        for index, key in enumerate(feature_keys):
+            if key[2]:
+                features_by_county.setdefault(key[2], []).append(index)
+        names = {}
+        for county in snapshot.counties():
+            names.setdefault(normalize_name(county), []).append(county)
+        join = cls(snapshot.signature, feature_keys, features_by_county,
+                   {name: tuple(counties) for name, counties in names.items()}, [None] * len(features), {})
+        join._rejoin(snapshot, features_by_county)
+        return join
+
+    def update(self, snapshot, counties):
+        """返回应用了涉及 counties（原始县名）的修改后的新连接结果"""
+        names = dict(self.names)
+        touched = set()
+        for county in counties:
+            name = normalize_name(county)
+            touched.add(name)
+            present = [c for c in dict.fromkeys(names.get(name, ()) + (county,)) if snapshot.has_county(c)]
+            if present:
+                names[name] = tuple(present)
+            else:
+                names.pop(name, None)
+        join = AgentJoin(snapshot.signature, self.feature_keys, self.features_by_county, names,
+                         list(self.feature_agents), dict(self.matched))
+        join._rejoin(snapshot, touched)
+        return join
+
+    def _rejoin(self, snapshot, names):
+        for name in names:
+            for index in self.features_by_county.get(name, ()):
+                previous = self.feature_agents[index]
+                if previous is not None:
+                    if self.matched[previous] == 1:
+                        del self.matched[previous]
+                    else:
+                        self.matched[previous] -= 1
+                key = self._match(snapshot, self.feature_keys[index])
+                self.feature_agents[index] = key
+                if key is not None:
+                    self.matched[key] = self.matched.get(key, 0) + 1
+
+    def _match(self, snapshot, feature_key):
+        province, city, name = feature_key
+        candidates = list(dict.fromkeys(record.key for county in self.names.get(name, ())
+                                        for record in snapshot.find_all(county) if record.province))
+        if province:
+            candidates = [key for key in candidates if normalize_region(key[0]) == province]
+        if len(candidates) > 1 and city:
+            narrowed = [key for key in candidates if normalize_region(key[1]) == city]
+            candidates = narrowed or candidates
+        return candidates[0] if candidates else None
+
+    def agent(self, snapshot, index):
+        """要素连接到的记录（同一 (省, 市, 县) 有多行时以最后一行为准，与 /api/agents 一致）"""
+        key = self.feature_agents[index]
+        return snapshot.get_key(key) if key is not None else None
+
+    def has_agent_flags(self, snapshot):
+        """按要素顺序的布尔数组：该要素连接到的记录是否已有县总代"""
+        flags = np.zeros(len(self.feature_agents), dtype=bool)
+        for index, key in enumerate(self.feature_agents):
+            if key is not None:
+                record = snapshot.get_key(key)
+                flags[index] = record is not None and record.has_agent
+        return flags
+
+    def partition(self, keys):
+        """(已连接到要素的记录键列表, 未连接的记录键列表)；keys 为按数据顺序的全部记录键（见 keyed_records）"""
+        mapped = []
+        unmapped = []
+        for key in keys:
+            (mapped if key in self.matched else unmapped).append(key)
+        return mapped, unmapped
+
+
+def encode_status(flags, encoding):
+    """编码按要素顺序的布尔数组
+    bitset: 第 i 个要素为第 i // 8 个字节的第 i % 8 位（低位在前），整体 base64 编码
+    rle: 从 False 开始交替的游程长度列表（首项可能为 0）
+    """
+    if encoding == 'bitset':
+        return base64.b64encode(np.packbits(flags, bitorder='little').tobytes()).decode('ascii')
+    if encoding == 'rle':
+        if not len(flags):
+            return []
+        changes = np.flatnonzero(np.diff(flags.astype(np.int8))) + 1
+        bounds = np.concatenate(([0], changes, [len(flags)]))
+        runs = np.diff(bounds).tolist()
+        return [0] + runs if flags[0] else runs
+    raise ValueError(f'不支持的编码: {encoding}')
+
+
+class AgentJoinIndex:
+    """保存当前 GeoJSON 版本的连接结果：数据版本变化时整体重建，本进程的提交则在写线程中增量更新"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (GeoJSON 版本标识, AgentJoin)
+        self._current = None
+
+    def get(self, dataset, snapshot):
+        current = self._current
+        if current is not None and current[0] == dataset.tag and current[1].signature == snapshot.signature:
+            return current[1]
+        with self._lock:
+            current = self._current
+            if current is None or current[0] != dataset.tag or current[1].signature != snapshot.signature:
+                current = (dataset.tag, AgentJoin.build(dataset.features, snapshot))
+                self._current = current
+        return current[1]
+
+    def update(self, before, snapshot, counties):
+        """一次提交后调用：连接结果对应提交前的数据（before）时增量更新，否则丢弃，下次访问时重建"""
+        with self._lock:
+            current = self._current
+            if current is None:
+                return
+            if current[1].signature == before:
+                self._current = (current[0], current[1].update(snapshot, counties))
+            else:
+                self._current = None
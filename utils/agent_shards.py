@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+县总代数据的按省分片 CSV 存储
+
+目录结构（默认 data/agents_by_province/）：
+    manifest.json   {"format": 1, "header": [表头], "shards": [{"province": 省份, "file": 文件名}, ...]}
+    <省份>.csv      该省的全部记录（带表头，可以单独用 Excel 打开编辑）
+修改只重写涉及的省份分片（临时文件 + fsync + 原子替换），分片增减时才重写 manifest；
+启动时并行读取各分片，之后按分片的 mtime/size 只重新读取被外部修改过的分片。
+一次提交涉及多个省份时逐个替换分片，各分片的替换是原子的，但多个分片之间不是。
+
+转换工具：
+    python -m utils.agent_shards split [CSV路径] [分片目录]   单文件 -> 分片（含未合并的修改日志）
+    python -m utils.agent_shards merge [分片目录] [CSV路径]   分片 -> 单文件
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+if __name__ == '__main__' and __package__ is None:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.agent_store import (AGENT_CSV_HEADER, WAL_SUFFIX, AgentSnapshot, AgentStorage, CsvAgentStore,
+                               CsvLayout, _optional_signature)
+
+SHARD_FORMAT = 1
+MANIFEST_FILE = 'manifest.json'
+DEFAULT_CSV = os.path.join('data', '爱河狸数据_地址拆分.csv')
+DEFAULT_SHARD_DIR = os.path.join('data', 'agents_by_province')
+
+# 并行读取分片的最大线程数
+LOAD_WORKERS = 8
+
+# 省份为空的记录所在分片
+_NO_PROVINCE_FILE = '_未分省.csv'
+
+
+def _shard_file_name(province, used):
+    """省份 -> 分片文件名（去掉文件名中不允许的字符，重名时追加序号）"""
+    base = re.sub(r'[\\/:*?"<>|\s]', '_', province) if province else _NO_PROVINCE_FILE[:-4]
+    name = f'{base}.csv'
+    index = 1
+    while name in used:
+        index += 1
+        name = f'{base}_{index}.csv'
+    return name
+
+
+def _write_atomic(path, content):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _csv_content(layout, records):
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer)
+    writer.writerow(layout.header)
+    writer.writerows(layout.format(record) for record in records)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _write_manifest(directory, header, entries):
+    manifest = {
+        'format': SHARD_FORMAT,
+        'header': list(header),
+        'shards': [{'province': province, 'file': name} for province, name in entries]
+    }
+    _write_atomic(os.path.join(directory, MANIFEST_FILE),
+                  json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def read_manifest(directory):
+    """返回 (表头, [(省份, 文件名), ...])；目录中没有 manifest 时返回 None"""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get('format') != SHARD_FORMAT:
+        raise ValueError(f"不支持的分片格式版本: {manifest.get('format')}")
+    return manifest.get('header') or AGENT_CSV_HEADER, [(entry['province'], entry['file'])
+                                                        for entry in manifest.get('shards', [])]
+
+
+def _group_by_province(records):
+    groups = {}
+    for record in records:
+        groups.setdefault(record.province, []).append(record)
+    return groups
+
+
+def write_shards(directory, layout, records):
+    """把全部记录按省写成分片目录（覆盖目录中原有的分片），返回分片数"""
+    os.makedirs(directory, exist_ok=True)
+    previous = read_manifest(directory)
+    entries = []
+    used = set()
+    for province, group in _group_by_province(records).items():
+        name = _shard_file_name(province, used)
+        used.add(name)
+        entries.append((province, name))
+        _write_atomic(os.path.join(directory, name), _csv_content(layout, group))
+    _write_manifest(directory, layout.header, entries)
+    if previous is not None:
+        for _, name in previous[1]:
+            if name not in used and os.path.exists(os.path.join(directory, name)):
+                os.remove(os.path.join(directory, name))
+    return len(entries)
+
+
+class ShardedAgentStore(AgentStorage):
+    """按省分片的 CSV 存储引擎。记录顺序为 manifest 中的分片顺序、分片内的行顺序"""
+
+    def __init__(self, directory_getter):
+        self._directory_getter = directory_getter
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._files = None
+        self._entries = []
+        # 分片文件名 -> (文件签名, 记录元组)，未变化的分片在重新加载时直接复用
+        self._shards = {}
+        self._snapshot = AgentSnapshot.build(CsvLayout(AGENT_CSV_HEADER), [])
+
+    @property
+    def directory(self):
+        return self._directory_getter()
+
+    @property
+    def layout(self):
+        return self._snapshot.layout
+
+    @property
+    def signature(self):
+        """manifest 与各分片文件的签名，数据内容变化时改变"""
+        return self.snapshot().signature
+
+    def snapshot(self):
+        self.ensure_fresh()
+        return self._snapshot
+
+    def _file_state(self, directory, entries):
+        return (_optional_signature(os.path.join(directory, MANIFEST_FILE)),
+                tuple(_optional_signature(os.path.join(directory, name)) for _, name in entries))
+
+    def ensure_fresh(self):
+        directory = self.directory
+        if self._loaded and self._file_state(directory, self._entries) == self._files:
+            return
+        # 与 CsvAgentStore.ensure_fresh 相同：写入分片期间读请求直接使用已发布的快照
+        if not self._lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            if self._loaded and self._file_state(directory, self._entries) == self._files:
+                return
+            self._load(directory)
+        finally:
+            self._lock.release()
+
+    def _read_shard(self, path, layout):
+        state = _optional_signature(path)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            print(f"警告: 代理数据分片 {path} 未找到，按空分片处理")
+            return state, ()
+        reader = csv.reader(io.StringIO(content.decode('utf-8'), newline=''))
+        next(reader, None)
+        return state, tuple(layout.parse(row) for row in reader if row)
+
+    def _load(self, directory):
+        try:
+            manifest = read_manifest(directory)
+            if manifest is None:
+                print(f"警告: 代理数据分片目录 {directory} 中没有 {MANIFEST_FILE}。将创建一个空的分片目录。")
+                os.makedirs(directory, exist_ok=True)
+                _write_manifest(directory, AGENT_CSV_HEADER, [])
+                manifest = read_manifest(directory)
+            header, entries = manifest
+            layout = CsvLayout(header)
+            if layout.header != self.layout.header:
+                self._shards = {}
+
+            # 只读取新增或被外部修改过的分片，多个分片并行读取
+            pending = [name for _, name in entries if name not in self._shards or
+                       self._shards[name][0] != _optional_signature(os.path.join(directory, name))]
+            if pending:
+                with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(pending))) as pool:
+                    loaded = pool.map(lambda name: self._read_shard(os.path.join(directory, name), layout), pending)
+                    shards = {name: self._shards[name] for _, name in entries if name in self._shards}
+                    shards.update(zip(pending, loaded))
+            else:
+                shards = {name: self._shards[name] for _, name in entries}
+
+            records = [record for _, name in entries for record in shards[name][1]]
+            files = (_optional_signature(os.path.join(directory, MANIFEST_FILE)),
+                     tuple(shards[name][0] for _, name in entries))
+            self._snapshot = AgentSnapshot.build(layout, records, files)
+            self._shards = shards
+            self._entries = entries
+            self._files = files
+            self._loaded = True
+        except Exception as e:
+            # 加载失败时返回空数据，且不记录签名，下次请求会重试
+            print(f"从分片目录加载代理数据时出错: {e}")
+            self._snapshot = AgentSnapshot.build(CsvLayout(AGENT_CSV_HEADER), [])
+
+    def apply_batch(self, ops):
+        """应用一组修改后只重写记录有变化的省份分片"""
+        with self._lock:
+            self.ensure_fresh()
+            if not self._loaded:
+                raise RuntimeError('代理数据未能加载')
+            snapshot, results = self._snapshot.apply(ops)
+            if snapshot is self._snapshot:
+                return results
+
+            directory = self.directory
+            layout = snapshot.layout
+            entries = list(self._entries)
+            used = {name for _, name in entries}
+            known = {province for province, _ in entries}
+            for province in snapshot.provinces:
+                if province not in known:
+                    name = _shard_file_name(province, used)
+                    used.add(name)
+                    entries.append((province, name))
+
+            # 未涉及的省份分组在新快照中仍是同一个对象，只重写分组被替换的分片
+            shards = dict(self._shards)
+            removed = []
+            for province, name in entries:
+                bucket = snapshot.provinces.get(province)
+                if bucket is not None and bucket is self._snapshot.provinces.get(province) and name in shards:
+                    continue
+                if bucket is None:
+                    removed.append((province, name))
+                    continue
+                path = os.path.join(directory, name)
+                _write_atomic(path, _csv_content(layout, bucket.records))
+                shards[name] = (_optional_signature(path), bucket.records)
+
+            # 分片增减时更新 manifest；先写 manifest 再删除空分片，manifest 不会引用缺失的文件
+            if removed or len(entries) != len(self._entries):
+                entries = [entry for entry in entries if entry not in removed]
+                _write_manifest(directory, layout.header, entries)
+                for _, name in removed:
+                    shards.pop(name, None)
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        pass
+
+            self._entries = entries
+            self._shards = shards
+            self._files = self._file_state(directory, entries)
+            snapshot.signature = self._files
+            self._snapshot = snapshot
+            return results
+
+
+def split_csv_to_shards(csv_path, directory):
+    """把单个 CSV（包括尚未合并的修改日志）按省拆分为分片目录，返回 (行数, 分片数)"""
+    source = CsvAgentStore(lambda: csv_path)
+    snapshot = source.snapshot()
+    return len(snapshot.records), write_shards(directory, snapshot.layout, snapshot.records)
+
+
+def merge_shards_to_csv(directory, csv_path):
+    """把分片目录合并为单个 CSV（先写临时文件再原子替换），返回合并的行数"""
+    snapshot = ShardedAgentStore(lambda: directory).snapshot()
+    _write_atomic(csv_path, _csv_content(snapshot.layout, snapshot.records))
+    # 合并出的 CSV 是完整数据，旧的修改日志不再适用
+    log_path = csv_path + WAL_SUFFIX
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    return len(snapshot.records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='县总代数据单文件 CSV 与按省分片目录之间的转换工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    split = subparsers.add_parser('split', help='把单个 CSV 按省拆分为分片目录（覆盖目录中原有的分片）')
+    split.add_argument('csv', nargs='?', default=DEFAULT_CSV)
+    split.add_argument('directory', nargs='?', default=DEFAULT_SHARD_DIR)
+    merge = subparsers.add_parser('merge', help='把分片目录合并为单个 CSV（覆盖 CSV 文件）')
+    merge.add_argument('directory', nargs='?', default=DEFAULT_SHARD_DIR)
+    merge.add_argument('csv', nargs='?', default=DEFAULT_CSV)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'split':
+            count, shards = split_csv_to_shards(args.csv, args.directory)
+            print(f"已拆分 {count} 行数据为 {shards} 个分片: {args.csv} -> {args.directory}")
+            print("设置环境变量 AGENT_STORAGE=partitioned 后启动应用即可使用分片存储")
+        else:
+            count = merge_shards_to_csv(args.directory, args.csv)
+            print(f"已合并 {count} 行数据: {args.directory} -> {args.csv}")
+    except Exception as e:
+        print(f"转换失败：{e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
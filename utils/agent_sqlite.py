@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+县总代数据的 SQLite 存储引擎
+
+数据存放在 agents 表中，对县名、省份、城市分别建立索引，单县查询直接走索引而不需要加载全部数据；
+增删改在一个事务内完成（更新不存在的县时插入新行，即 upsert），数据有变化时递增 meta 表中的版本号，
+版本号作为缓存版本（signature）。表头与非核心列（GDP、人口等）原样保存，可无损导出回 CSV。
+
+迁移工具：
+    python -m utils.agent_sqlite migrate [CSV路径] [数据库路径]   导入 CSV（含未合并的修改日志）
+    python -m utils.agent_sqlite export [数据库路径] [CSV路径]    导出为 CSV
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+if __name__ == '__main__' and __package__ is None:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.agent_store import AGENT_CSV_HEADER, AgentRecord, AgentSnapshot, AgentStorage, CsvAgentStore, CsvLayout
+
+DEFAULT_CSV = os.path.join('data', '爱河狸数据_地址拆分.csv')
+DEFAULT_DB = os.path.join('data', 'agents.db')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS agents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL DEFAULT '',
+    phone TEXT NOT NULL DEFAULT '',
+    province TEXT NOT NULL DEFAULT '',
+    city TEXT NOT NULL DEFAULT '',
+    county TEXT NOT NULL DEFAULT '',
+    extra TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS idx_agents_county ON agents (county);
+CREATE INDEX IF NOT EXISTS idx_agents_province ON agents (province);
+CREATE INDEX IF NOT EXISTS idx_agents_city ON agents (city);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+_COLUMNS = 'name, phone, province, city, county, extra'
+
+
+def _record(row):
+    name, phone, province, city, county, extra = row
+    return AgentRecord(name, phone, province, city, county, tuple(json.loads(extra)))
+
+
+def _version(db):
+    return ('sqlite', int(db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]))
+
+
+def _bump_version(db):
+    """数据有变化的写事务内调用，使 signature 改变"""
+    db.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+
+class SqliteAgentStore(AgentStorage):
+    """SQLite 存储引擎。写入使用单个连接，由锁串行化；读取使用各线程自己的只读连接，不经过写锁，
+    WAL 模式下写事务进行期间读请求照常读取提交前的数据。全量数据（/api/agents）以快照形式按版本号缓存，
+    本进程的写入以写时复制方式生成下一个快照，只有其它进程写入后才需要整体重新读取"""
+
+    def __init__(self, path_getter):
+        self._path_getter = path_getter
+        self._lock = threading.RLock()
+        self._connection = None
+        self._connection_path = None
+        # 各线程的读连接，以及全部读连接（close 时统一关闭）
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path_getter()
+
+    def _db(self):
+        path = self.path
+        if self._connection is None or self._connection_path != path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.executescript(_SCHEMA)
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('header', ?)",
+                               (json.dumps(AGENT_CSV_HEADER, ensure_ascii=False),))
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = connection
+            self._connection_path = path
+        return self._connection
+
+    def _reader(self):
+        """当前线程的读连接（query_only），数据库路径变化时重新打开"""
+        path = self.path
+        reader = getattr(self._local, 'reader', None)
+        if reader is None or reader[0] != path:
+            # 先由写连接建表并写入初始的 meta
+            with self._lock:
+                self._db()
+            connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA query_only=ON')
+            with self._readers_lock:
+                if reader is not None:
+                    self._readers.remove(reader[1])
+                    reader[1].close()
+                self._readers.append(connection)
+            reader = (path, connection)
+            self._local.reader = reader
+        return reader[1]
+
+    def _query(self, sql, params=()):
+        return self._reader().execute(sql, params).fetchall()
+
+    def _transaction(self, work):
+        """在一个写事务内执行 work(db)；出错时整体回滚"""
+        with self._lock:
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(db)
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+            return result
+
+    @property
+    def signature(self):
+        """('sqlite', 版本号)：每个写事务递增，其它进程写入后也能立即反映"""
+        return _version(self._reader())
+
+    def _publish(self, snapshot):
+        # 并发读取时可能晚于写入方完成，不用较旧的版本覆盖较新的快照
+        with self._snapshot_lock:
+            current = self._snapshot
+            if current is None or current.signature[1] <= snapshot.signature[1]:
+                self._snapshot = snapshot
+
+    def header(self):
+        return json.loads(self._query("SELECT value FROM meta WHERE key = 'header'")[0][0])
+
+    def snapshot(self):
+        version = self.signature
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.signature == version:
+            return snapshot
+        # 版本号与数据在同一个读事务内读取，保证快照一致
+        db = self._reader()
+        db.execute('BEGIN')
+        try:
+            version = _version(db)
+            header = json.loads(db.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()[0])
+            rows = db.execute(f'SELECT {_COLUMNS} FROM agents ORDER BY id').fetchall()
+        finally:
+            db.execute('COMMIT')
+        snapshot = AgentSnapshot.build(CsvLayout(header), [_record(row) for row in rows], version)
+        self._publish(snapshot)
+        return snapshot
+
+    def find_county(self, county):
+        if not county:
+            return None
+        rows = self._query(f'SELECT {_COLUMNS} FROM agents WHERE county = ? ORDER BY id LIMIT 1', (county,))
+        return _record(rows[0]) if rows else None
+
+    def apply_batch(self, ops):
+        """全部修改在同一个事务内执行，任一条失败则整体回滚"""
+        versions = []
+
+        def apply(db):
+            versions.append(_version(db))
+            results = []
+            for op in ops:
+                kind = op[0]
+                if kind == 'a':
+                    _, province, city, county, name, phone = op
+                    db.execute('INSERT INTO agents (name, phone, province, city, county) VALUES (?, ?, ?, ?, ?)',
+                               (name, phone, province, city, county))
+                    results.append(('created', 1))
+                elif kind == 'u':
+                    _, county, name, phone, province, city = op
+                    count = db.execute('UPDATE agents SET name = ?, phone = ? WHERE county = ?',
+                                       (name, phone, county)).rowcount
+                    if count:
+                        results.append(('updated', count))
+                    else:
+                        db.execute('INSERT INTO agents (name, phone, province, city, county) VALUES (?, ?, ?, ?, ?)',
+                                   (name, phone, province, city, county))
+                        results.append(('created', 1))
+                elif kind == 'd':
+                    count = db.execute('DELETE FROM agents WHERE county = ?', (op[1],)).rowcount
+                    results.append(('deleted' if count else 'not_found', count))
+                else:
+                    raise ValueError(f'未知的修改类型: {kind}')
+            if any(status != 'not_found' for status, _ in results):
+                _bump_version(db)
+                versions.append(_version(db))
+            return results
+
+        with self._lock:
+            results = self._transaction(apply)
+            snapshot = self._snapshot
+            if len(versions) == 2 and snapshot is not None and snapshot.signature == versions[0]:
+                # 缓存的快照就是写入前的数据：在其基础上应用同样的修改得到新快照，避免整表重读
+                following, _ = snapshot.apply(ops)
+                following.signature = versions[1]
+                self._publish(following)
+            return results
+
+    def replace_all(self, header, records):
+        """清空并整体写入（迁移用），在一个事务内完成"""
+        def replace(db):
+            db.execute('DELETE FROM agents')
+            db.execute("UPDATE meta SET value = ? WHERE key = 'header'", (json.dumps(header, ensure_ascii=False),))
+            db.executemany(f'INSERT INTO agents ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)', [
+                (r.name, r.phone, r.province, r.city, r.county, json.dumps(list(r.extra), ensure_ascii=False))
+                for r in records])
+            _bump_version(db)
+
+        self._transaction(replace)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        with self._readers_lock:
+            for connection in self._readers:
+                connection.close()
+            self._readers = []
+        self._local = threading.local()
+
+
+def migrate_csv_to_sqlite(csv_path, db_path):
+    """把 CSV（包括尚未合并的修改日志）导入 SQLite，返回导入的行数"""
+    source = CsvAgentStore(lambda: csv_path)
+    records = source.records()
+    target = SqliteAgentStore(lambda: db_path)
+    try:
+        target.replace_all(source.layout.header, records)
+    finally:
+        target.close()
+    return len(records)
+
+
+def export_sqlite_to_csv(db_path, csv_path):
+    """把 SQLite 中的数据按原表头导出为 CSV（先写临时文件再原子替换），返回导出的行数"""
+    store = SqliteAgentStore(lambda: db_path)
+    try:
+        layout = CsvLayout(store.header())
+        records = store.records()
+    finally:
+        store.close()
+    temp_path = csv_path + '.tmp'
+    with open(temp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(layout.header)
+        writer.writerows(layout.format(record) for record in records)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, csv_path)
+    # 导出的 CSV 是完整数据，旧的修改日志不再适用
+    log_path = csv_path + '.wal'
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='县总代数据 CSV 与 SQLite 之间的迁移工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help='把 CSV 导入 SQLite（覆盖数据库中的现有数据）')
+    migrate.add_argument('csv', nargs='?', default=DEFAULT_CSV)
+    migrate.add_argument('db', nargs='?', default=DEFAULT_DB)
+    export = subparsers.add_parser('export', help='把 SQLite 导出为 CSV（覆盖 CSV 文件）')
+    export.add_argument('db', nargs='?', default=DEFAULT_DB)
+    export.add_argument('csv', nargs='?', default=DEFAULT_CSV)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'migrate':
+            count = migrate_csv_to_sqlite(args.csv, args.db)
+            print(f"已导入 {count} 行数据: {args.csv} -> {args.db}")
+            print("设置环境变量 AGENT_STORAGE=sqlite 后启动应用即可使用 SQLite 存储")
+        else:
+            count = export_sqlite_to_csv(args.db, args.csv)
+            print(f"已导出 {count} 行数据: {args.db} -> {args.csv}")
+    except Exception as e:
+        print(f"迁移失败：{e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
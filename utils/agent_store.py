@@ -0,0 +1,747 @@
+# -*- coding: utf-8 -*-
+"""
+县总代数据常驻内存存储
+
+CSV 文件只在其 mtime/size 发生变化时才重新解析一次，解析结果按县名、
+(省, 市, 县) 和省份分别建立索引，使 /api/agents 与 /api/county/<name> 的查询
+不再需要逐行扫描文件。数据及索引以不可变快照（AgentSnapshot）发布，读请求不加锁，
+写入时以写时复制生成下一个快照后整体替换引用，读请求不会看到写了一半的数据。
+
+增删改不再重写 CSV：每次修改以一行紧凑记录追加到 <CSV>.wal 并 fsync，读取时在 CSV
+基础上重放日志。后台线程在日志达到大小或时间阈值后，把当前数据写入临时文件并原子替换 CSV，
+再清空日志。日志首行记录其所基于的 CSV 内容哈希，替换 CSV 后旧日志自动失效，
+因此在替换与清空之间崩溃也不会重复应用。
+
+多个进程共用同一数据文件时，追加日志与合并都在 <CSV>.wal.lock 的独占文件锁内进行：
+追加前在锁内重新校验日志的有效长度与 CSV 是否已被其它进程合并替换，不会截掉其它进程刚写入的修改。
+"""
+import abc
+import contextlib
+import csv
+import hashlib
+import heapq
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# CSV 默认表头（新建数据文件时写入）
+AGENT_CSV_HEADER = ['县总代', '联系电话', '省份', '城市', '县名', 'GDP', '人口']
+
+# 修改日志文件后缀，以及触发合并的日志大小（字节）与最长保留时间（秒）
+WAL_SUFFIX = '.wal'
+WAL_LOCK_SUFFIX = '.lock'
+WAL_COMPACT_BYTES = 256 * 1024
+WAL_COMPACT_SECONDS = 60
+_WAL_CHECK_INTERVAL = 5
+
+# 核心列名及其在缺少表头时的回退下标
+_CORE_COLUMNS = (('name', '县总代', 0), ('phone', '联系电话', 1), ('province', '省份', 2),
+                 ('city', '城市', 3), ('county', '县名', 4))
+
+
+class AgentRecord:
+    """一行县总代数据。使用 __slots__ 并对省、市字符串做 intern，控制大数据量下的内存占用"""
+    __slots__ = ('name', 'phone', 'province', 'city', 'county', 'extra')
+
+    def __init__(self, name, phone, province, city, county, extra=()):
+        self.name = name
+        self.phone = phone
+        self.province = sys.intern(province)
+        self.city = sys.intern(city)
+        self.county = county
+        self.extra = extra  # 非核心列（GDP、人口等），按表头顺序保存，重写文件时原样写回
+
+    @property
+    def has_agent(self):
+        return bool(self.name)
+
+    @property
+    def display_city(self):
+        """城市为空时归到省份下（直辖市等），与原 load_agent_data 行为一致"""
+        return self.city or self.province
+
+    @property
+    def key(self):
+        return (self.province, self.display_city, self.county)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'phone': self.phone,
+            'has_agent': self.has_agent
+        }
+
+
+class CsvLayout:
+    """根据表头确定各核心列的位置，负责 CSV 行与 AgentRecord 之间的转换"""
+
+    def __init__(self, header):
+        self.header = list(header)
+        try:
+            self.positions = {field: self.header.index(title) for field, title, _ in _CORE_COLUMNS}
+        except ValueError:
+            # 表头不规范时退回到固定列顺序：县总代, 联系电话, 省份, 城市, 县名
+            self.positions = {field: index for field, _, index in _CORE_COLUMNS}
+        core = set(self.positions.values())
+        self.width = max(len(self.header), max(core) + 1)
+        self.extra_positions = [i for i in range(self.width) if i not in core]
+
+    def parse(self, row):
+        if len(row) < self.width:
+            row = row + [''] * (self.width - len(row))
+        values = {field: row[index].strip() for field, index in self.positions.items()}
+        extra = tuple(row[i] for i in self.extra_positions)
+        return AgentRecord(values['name'], values['phone'], values['province'],
+                           values['city'], values['county'], extra)
+
+    def format(self, record):
+        row = [''] * self.width
+        for field, index in self.positions.items():
+            row[index] = getattr(record, field)
+        for index, value in zip(self.extra_positions, record.extra):
+            row[index] = value
+        return row
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _optional_signature(path):
+    try:
+        return _file_signature(path)
+    except OSError:
+        return None
+
+
+@contextlib.contextmanager
+def exclusive_file_lock(path):
+    """跨进程的独占文件锁（锁文件不存在时创建，用完不删除）。同一进程内不可嵌套获取"""
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK 在约 10 秒内反复尝试，仍拿不到时抛出 OSError，继续等待
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def apply_mutation(records, op):
+    """在记录列表上（就地）应用一条修改，返回 (结果, 受影响的记录数)；被修改的记录以新对象替换
+
+    op 为紧凑数组：
+        ['a', 省, 市, 县, 县总代, 电话]         追加一行                                   -> created
+        ['u', 县, 县总代, 电话, 省, 市]         更新该县全部行的县总代与电话，不存在时按省/市追加 -> updated / created
+        ['d', 县]                               删除该县全部行                             -> deleted / not_found
+    """
+    kind = op[0]
+    if kind == 'a':
+        _, province, city, county, name, phone = op
+        records.append(AgentRecord(name, phone, province, city, county))
+        return 'created', 1
+    if kind == 'u':
+        _, county, name, phone, province, city = op
+        count = 0
+        for index, record in enumerate(records):
+            if record.county == county:
+                records[index] = AgentRecord(name, phone, record.province, record.city, record.county, record.extra)
+                count += 1
+        if count:
+            return 'updated', count
+        records.append(AgentRecord(name, phone, province, city, county))
+        return 'created', 1
+    if kind == 'd':
+        kept = [record for record in records if record.county != op[1]]
+        count = len(records) - len(kept)
+        records[:] = kept
+        return ('deleted' if count else 'not_found'), count
+    raise ValueError(f'未知的修改类型: {kind}')
+
+
+def _require_county(county):
+    # 县名为空的行不进入任何索引，增改操作无法再定位到它们，因此不允许写入
+    if not county:
+        raise ValueError('县名不能为空')
+    return county
+
+
+def add_op(province, city, county, name, phone):
+    province, city, county, name, phone = (str(value).strip() for value in (province, city, county, name, phone))
+    return ['a', province, city, _require_county(county), name, phone]
+
+
+def upsert_op(county, name, phone, province='', city=''):
+    return ['u', _require_county(county)] + [str(value).strip() for value in (name, phone, province, city)]
+
+
+def delete_op(county):
+    return ['d', county]
+
+
+class StaleLogError(RuntimeError):
+    """追加修改时发现数据文件已被其它进程合并替换，内存中的数据需要重新加载"""
+
+
+def _parse_log(content):
+    """解析日志内容，返回 (首行记录的 base, 修改列表, 完整记录的字节数)；末尾写了一半的行不计入"""
+    ops = []
+    offset = 0
+    log_base = None
+    for line in content.splitlines(keepends=True):
+        try:
+            if not line.endswith(b'\n'):
+                raise ValueError('incomplete record')
+            entry = json.loads(line)
+        except ValueError:
+            break
+        if log_base is None:
+            log_base = entry.get('base') if isinstance(entry, dict) else ''
+        else:
+            ops.append(entry)
+        offset += len(line)
+    return log_base, ops, offset
+
+
+class MutationLog:
+    """追加写的修改日志：首行 {"base": CSV内容哈希}，其后每行一条 JSON 数组形式的修改
+
+    source_state 为读取日志时 CSV 文件的签名，追加时用来判断 CSV 是否已被其它进程合并替换。
+    """
+
+    def __init__(self, path, source_path=None, source_state=None):
+        self.path = path
+        self.source_path = source_path
+        self.source_state = source_state
+        self._valid_length = None
+
+    def lock(self):
+        """日志的跨进程独占锁（追加、合并时持有）"""
+        return exclusive_file_lock(self.path + WAL_LOCK_SUFFIX)
+
+    def _read_bytes(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return b''
+
+    def read(self, base):
+        """返回基于该 CSV 版本的修改列表；日志属于旧版本 CSV 时忽略，末尾写了一半的行被丢弃"""
+        self._valid_length = None
+        content = self._read_bytes()
+        log_base, ops, offset = _parse_log(content)
+        if offset < len(content):
+            print(f"修改日志 {self.path} 末尾存在不完整的记录，已忽略")
+        if log_base != base:
+            if ops:
+                print(f"修改日志 {self.path} 不属于当前数据文件（已合并或数据文件被外部修改），已忽略")
+            self._valid_length = 0
+            return []
+        self._valid_length = offset
+        return ops
+
+    def append(self, base, ops):
+        """追加一组修改，只写一次并 fsync 一次；日志为空、已失效或末尾残缺时先截断/写入首行
+
+        在独占文件锁内重新计算日志的有效长度。返回 False 表示期间其它进程也追加过修改
+        （本次修改仍已写在其后），调用方应重新加载数据；CSV 已被替换时抛出 StaleLogError，不写入。
+        """
+        line = b''.join(json.dumps(op, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+                        for op in ops)
+        with self.lock():
+            if self.source_path is not None and _optional_signature(self.source_path) != self.source_state:
+                raise StaleLogError(f'数据文件 {self.source_path} 已被修改')
+            log_base, _, valid_length = _parse_log(self._read_bytes())
+            if log_base != base:
+                valid_length = 0
+            current = valid_length == self._valid_length
+            with open(self.path, 'ab') as f:
+                size = f.seek(0, os.SEEK_END)
+                if valid_length != size:
+                    f.truncate(valid_length)
+                if valid_length == 0:
+                    line = json.dumps({'base': base}).encode('utf-8') + b'\n' + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._valid_length = valid_length + len(line)
+            return current
+
+    def reset(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._valid_length = 0
+
+    def size(self):
+        sig = _optional_signature(self.path)
+        return sig[1] if sig else 0
+
+
+def build_tree(records):
+    """省 -> 市 -> 县 的嵌套字典（/api/agents 的返回结构），同名键以后出现的记录为准"""
+    tree = {}
+    for record in records:
+        if record.county and record.province:
+            tree.setdefault(record.province, {}).setdefault(record.display_city, {})[record.county] = record.to_dict()
+    return tree
+
+
+def op_county(op):
+    """修改所涉及的县名"""
+    return op[3] if op[0] == 'a' else op[1]
+
+
+class ProvinceBucket:
+    """快照中一个省份（省份为空的记录归入 '' 分组）的全部记录及其索引，发布后不再修改
+
+    order 与 records 一一对应，是记录在全部数据中的顺序号，用于跨省份合并出文件中的行顺序。
+    """
+    __slots__ = ('province', 'order', 'records', 'by_county', 'by_key', 'cities', 'fragment')
+
+    def __init__(self, province, order, records):
+        self.province = province
+        self.order = tuple(order)
+        self.records = tuple(records)
+        # 县名 -> 该县记录在 records 中的下标
+        self.by_county = {}
+        self.by_key = {}
+        for index, record in enumerate(self.records):
+            if not record.county:
+                continue
+            self.by_county.setdefault(record.county, []).append(index)
+            if province:
+                self.by_key[record.key] = record
+        self.cities = build_tree(self.records).get(province, {}) if province else {}
+        # 已编码的 "省份":{...} 片段，首次用到时填充（内容只由 cities 决定，并发重复填充无害）
+        self.fragment = None
+
+    def county_records(self, county):
+        """该县在本省份中的 (顺序号, 记录) 列表"""
+        return [(self.order[index], self.records[index]) for index in self.by_county.get(county, ())]
+
+    def encoded(self):
+        fragment = self.fragment
+        if fragment is None:
+            fragment = (json.dumps(self.province, ensure_ascii=False) + ':' +
+                        json.dumps(self.cities, ensure_ascii=False, sort_keys=True,
+                                   separators=(',', ':'))).encode('utf-8')
+            self.fragment = fragment
+        return fragment
+
+
+class AgentSnapshot:
+    """某一版本的县总代数据及其索引。发布后不再修改，读请求取一次引用即可得到一致的数据，无需加锁
+
+    记录按省份分组保存（ProvinceBucket），各组自带县名、(省, 市, 县) 索引与嵌套字典。apply 只重建
+    涉及的省份分组，其余分组（包括其 JSON 编码片段）与旧版本共享，提交的开销与涉及省份的记录数成正比，
+    与总记录数无关。按县名查找时逐个分组查询（分组数即省份数）。
+    """
+    __slots__ = ('layout', 'provinces', 'next_order', 'tree', 'signature', '_records')
+
+    def __init__(self, layout, provinces, next_order, signature=None):
+        self.layout = layout
+        # 省份 -> ProvinceBucket
+        self.provinces = provinces
+        # 下一条新增记录的顺序号
+        self.next_order = next_order
+        self.tree = {province: bucket.cities for province, bucket in provinces.items() if bucket.cities}
+        # 数据版本标识；新快照由写入方在发布前设置
+        self.signature = signature
+        self._records = None
+
+    @classmethod
+    def build(cls, layout, records, signature=None):
+        groups = {}
+        for order, record in enumerate(records):
+            group = groups.setdefault(record.province, ([], []))
+            group[0].append(order)
+            group[1].append(record)
+        provinces = {province: ProvinceBucket(province, order, group) for province, (order, group) in groups.items()}
+        return cls(layout, provinces, len(records), signature)
+
+    @property
+    def records(self):
+        """全部记录（按文件中的行顺序），首次用到时由各省份分组合并得到"""
+        records = self._records
+        if records is None:
+            merged = heapq.merge(*(zip(bucket.order, bucket.records) for bucket in self.provinces.values()),
+                                 key=lambda item: item[0])
+            records = tuple(record for _, record in merged)
+            self._records = records
+        return records
+
+    def apply(self, ops):
+        """应用一组修改，返回 (下一个快照, 结果列表)；没有任何变化时返回自身
+
+        修改依次作用在涉及的省份分组的副本上（分组内仍为 apply_mutation 的语义），最后只重建这些分组。
+        """
+        drafts = {}
+        next_order = self.next_order
+
+        def draft(province):
+            if province not in drafts:
+                bucket = self.provinces.get(province)
+                drafts[province] = ([], []) if bucket is None else (list(bucket.order), list(bucket.records))
+            return drafts[province]
+
+        def containing(county):
+            # 当前（含本批已修改的）含有该县记录的省份
+            found = [province for province, bucket in self.provinces.items()
+                     if province not in drafts and county in bucket.by_county]
+            found.extend(province for province, (_, records) in drafts.items()
+                         if any(record.county == county for record in records))
+            return found
+
+        results = []
+        for op in ops:
+            kind = op[0]
+            if kind == 'a':
+                _, province, city, county, name, phone = op
+                order, records = draft(province)
+                order.append(next_order)
+                records.append(AgentRecord(name, phone, province, city, county))
+                next_order += 1
+                results.append(('created', 1))
+            elif kind == 'u':
+                _, county, name, phone, province, city = op
+                count = 0
+                for found in containing(county):
+                    count += apply_mutation(draft(found)[1], op)[1]
+                if count:
+                    results.append(('updated', count))
+                else:
+                    order, records = draft(province)
+                    order.append(next_order)
+                    records.append(AgentRecord(name, phone, province, city, county))
+                    next_order += 1
+                    results.append(('created', 1))
+            elif kind == 'd':
+                count = 0
+                for found in containing(op[1]):
+                    order, records = draft(found)
+                    kept = [(position, record) for position, record in zip(order, records) if record.county != op[1]]
+                    count += len(records) - len(kept)
+                    order[:] = [position for position, _ in kept]
+                    records[:] = [record for _, record in kept]
+                results.append(('deleted' if count else 'not_found', count))
+            else:
+                raise ValueError(f'未知的修改类型: {kind}')
+        if not drafts:
+            return self, results
+
+        provinces = dict(self.provinces)
+        for province, (order, records) in drafts.items():
+            if records:
+                provinces[province] = ProvinceBucket(province, order, records)
+            else:
+                provinces.pop(province, None)
+        return AgentSnapshot(self.layout, provinces, next_order), results
+
+    def tree_json(self):
+        """tree 的紧凑 JSON 编码（UTF-8 字节，键按排序输出，与 jsonify 一致），由各省份片段拼接而成"""
+        return b'{' + b','.join(self.provinces[province].encoded() for province in sorted(self.tree)) + b'}'
+
+    def _county_records(self, county):
+        matches = [item for bucket in self.provinces.values() for item in bucket.county_records(county)]
+        matches.sort(key=lambda item: item[0])
+        return [record for _, record in matches]
+
+    def has_county(self, county):
+        return any(county in bucket.by_county for bucket in self.provinces.values())
+
+    def counties(self):
+        """全部县名（去重）"""
+        return dict.fromkeys(county for bucket in self.provinces.values() for county in bucket.by_county)
+
+    def find_county(self, county):
+        """按县名查找，重名时返回最先写入的记录"""
+        matches = self._county_records(county)
+        return matches[0] if matches else None
+
+    def find_all(self, county):
+        return self._county_records(county)
+
+    def get(self, province, city, county):
+        return self.get_key((province, city or province, county))
+
+    def get_key(self, key):
+        """按 (省, 显示城市, 县) 键查找，同一键有多行时以最后一行为准"""
+        bucket = self.provinces.get(key[0]) if key[0] else None
+        return bucket.by_key.get(key) if bucket is not None else None
+
+    def keyed_records(self):
+        """{(省, 显示城市, 县): 记录}，按各键首次出现的行顺序排列，同一键以最后一行为准"""
+        keyed = {}
+        for record in self.records:
+            if record.county and record.province:
+                keyed[record.key] = record
+        return keyed
+
+    def province_records(self, province):
+        bucket = self.provinces.get(province) if province else None
+        return [record for record in bucket.records if record.county] if bucket is not None else []
+
+
+class AgentStorage(abc.ABC):
+    """县总代数据存储接口。app.py 与写线程（MutationQueue）只通过这些方法读写数据，具体存储由引擎实现
+
+    查询语义（与最初逐行读取 CSV 的实现一致）：find_county 按县名查找，重名时返回最先写入的记录。
+    其余查询通过 snapshot() 得到的 AgentSnapshot 进行。
+    """
+
+    @property
+    @abc.abstractmethod
+    def signature(self):
+        """当前数据的版本标识，数据内容变化时改变（用作各类缓存的版本号）"""
+
+    @abc.abstractmethod
+    def snapshot(self):
+        """当前版本的 AgentSnapshot。需要多次查询且要求结果一致（含 signature）时使用"""
+
+    @abc.abstractmethod
+    def apply_batch(self, ops):
+        """在一次提交（一次落盘/一个事务）中依次应用一组修改（格式见 apply_mutation），
+        返回与 ops 一一对应的 (结果, 受影响的记录数)"""
+
+    def find_county(self, county):
+        return self.snapshot().find_county(county)
+
+    def records(self):
+        """全部记录（按文件中的行顺序），迁移与导出工具使用"""
+        return self.snapshot().records
+
+
+class CsvAgentStore(AgentStorage):
+    """CSV 存储引擎（默认）：进程内常驻的县总代数据，仅在数据文件变化后重建"""
+
+    def __init__(self, path_getter):
+        # path_getter 每次调用返回当前数据文件路径（兼容打包后的外部/内部资源路径）
+        self._path_getter = path_getter
+        # 修改操作在持有锁时会调用 ensure_fresh，因此使用可重入锁
+        self._lock = threading.RLock()
+        # _files: 已加载的 CSV 与日志文件签名，用于判断是否需要重新加载
+        # 快照的 signature 是数据内容的版本标识，合并日志不改变内容，因此不会更新它
+        self._files = None
+        self._loaded = False
+        self._base = None
+        self._log = None
+        self._log_started = None
+        self._compactor = None
+        # 当前发布的快照，写入方构建好下一个快照后整体替换该引用
+        self._snapshot = AgentSnapshot.build(CsvLayout(AGENT_CSV_HEADER), [])
+
+    @property
+    def path(self):
+        return self._path_getter()
+
+    @property
+    def layout(self):
+        return self._snapshot.layout
+
+    @property
+    def signature(self):
+        """当前已加载数据的版本标识（加载时的 CSV 与日志文件签名），数据内容变化时改变"""
+        return self.snapshot().signature
+
+    def snapshot(self):
+        self.ensure_fresh()
+        return self._snapshot
+
+    def _file_state(self, path):
+        return (_optional_signature(path), _optional_signature(path + WAL_SUFFIX))
+
+    def ensure_fresh(self):
+        path = self.path
+        if self._loaded and self._file_state(path) == self._files:
+            return
+        # 锁被写入方（追加日志、合并）或正在重新加载的线程持有时，文件可能正写到一半：
+        # 已有发布的快照就直接使用它，不等待写入完成，也不据半写的文件重新加载
+        if not self._lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            if self._loaded and self._file_state(path) == self._files:
+                return
+            self._load(path)
+        finally:
+            self._lock.release()
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            files = self._file_state(path)
+            reader = csv.reader(io.StringIO(content.decode('utf-8'), newline=''))
+            try:
+                header = next(reader)
+            except StopIteration:
+                header = AGENT_CSV_HEADER
+            layout = CsvLayout(header)
+            records = [layout.parse(row) for row in reader if row]
+
+            # 在 CSV 基础上重放尚未合并的修改
+            base = hashlib.sha1(content).hexdigest()
+            log = MutationLog(path + WAL_SUFFIX, path, files[0])
+            ops = log.read(base)
+            for op in ops:
+                apply_mutation(records, op)
+            self._snapshot = AgentSnapshot.build(layout, records, files)
+            self._base = base
+            self._log = log
+            self._files = files
+            self._loaded = True
+            self._log_started = time.monotonic() if ops else None
+            if ops:
+                self._start_compactor()
+        except FileNotFoundError:
+            print(f"警告: 代理数据文件 {path} 未找到。将创建一个空文件。")
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(AGENT_CSV_HEADER)
+            except Exception as e:
+                print(f"创建代理数据文件 {path} 失败: {e}")
+                self._snapshot = AgentSnapshot.build(CsvLayout(AGENT_CSV_HEADER), [])
+                return
+            # 新建的空文件正常加载（同时重放可能残留的修改日志）
+            self._load(path)
+        except Exception as e:
+            # 加载失败时返回空数据，且不记录签名，下次请求会重试
+            print(f"从CSV加载代理数据时出错: {e}")
+            self._snapshot = AgentSnapshot.build(CsvLayout(AGENT_CSV_HEADER), [])
+
+    def apply_batch(self, ops):
+        """依次应用一组修改：全部修改一次性追加到日志并落盘（一次 fsync），再发布新快照"""
+        with self._lock:
+            while True:
+                self.ensure_fresh()
+                if not self._loaded:
+                    raise RuntimeError('代理数据未能加载')
+                snapshot, results = self._snapshot.apply(ops)
+                if snapshot is self._snapshot:
+                    return results
+                changed = [op for op, (status, _) in zip(ops, results) if status != 'not_found']
+                path = self.path
+                try:
+                    current = self._log.append(self._base, changed)
+                    break
+                except StaleLogError:
+                    # 其它进程已合并替换了 CSV：重新加载后在最新数据上重新应用（读请求继续使用旧快照）
+                    self._load(path)
+            if current:
+                self._files = self._file_state(path)
+                snapshot.signature = self._files
+                self._snapshot = snapshot
+            else:
+                # 其它进程的修改写在本次修改之前，重新加载得到两者都已应用的数据
+                self._load(path)
+            if self._log_started is None:
+                self._log_started = time.monotonic()
+            self._start_compactor()
+            return results
+
+    def compact(self):
+        """把当前数据写入临时文件后原子替换 CSV，并清空修改日志"""
+        with self._lock:
+            self.ensure_fresh()
+            if not self._loaded or self._log is None:
+                return False
+            path = self.path
+            with self._log.lock():
+                # 其它进程可能已追加修改或已完成合并，先在锁内重新加载，避免丢掉它们的修改
+                if self._file_state(path) != self._files:
+                    self._load(path)
+                    if not self._loaded:
+                        return False
+                snapshot = self._snapshot
+                temp_path = f'{path}.{os.getpid()}.tmp'
+                buffer = io.StringIO(newline='')
+                writer = csv.writer(buffer)
+                writer.writerow(snapshot.layout.header)
+                writer.writerows(snapshot.layout.format(record) for record in snapshot.records)
+                content = buffer.getvalue().encode('utf-8')
+                try:
+                    with open(temp_path, 'wb') as f:
+                        f.write(content)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(temp_path, path)
+                except OSError:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+                # CSV 已替换，旧日志的 base 不再匹配；此后删除日志只是清理
+                self._log.reset()
+                self._base = hashlib.sha1(content).hexdigest()
+                self._files = self._file_state(path)
+                self._log.source_state = self._files[0]
+                self._log_started = None
+                return True
+
+    def _compaction_due(self):
+        if self._log_started is None:
+            return False
+        return (self._log.size() >= WAL_COMPACT_BYTES or
+                time.monotonic() - self._log_started >= WAL_COMPACT_SECONDS)
+
+    def _start_compactor(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_loop, name='agent-wal-compactor', daemon=True)
+        self._compactor.start()
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(_WAL_CHECK_INTERVAL)
+            with self._lock:
+                if self._log_started is None:
+                    # 日志已合并，线程退出；下一次修改时重新启动
+                    self._compactor = None
+                    return
+                if not self._compaction_due():
+                    continue
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"合并代理数据修改日志失败: {e}")
+
+
+# 可选的存储引擎；打包后的 exe 默认使用 CSV
+STORAGE_ENGINES = ('csv', 'sqlite', 'partitioned')
+
+
+def create_agent_storage(engine, csv_path_getter, db_path_getter, shard_dir_getter=None):
+    """按引擎名创建存储实例"""
+    if engine == 'csv':
+        return CsvAgentStore(csv_path_getter)
+    if engine == 'sqlite':
+        from utils.agent_sqlite import SqliteAgentStore
+        return SqliteAgentStore(db_path_getter)
+    if engine == 'partitioned':
+        from utils.agent_shards import ShardedAgentStore
+        return ShardedAgentStore(shard_dir_getter)
+    raise ValueError(f'未知的存储引擎: {engine}（可选: {", ".join(STORAGE_ENGINES)}）')
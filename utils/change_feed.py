@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+县总代数据的变更日志（/api/agents/stream 与 /api/agents?since=）
+
+每次提交后把涉及的县的最新数据作为一个事件放入有界环形缓冲区，事件序号即单调递增的数据版本，
+对外的版本号/事件 ID 为“进程标识-序号”。客户端带上已有的版本号即可取得之后的变化；
+版本号来自其它进程（服务重启）、已超出缓冲区范围，或其间数据文件被外部修改过时，
+客户端需要重新加载全量数据。
+"""
+import collections
+import itertools
+import secrets
+import threading
+
+# 缓冲区保留的事件数
+FEED_CAPACITY = 1000
+
+
+class ChangeFeed:
+
+    def __init__(self, capacity=FEED_CAPACITY):
+        # 区分不同进程的事件序号，重启后旧 ID 不会被误认为有效
+        self.epoch = secrets.token_hex(4)
+        self._events = collections.deque(maxlen=capacity)
+        self._seq = 0
+        # 最近一次发布时的数据版本标识（存储的 signature），用于发现外部对数据文件的修改
+        self._signature = None
+        self._condition = threading.Condition()
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def event_id(self, seq):
+        return f'{self.epoch}-{seq}'
+
+    def parse_id(self, event_id):
+        """事件 ID -> 序号；不是本进程发出的 ID 返回 None"""
+        epoch, _, seq = (event_id or '').strip().rpartition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _append(self, data):
+        self._seq += 1
+        self._events.append((self._seq, data))
+
+    def publish(self, changes, signature=None):
+        """依次追加事件并唤醒等待中的连接，返回最后一个事件的序号"""
+        with self._condition:
+            for data in changes:
+                self._append(data)
+            if signature is not None:
+                self._signature = signature
+            if changes:
+                self._condition.notify_all()
+            return self._seq
+
+    def sync(self, signature):
+        """数据版本标识与最近一次发布时不同（数据文件被外部修改）时追加一个需要全量重新加载的标记"""
+        with self._condition:
+            self._sync(signature)
+
+    def _sync(self, signature):
+        if self._signature is not None and signature != self._signature:
+            self._append(None)
+            self._condition.notify_all()
+        self._signature = signature
+
+    def current(self, signature, stable):
+        """读到数据版本标识为 signature 的数据后调用：在锁内依次 sync 并返回当前序号
+
+        stable() 在锁内判断读取期间没有本进程的提交（否则数据可能已是新版本而事件尚未发布，
+        不能据此判断外部修改，也不能配上当前序号），此时返回 None，由调用方重新读取。
+        """
+        with self._condition:
+            if not stable():
+                return None
+            self._sync(signature)
+            return self._seq
+
+    def since(self, seq):
+        """序号 seq 之后的 [(序号, 数据)]；无法补齐（seq 无效、已超出缓冲区或其间有外部修改）时返回 None"""
+        with self._condition:
+            if seq is None or seq > self._seq:
+                return None
+            if seq == self._seq:
+                return []
+            first = self._events[0][0] if self._events else self._seq + 1
+            if seq + 1 < first:
+                return None
+            events = list(itertools.islice(self._events, seq + 1 - first, None))
+            return None if any(data is None for _, data in events) else events
+
+    def wait(self, seq, timeout):
+        """等待 seq 之后的新事件，超时返回 []"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq != seq, timeout)
+        return self.since(seq)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+县级边界数据的离线预处理（构建期执行一次）
+
+把 中国_县.geojson 预处理为一组带版本号的产物，写在数据文件旁的 data/geo_assets/<版本>/ 下：
+    counties.geobin      精简后的二进制几何存储（只保留用到的属性、坐标量化、去除重复顶点）
+    arcs*.npy            共享弧段及各预设简化级别的弧段（坐标 + 偏移表，运行时 mmap 打开）
+    topology.json        每个要素的弧段引用
+    bboxes.npy           要素外包矩形（空间索引据此在启动时直接建立）
+    meta.json            要素元数据表（/api/counties/meta）
+    manifest.json        产物格式版本、源文件大小与 SHA-1、量化精度
+运行时 GeoJSONCache 优先使用与当前 GeoJSON 内容一致的产物，跳过解析、拓扑构建、简化和元数据计算。
+
+用法：python -m utils.geo_assets [GeoJSON路径] [--precision 6]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+if __name__ == '__main__' and __package__ is None:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.geo_binary import GeometryStore, encode_geometry_store
+from utils.geo_dissolve import CITY_KEYS, CODE_KEYS, PROVINCE_KEYS
+from utils.geo_simplify import SIMPLIFY_LEVELS
+from utils.geo_topology import Topology
+
+ASSET_FORMAT = 2
+ASSET_DIR_NAME = 'geo_assets'
+DEFAULT_PRECISION = 6
+
+# 运行时用到的要素属性（县名、省/市归属、行政区划代码），其余属性在构建时丢弃
+KEPT_PROPERTIES = ('name',) + PROVINCE_KEYS + CITY_KEYS + CODE_KEYS
+
+GEOMETRY_FILE = 'counties.geobin'
+MANIFEST_FILE = 'manifest.json'
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _clean_ring(ring, precision):
+    """坐标按精度舍入，去掉舍入后连续重复的顶点并保证闭合；退化的环返回 None"""
+    ring = np.round(np.asarray(ring, dtype=np.float64)[:, :2], precision) if len(ring) else np.empty((0, 2))
+    if len(ring) > 1:
+        changed = np.any(ring[1:] != ring[:-1], axis=1)
+        ring = ring[np.concatenate(([True], changed))]
+    if len(ring) and not np.array_equal(ring[0], ring[-1]):
+        ring = np.vstack((ring, ring[:1]))
+    return ring.tolist() if len(ring) >= 4 else None
+
+
+def _clean_geometry(geometry, precision):
+    if not geometry or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+        return geometry
+    polygons = geometry.get('coordinates') or []
+    if geometry['type'] == 'Polygon':
+        polygons = [polygons]
+    cleaned = []
+    for polygon in polygons:
+        rings = [_clean_ring(ring, precision) for ring in polygon]
+        # 外环退化则整块面丢弃；内环退化只丢弃该内环
+        if rings and rings[0] is not None:
+            cleaned.append([ring for ring in rings if ring is not None])
+    if not cleaned:
+        return geometry
+    if geometry['type'] == 'Polygon':
+        return {'type': 'Polygon', 'coordinates': cleaned[0]}
+    return {'type': 'MultiPolygon', 'coordinates': cleaned}
+
+
+def prepare_geojson(data, precision=DEFAULT_PRECISION):
+    """只保留用到的属性，坐标量化并去除重复顶点"""
+    features = []
+    for feature in data.get('features', []):
+        properties = feature.get('properties') or {}
+        out = {
+            'type': 'Feature',
+            'properties': {key: properties[key] for key in KEPT_PROPERTIES if key in properties},
+            'geometry': _clean_geometry(feature.get('geometry'), precision)
+        }
+        if 'id' in feature:
+            out['id'] = feature['id']
+        features.append(out)
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def _save_arcs(directory, name, arcs):
+    offsets = np.zeros(len(arcs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(arc) for arc in arcs])
+    coords = np.concatenate(arcs) if arcs else np.empty((0, 2))
+    np.save(os.path.join(directory, f'{name}.npy'), coords.astype(np.float64))
+    np.save(os.path.join(directory, f'{name}_offsets.npy'), offsets)
+
+
+def _load_arcs(directory, name):
+    coords = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+    offsets = np.load(os.path.join(directory, f'{name}_offsets.npy')).tolist()
+    return [coords[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def build_geo_assets(source_path, asset_root=None, precision=DEFAULT_PRECISION):
+    """构建产物目录并返回其路径；同一版本已存在时直接返回，旧版本目录会被删除"""
+    from utils.geo_cache import GeoDataset
+
+    asset_root = asset_root or os.path.join(os.path.dirname(source_path), ASSET_DIR_NAME)
+    st = os.stat(source_path)
+    source_sha1 = file_sha1(source_path)
+    version = f'v{ASSET_FORMAT}-{source_sha1[:12]}-p{precision}'
+    directory = os.path.join(asset_root, version)
+    if read_manifest(directory) is not None:
+        print(f"预处理产物已是最新: {directory}")
+        return directory
+
+    with open(source_path, 'r', encoding='utf-8') as f:
+        data = prepare_geojson(json.load(f), precision)
+    encoded = encode_geometry_store(data, (st.st_mtime_ns, st.st_size))
+    del data
+    dataset = GeoDataset(source_path, (st.st_mtime_ns, st.st_size), GeometryStore(encoded))
+
+    temp_dir = directory + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    with open(os.path.join(temp_dir, GEOMETRY_FILE), 'wb') as f:
+        f.write(encoded)
+
+    topology = dataset.topology()
+    print(f"共享弧段: {len(topology.arcs)} 条")
+    _save_arcs(temp_dir, 'arcs', topology.arcs)
+    for level in range(len(SIMPLIFY_LEVELS)):
+        _save_arcs(temp_dir, f'arcs_level{level}', dataset.simplified_arcs(level))
+    with open(os.path.join(temp_dir, 'topology.json'), 'w', encoding='utf-8') as f:
+        json.dump(topology.geometries, f, separators=(',', ':'))
+    np.save(os.path.join(temp_dir, 'bboxes.npy'), dataset.feature_bboxes())
+    with open(os.path.join(temp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(dataset.meta_table(), f, ensure_ascii=False, separators=(',', ':'))
+
+    # manifest 最后写入，作为产物完整的标志
+    manifest = {
+        'format': ASSET_FORMAT,
+        'version': version,
+        'source': {'name': os.path.basename(source_path), 'size': st.st_size, 'sha1': source_sha1},
+        'precision': precision,
+        'levels': [list(level) for level in SIMPLIFY_LEVELS],
+        'features': len(dataset.features)
+    }
+    with open(os.path.join(temp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temp_dir, directory)
+    for name in os.listdir(asset_root):
+        if name != version:
+            shutil.rmtree(os.path.join(asset_root, name), ignore_errors=True)
+    print(f"预处理产物已生成: {directory}（{manifest['features']} 个要素）")
+    return directory
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != ASSET_FORMAT or manifest.get('levels') != [list(l) for l in SIMPLIFY_LEVELS]:
+        return None
+    return manifest
+
+
+def find_geo_assets(asset_root, source_path):
+    """返回与 source_path 内容一致的产物目录，没有时返回 None（只在存在候选产物时计算 SHA-1）"""
+    if not asset_root or not os.path.isdir(asset_root):
+        return None
+    size = os.path.getsize(source_path)
+    candidates = []
+    for name in sorted(os.listdir(asset_root)):
+        directory = os.path.join(asset_root, name)
+        manifest = read_manifest(directory)
+        if manifest is not None and manifest['source']['size'] == size:
+            candidates.append((directory, manifest['source']['sha1']))
+    if not candidates:
+        return None
+    source_sha1 = file_sha1(source_path)
+    for directory, sha1 in candidates:
+        if sha1 == source_sha1:
+            return directory
+    return None
+
+
+def open_geometry_store(directory):
+    return GeometryStore.open(os.path.join(directory, GEOMETRY_FILE))
+
+
+def preload_dataset(dataset, directory):
+    """把产物中的预计算结果填入 GeoDataset 的派生缓存"""
+    with open(os.path.join(directory, 'topology.json'), 'r', encoding='utf-8') as f:
+        geometries = [tuple(entry) if entry is not None else None for entry in json.load(f)]
+    dataset.derived('topology', lambda: Topology(_load_arcs(directory, 'arcs'), geometries))
+    for level in range(len(SIMPLIFY_LEVELS)):
+        dataset.derived(('simplified_arcs', level), lambda: _load_arcs(directory, f'arcs_level{level}'))
+    dataset.derived('feature_bboxes', lambda: np.load(os.path.join(directory, 'bboxes.npy')))
+    with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    dataset.derived('meta_table', lambda: meta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='预处理县级边界 GeoJSON，生成运行时直接使用的产物')
+    parser.add_argument('source', nargs='?', default=os.path.join('data', '中国_县.geojson'),
+                        help='GeoJSON 文件路径（默认 data/中国_县.geojson）')
+    parser.add_argument('--output', help=f'产物根目录（默认与 GeoJSON 同目录下的 {ASSET_DIR_NAME}）')
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION, help='坐标保留的小数位数（默认 6）')
+    args = parser.parse_args()
+    try:
+        build_geo_assets(args.source, args.output, args.precision)
+    except Exception as e:
+        print(f"预处理失败：{e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
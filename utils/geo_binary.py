@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+内存映射的二进制几何存储
+
+由 中国_县.geojson 生成一个紧凑的二进制文件（偏移表 + 扁平 float64 坐标数组），
+各进程用 mmap + np.frombuffer 打开，坐标数据由操作系统页缓存在多个 worker 之间共享，
+不再各自持有一份由 Python 列表和浮点对象组成的完整 GeoJSON。
+
+文件布局（小端）：
+    头部       HEADER 结构
+    几何类型   uint8[n_features]（0 无几何，1 Polygon，2 MultiPolygon，3 其它类型，原样存于元数据）
+    要素偏移   int32[n_features + 1] -> 多边形表
+    多边形偏移 int32[n_polygons + 1] -> 环表
+    环偏移     int32[n_rings + 1] -> 坐标点
+    坐标       float64[n_coords * 2]，经纬度，与 json 解析得到的浮点数完全相同
+    元数据     UTF-8 JSON：顶层其它成员、每个要素的 properties / id / 非面几何
+每一段都按 8 字节对齐。头部记录源文件签名，源文件变化后重新生成。
+坐标不做量化，完整精度的 /api/geojson 与原文件数值一致（整数坐标序列化为 x.0）。坐标数组只存经纬度，
+带高程等第三维的面要素另把原始几何存于元数据，序列化时原样输出，拓扑、索引等仍只用经纬度。
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from collections.abc import Sequence
+
+import numpy as np
+
+MAGIC = b'AHGEOBIN'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<8sIqqqqqqqq')
+
+GEOMETRY_NONE, GEOMETRY_POLYGON, GEOMETRY_MULTIPOLYGON, GEOMETRY_OTHER = 0, 1, 2, 3
+_GEOMETRY_TYPES = {'Polygon': GEOMETRY_POLYGON, 'MultiPolygon': GEOMETRY_MULTIPOLYGON}
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _sections(n_features, n_polygons, n_rings, n_coords):
+    """各段的 (起始偏移, dtype, 元素个数)，读写两端按同一顺序计算"""
+    layout = []
+    offset = HEADER.size
+    for dtype, count in ((np.uint8, n_features), (np.int32, n_features + 1), (np.int32, n_polygons + 1),
+                         (np.int32, n_rings + 1), (np.float64, n_coords * 2)):
+        offset = _align(offset)
+        layout.append((offset, dtype, count))
+        offset += np.dtype(dtype).itemsize * count
+    return layout, _align(offset)
+
+
+def encode_geometry_store(data, source_signature):
+    """GeoJSON 对象 -> 二进制存储字节"""
+    features = data.get('features', [])
+    types = np.zeros(len(features), dtype=np.uint8)
+    feature_offsets = [0]
+    polygon_offsets = [0]
+    ring_offsets = [0]
+    coords = []
+    records = []
+    for index, feature in enumerate(features):
+        geometry = feature.get('geometry')
+        record = {'p': feature.get('properties')}
+        if 'id' in feature:
+            record['id'] = feature['id']
+        geometry_type = _GEOMETRY_TYPES.get((geometry or {}).get('type'))
+        if geometry_type is None:
+            types[index] = GEOMETRY_OTHER if geometry else GEOMETRY_NONE
+            if geometry:
+                record['g'] = geometry
+        else:
+            types[index] = geometry_type
+            polygons = geometry.get('coordinates') or []
+            if geometry_type == GEOMETRY_POLYGON:
+                polygons = [polygons]
+            extra_dimensions = False
+            for polygon in polygons:
+                for ring in polygon:
+                    ring = np.asarray(ring, dtype=np.float64) if len(ring) else np.empty((0, 2))
+                    extra_dimensions = extra_dimensions or ring.shape[1] > 2
+                    coords.append(ring[:, :2])
+                    ring_offsets.append(ring_offsets[-1] + len(ring))
+                polygon_offsets.append(len(ring_offsets) - 1)
+            if extra_dimensions:
+                record['g'] = geometry
+        feature_offsets.append(len(polygon_offsets) - 1)
+        records.append(record)
+
+    coords = np.concatenate(coords) if coords else np.empty((0, 2))
+    meta = json.dumps({
+        'top': {k: v for k, v in data.items() if k != 'features'},
+        'features': records
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    n_polygons, n_rings, n_coords = len(polygon_offsets) - 1, len(ring_offsets) - 1, len(coords)
+    layout, meta_offset = _sections(len(features), n_polygons, n_rings, n_coords)
+    buffer = bytearray(meta_offset + len(meta))
+    HEADER.pack_into(buffer, 0, MAGIC, FORMAT_VERSION, source_signature[0], source_signature[1],
+                     len(features), n_polygons, n_rings, n_coords, meta_offset, len(meta))
+    arrays = (types, np.asarray(feature_offsets, dtype=np.int32), np.asarray(polygon_offsets, dtype=np.int32),
+              np.asarray(ring_offsets, dtype=np.int32), coords.reshape(-1))
+    for (offset, dtype, count), array in zip(layout, arrays):
+        raw = np.ascontiguousarray(array, dtype=dtype).tobytes()
+        buffer[offset:offset + len(raw)] = raw
+    buffer[meta_offset:] = meta
+    return bytes(buffer)
+
+
+def read_source_signature(path):
+    """读取二进制存储头部记录的源文件签名；文件不存在或格式不符时返回 None"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        magic, version, mtime_ns, size = HEADER.unpack(header)[:4]
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return (mtime_ns, size)
+
+
+class GeometryStore:
+    """二进制几何存储的只读视图；buffer 可以是 mmap 或内存中的 bytes"""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        (magic, version, mtime_ns, size, n_features, n_polygons, n_rings, n_coords,
+         meta_offset, meta_length) = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('几何存储文件格式不匹配')
+        self.source_signature = (mtime_ns, size)
+        layout, _ = _sections(n_features, n_polygons, n_rings, n_coords)
+        arrays = [np.frombuffer(buffer, dtype=dtype, count=count, offset=offset) for offset, dtype, count in layout]
+        self.types, self.feature_offsets, self.polygon_offsets, self.ring_offsets, coords = arrays
+        self.coords = coords.reshape(-1, 2)
+        meta = json.loads(bytes(buffer[meta_offset:meta_offset + meta_length]).decode('utf-8'))
+        self.top = meta['top']
+        self.records = meta['features']
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer)
+
+    def __len__(self):
+        return len(self.types)
+
+    def polygons(self, index):
+        """要素的多边形列表，每个环为 n×2 float64 数组（共享坐标数组上的视图，不常驻内存）"""
+        geometry_type = self.types[index]
+        if geometry_type not in (GEOMETRY_POLYGON, GEOMETRY_MULTIPOLYGON):
+            return None
+        rings = self.ring_offsets
+        polygons = []
+        for p in range(self.feature_offsets[index], self.feature_offsets[index + 1]):
+            polygons.append([self.coords[rings[r]:rings[r + 1]]
+                             for r in range(self.polygon_offsets[p], self.polygon_offsets[p + 1])])
+        return polygons
+
+    def geometry(self, index):
+        geometry_type = self.types[index]
+        if 'g' in self.records[index]:
+            # 非面几何，或带第三维坐标的面几何（原样保存）
+            return self.records[index]['g']
+        if geometry_type == GEOMETRY_POLYGON:
+            return {'type': 'Polygon', 'coordinates': self.polygons(index)[0]}
+        if geometry_type == GEOMETRY_MULTIPOLYGON:
+            return {'type': 'MultiPolygon', 'coordinates': self.polygons(index)}
+        return None
+
+    def feature(self, index):
+        record = self.records[index]
+        feature = {'type': 'Feature', 'properties': record.get('p'), 'geometry': self.geometry(index)}
+        if 'id' in record:
+            feature['id'] = record['id']
+        return feature
+
+    def feature_bboxes(self):
+        """每个要素全部坐标的外包矩形，n×4（无几何为 NaN），一次向量化计算"""
+        bboxes = np.full((len(self), 4), np.nan)
+        starts = self.ring_offsets[self.polygon_offsets[self.feature_offsets[:-1]]]
+        ends = self.ring_offsets[self.polygon_offsets[self.feature_offsets[1:]]]
+        has_coords = ends > starts
+        if has_coords.any():
+            # 每个要素的坐标在文件中连续存放；reduceat 以下一个起点为区间终点，
+            # 最后一个有效要素之后不会再有坐标，因此区间恰好覆盖各要素自身
+            starts = starts[has_coords]
+            bboxes[has_coords, :2] = np.minimum.reduceat(self.coords, starts)
+            bboxes[has_coords, 2:] = np.maximum.reduceat(self.coords, starts)
+        return bboxes
+
+
+class FeatureSequence(Sequence):
+    """按需生成要素字典，接口与 GeoJSON 的 features 列表一致"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._store.feature(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._store.feature(index)
+
+
+_build_lock = threading.Lock()
+
+
+def load_geometry_store(source_path, signature, store_path):
+    """打开与源文件签名一致的二进制存储；不存在或已过期时从 GeoJSON 重新生成
+
+    目标目录不可写时退回到内存中的存储（仍比解析后的 GeoJSON 对象紧凑得多）。
+    """
+    if read_source_signature(store_path) == signature:
+        return GeometryStore.open(store_path)
+    with _build_lock:
+        if read_source_signature(store_path) == signature:
+            return GeometryStore.open(store_path)
+        with open(source_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        encoded = encode_geometry_store(data, signature)
+        del data
+        temp_path = f'{store_path}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(encoded)
+                f.flush()
+                os.fsync(f.fileno())
+            # 原子替换，其它 worker 要么看到旧文件，要么看到完整的新文件
+            os.replace(temp_path, store_path)
+        except OSError as e:
+            print(f"写入几何存储文件失败，使用内存存储: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return GeometryStore(encoded)
+    return GeometryStore.open(store_path)
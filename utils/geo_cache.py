@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+GeoJSON 解析与序列化缓存
+
+中国_县.geojson 只在文件 mtime/size 变化时转换一次为内存映射的二进制几何存储（见 geo_binary），
+多个 worker 进程共享同一份坐标数据；每种输出形式（完整数据、后续的简化/裁剪等变体）只序列化一次，
+并同时保存原始字节与 gzip 字节以及 ETag，重复请求只需比较 ETag 或直接发送缓存字节。
+"""
+import collections
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.geo_assets import find_geo_assets, open_geometry_store, preload_dataset
+from utils.geo_binary import FeatureSequence, load_geometry_store
+from utils.geo_simplify import SIMPLIFY_LEVELS, simplify_arcs, simplify_features
+from utils.geo_meta import build_meta_table
+from utils.geo_topology import Topology
+from utils.spatial_index import CountyIndex
+
+# 缓存的视口查询响应数（全国视口的完整精度响应可达数十 MB，因此只保留少量）
+VIEWPORT_CACHE_SIZE = 16
+
+
+def _json_default(obj):
+    # 几何存储解码出的坐标为 NumPy 数组
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def encode_json(obj):
+    """紧凑 JSON 编码（不转义中文），用于所有预编码的响应体"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+
+def geometry_store_path(path):
+    """GeoJSON 文件对应的二进制几何存储文件（与源文件放在一起）"""
+    return os.path.splitext(path)[0] + '.geobin'
+
+
+class EncodedPayload:
+    """一份已编码好的响应体：原始字节、gzip 字节、ETag 与最后修改时间
+
+    gzip 字节在第一次有客户端接受 gzip 时才压缩并缓存。etag 可由调用方给出
+    （内容由少量参数唯一确定时，免去对整个响应体做哈希）。
+    """
+    __slots__ = ('body', '_gzip_body', '_gzip_lock', 'etag', 'last_modified', 'mimetype')
+
+    def __init__(self, body, last_modified, mimetype='application/json', etag=None):
+        self.body = body
+        self._gzip_body = None
+        self._gzip_lock = threading.Lock()
+        self.etag = etag or hashlib.sha1(body).hexdigest()
+        self.last_modified = last_modified
+        self.mimetype = mimetype
+
+    @property
+    def gzip_body(self):
+        gzip_body = self._gzip_body
+        if gzip_body is None:
+            with self._gzip_lock:
+                gzip_body = self._gzip_body
+                if gzip_body is None:
+                    gzip_body = gzip.compress(self.body, compresslevel=6)
+                    self._gzip_body = gzip_body
+        return gzip_body
+
+
+class GeoDataset:
+    """某一版本 GeoJSON 文件的几何存储及其派生的各种编码变体"""
+
+    def __init__(self, path, signature, store):
+        self.path = path
+        self.signature = signature
+        self.store = store
+        self._features = FeatureSequence(store)
+        self.last_modified = datetime.fromtimestamp(signature[0] / 1e9, tz=timezone.utc)
+        self._variants = {}
+        self._derived = {}
+        self._viewports = collections.OrderedDict()
+        # 变体的生成过程可能依赖派生结构（如简化依赖拓扑），因此使用可重入锁
+        self._lock = threading.RLock()
+
+    @property
+    def tag(self):
+        """文件版本标识，用于区分磁盘缓存目录"""
+        return f'{self.signature[0]:x}-{self.signature[1]:x}'
+
+    @property
+    def features(self):
+        """按需从几何存储生成的要素序列（不常驻内存）"""
+        return self._features
+
+    def derived(self, key, build):
+        """缓存由本版本数据派生的中间结构（拓扑、索引等），首次访问时调用 build() 生成"""
+        value = self._derived.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            value = self._derived.get(key)
+            if value is None:
+                value = build()
+                self._derived[key] = value
+        return value
+
+    def latest(self, key, version, build):
+        """与 derived 类似，但只保留最近一个 version 的结果，version 变化（如县总代数据更新）时重建"""
+        entry = self._derived.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            entry = self._derived.get(key)
+            if entry is None or entry[0] != version:
+                entry = (version, build())
+                self._derived[key] = entry
+        return entry[1]
+
+    def topology(self):
+        return self.derived('topology', lambda: Topology.from_features(self.features))
+
+    def simplified_arcs(self, level):
+        """预设简化级别下的共享弧段（level 为 None 时返回原始弧段）"""
+        if level is None:
+            return self.topology().arcs
+        tolerance = SIMPLIFY_LEVELS[level][1]
+        return self.derived(('simplified_arcs', level), lambda: simplify_arcs(self.topology(), tolerance))
+
+    def simplified_features(self, level):
+        """预设简化级别下的要素序列（level 为 None 时返回原始要素），几何在访问时由简化弧段拼出"""
+        if level is None:
+            return self.features
+        tolerance = SIMPLIFY_LEVELS[level][1]
+        return self.derived(('simplified', level), lambda: simplify_features(
+            self.features, self.topology(), tolerance, self.simplified_arcs(level)))
+
+    def encoded_features(self, level):
+        """每个要素单独预编码的 JSON 字节，用于按范围/省份拼接响应体而无需重新序列化"""
+        return self.derived(('encoded_features', level),
+                            lambda: [encode_json(feature) for feature in self.simplified_features(level)])
+
+    def feature_collection(self, indices, level):
+        """由预编码片段拼接出只包含指定要素的 FeatureCollection 字节（indices 为 None 时包含全部要素）"""
+        if indices is None:
+            indices = range(len(self.features))
+        encoded = self.encoded_features(level)
+        return b'{"type":"FeatureCollection","features":[' + b','.join(encoded[i] for i in indices) + b']}'
+
+    def viewport(self, indices, level):
+        """视口查询（/api/geojson?bbox=）的响应：按 (简化级别, 要素下标) 缓存最近的 VIEWPORT_CACHE_SIZE 个
+
+        ETag 由文件版本、级别与要素下标确定，不对响应体做哈希。
+        """
+        key = (level, tuple(indices))
+        with self._lock:
+            payload = self._viewports.get(key)
+            if payload is not None:
+                self._viewports.move_to_end(key)
+                return payload
+        etag = hashlib.sha1(repr((self.tag, key)).encode('utf-8')).hexdigest()
+        payload = EncodedPayload(self.feature_collection(key[1], level), self.last_modified, etag=etag)
+        with self._lock:
+            self._viewports[key] = payload
+            self._viewports.move_to_end(key)
+            while len(self._viewports) > VIEWPORT_CACHE_SIZE:
+                self._viewports.popitem(last=False)
+        return payload
+
+    def feature_bboxes(self):
+        """每个要素的外包矩形，n×4 数组 [minx, miny, maxx, maxy]；无几何的要素为 NaN"""
+        return self.derived('feature_bboxes', self.store.feature_bboxes)
+
+    def spatial_index(self):
+        """县级面要素的网格空间索引"""
+        return self.derived('spatial_index', lambda: CountyIndex(self.features, self.feature_bboxes()))
+
+    def meta_table(self):
+        """每个要素的外包矩形、质心、面积与标注点（见 geo_meta）"""
+        # 标注点在最精细的简化级别上搜索
+        finest = len(SIMPLIFY_LEVELS) - 1
+        return self.derived('meta_table', lambda: build_meta_table(
+            self.features, self.simplified_features(finest)))
+
+    def variant(self, key, build, mimetype='application/json'):
+        """返回以 key 缓存的编码变体；首次访问时调用 build() 生成（返回对象或 bytes）"""
+        payload = self._variants.get(key)
+        if payload is not None:
+            return payload
+        with self._lock:
+            payload = self._variants.get(key)
+            if payload is None:
+                obj = build()
+                body = obj if isinstance(obj, bytes) else encode_json(obj)
+                payload = EncodedPayload(body, self.last_modified, mimetype)
+                self._variants[key] = payload
+        return payload
+
+    def full(self):
+        def build():
+            # 顶层其它成员原样保留；要素逐个编码拼接，不构造完整的 GeoJSON 对象
+            head = encode_json(dict(self.store.top, features=[]))[:-2]
+            return head + b','.join(encode_json(feature) for feature in self.features) + b']}'
+        return self.variant('full', build)
+
+
+class GeoJSONCache:
+    """按文件签名（mtime, size）缓存 GeoDataset，文件变化后自动重建
+
+    asset_root_getter 返回离线预处理产物的根目录（见 geo_assets）；存在与 GeoJSON 内容一致的产物时
+    直接使用其几何存储与预计算结果。
+    """
+
+    def __init__(self, path_getter, asset_root_getter=None):
+        self._path_getter = path_getter
+        self._asset_root_getter = asset_root_getter
+        self._dataset = None
+        self._lock = threading.Lock()
+
+    def dataset(self):
+        path = self._path_getter()
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        dataset = self._dataset
+        if dataset is not None and dataset.path == path and dataset.signature == signature:
+            return dataset
+        with self._lock:
+            dataset = self._dataset
+            if dataset is None or dataset.path != path or dataset.signature != signature:
+                assets = find_geo_assets(self._asset_root_getter(), path) if self._asset_root_getter else None
+                if assets:
+                    dataset = GeoDataset(path, signature, open_geometry_store(assets))
+                    preload_dataset(dataset, assets)
+                else:
+                    store = load_geometry_store(path, signature, geometry_store_path(path))
+                    dataset = GeoDataset(path, signature, store)
+                self._dataset = dataset
+        return dataset
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+县级面按市、省融合（dissolve）
+
+基于共享弧段拓扑：同一分组内被两个县共用的弧段是内部边界，直接去掉；
+其余弧段首尾相接拼成新的外环/内环。省份优先取 GeoJSON 属性中的省字段，其次取要素自身的
+行政区划代码前两位（GB/T 2260），都没有时才按县名匹配县总代数据；市取属性中的市字段，
+没有时取同省的县总代记录。县名只用来补充要素自身无法确定的部分，不会覆盖代码给出的省份。
+"""
+import unicodedata
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from utils.geo_topology import stitch_ring
+from utils.spatial_index import points_in_edges
+
+DISSOLVE_LEVELS = ('province', 'city')
+
+PROVINCE_KEYS = ('province', 'province_name', '省', '省份', 'pname')
+CITY_KEYS = ('city', 'city_name', '市', '城市', 'cname')
+CODE_KEYS = ('gb', 'adcode', 'code', 'GB')
+
+# 行政区划代码前两位 -> 省级行政区（GB/T 2260）
+PROVINCE_NAMES = {
+    '11': '北京市', '12': '天津市', '13': '河北省', '14': '山西省', '15': '内蒙古自治区',
+    '21': '辽宁省', '22': '吉林省', '23': '黑龙江省',
+    '31': '上海市', '32': '江苏省', '33': '浙江省', '34': '安徽省', '35': '福建省', '36': '江西省', '37': '山东省',
+    '41': '河南省', '42': '湖北省', '43': '湖南省', '44': '广东省', '45': '广西壮族自治区', '46': '海南省',
+    '50': '重庆市', '51': '四川省', '52': '贵州省', '53': '云南省', '54': '西藏自治区',
+    '61': '陕西省', '62': '甘肃省', '63': '青海省', '64': '宁夏回族自治区', '65': '新疆维吾尔自治区',
+    '71': '台湾省', '81': '香港特别行政区', '82': '澳门特别行政区'
+}
+
+# 直辖市：县级要素的市即省
+MUNICIPALITY_CODES = ('11', '12', '31', '50')
+
+# 省、市名比较时去掉的后缀（长的在前）
+_REGION_SUFFIXES = ('维吾尔自治区', '壮族自治区', '回族自治区', '特别行政区', '自治区', '自治州', '地区', '省', '市', '盟')
+
+
+def normalize_name(name):
+    return ''.join(unicodedata.normalize('NFKC', str(name or '')).split())
+
+
+def normalize_region(name):
+    name = normalize_name(name)
+    for suffix in _REGION_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+# 规范化省名 -> 标准全称，用于统一“北京”“北京市”等不同写法
+_PROVINCE_FULL_NAMES = {normalize_region(name): name for name in PROVINCE_NAMES.values()}
+
+
+def first_property(properties, keys):
+    for key in keys:
+        value = properties.get(key)
+        if value:
+            return str(value).strip()
+    return ''
+
+
+def admin_code(properties):
+    """行政区划代码（6位）。天地图数据的 gb 字段带有 156 国家码前缀"""
+    code = ''.join(ch for ch in first_property(properties, CODE_KEYS) if ch.isdigit())
+    if len(code) == 9 and code.startswith('156'):
+        code = code[3:]
+    return code if len(code) >= 6 else ''
+
+
+def canonical_province(name):
+    """省名的标准全称（不在 GB/T 2260 表中的名称原样返回）"""
+    return _PROVINCE_FULL_NAMES.get(normalize_region(name), str(name or '').strip())
+
+
+def feature_province(properties):
+    """要素自身可确定的省份（属性中的省字段，其次行政区划代码），无法确定时为空字符串"""
+    province = first_property(properties, PROVINCE_KEYS)
+    if not province:
+        province = PROVINCE_NAMES.get(admin_code(properties)[:2], '')
+    return province
+
+
+def feature_hierarchy(features, county_lookup):
+    """每个要素所属的 (省, 市)：省份无法确定时为 None，市无法确定时为 (省, None)
+
+    county_lookup(要素下标, 省) 返回该要素对应的县总代记录的 (省, 市) 或 None；省份已由要素自身确定时
+    只接受同省的记录，且只用来补充市。
+    """
+    hierarchy = []
+    for index, feature in enumerate(features):
+        properties = feature.get('properties') or {}
+        province = feature_province(properties)
+        city = first_property(properties, CITY_KEYS)
+        if not city and admin_code(properties)[:2] in MUNICIPALITY_CODES:
+            city = PROVINCE_NAMES[admin_code(properties)[:2]]
+        if not province or not city:
+            found = county_lookup(index, province)
+            if found and (not province or normalize_region(found[0]) == normalize_region(province)):
+                province = province or found[0]
+                city = city or found[1]
+        if not province:
+            hierarchy.append(None)
+            continue
+        province = canonical_province(province)
+        hierarchy.append((province, city or None))
+    return hierarchy
+
+
+def _ring_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2.0
+
+
+def _reverse_refs(refs):
+    return [~ref for ref in reversed(refs)]
+
+
+def _oriented_rings(topology, index):
+    """要素各环的弧段引用，统一为外环逆时针、内环顺时针，使相邻县的公共弧段方向相反"""
+    _, polygons = topology.geometries[index]
+    rings = []
+    for polygon in polygons:
+        for k, refs in enumerate(polygon):
+            area = _ring_area(stitch_ring(topology.arcs, refs))
+            if (k == 0) != (area > 0):
+                refs = _reverse_refs(refs)
+            rings.append(refs)
+    return rings
+
+
+def _chain_rings(refs, arcs):
+    """把边界弧段首尾相接拼成闭合环"""
+    def endpoints(ref):
+        arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        return tuple(arc[0]), tuple(arc[-1])
+
+    outgoing = defaultdict(list)
+    for ref in refs:
+        outgoing[endpoints(ref)[0]].append(ref)
+    used = set()
+    rings = []
+    for ref in refs:
+        if ref in used:
+            continue
+        used.add(ref)
+        chain = [ref]
+        start, current = endpoints(ref)
+        while current != start:
+            following = next((r for r in outgoing.get(current, ()) if r not in used), None)
+            if following is None:
+                break
+            used.add(following)
+            chain.append(following)
+            current = endpoints(following)[1]
+        if current == start:
+            ring = stitch_ring(arcs, chain)
+            if len(ring) >= 4:
+                rings.append(ring)
+    return rings
+
+
+def _assemble_polygons(rings):
+    """按方向区分外环与内环，并把内环分配给包含它的最小外环"""
+    outers = [ring for ring in rings if _ring_area(ring) > 0]
+    holes = [ring for ring in rings if _ring_area(ring) < 0]
+    outers.sort(key=_ring_area)
+    polygons = [[outer] for outer in outers]
+    edges = [np.hstack((outer, np.roll(outer, -1, axis=0))) for outer in outers]
+    for hole in holes:
+        for polygon, outer_edges in zip(polygons, edges):
+            if points_in_edges(outer_edges, hole[:1, 0], hole[:1, 1])[0]:
+                polygon.append(hole)
+                break
+    return [[ring.tolist() for ring in polygon] for polygon in polygons]
+
+
+def dissolve(topology, arcs, groups):
+    """groups 与要素一一对应（分组键或 None），返回 {分组键: MultiPolygon 坐标}
+
+    arcs 可以是简化后的弧段（与 topology.arcs 一一对应、首尾点不变）。
+    """
+    members = defaultdict(list)
+    for index, key in enumerate(groups):
+        if key is not None and topology.geometries[index] is not None:
+            members[key].append(index)
+
+    dissolved = {}
+    for key, indices in members.items():
+        rings = [refs for index in indices for refs in _oriented_rings(topology, index)]
+        counts = Counter(ref if ref >= 0 else ~ref for refs in rings for ref in refs)
+        boundary = [ref for refs in rings for ref in refs if counts[ref if ref >= 0 else ~ref] == 1]
+        polygons = _assemble_polygons(_chain_rings(boundary, arcs))
+        if polygons:
+            dissolved[key] = polygons
+    return dissolved
+
+
+def build_dissolved_features(dissolved, level, coverage):
+    """coverage: {分组键: (县数量, 已有县总代数量)}"""
+    features = []
+    for key in sorted(dissolved):
+        province, city = key if level == 'city' else (key, None)
+        total, covered = coverage.get(key, (0, 0))
+        properties = {
+            'name': city if level == 'city' else province,
+            'level': level,
+            'province': province,
+            'county_count': total,
+            'covered_count': covered,
+            'coverage': round(covered / total, 4) if total else 0.0
+        }
+        features.append({
+            'type': 'Feature',
+            'properties': properties,
+            'geometry': {'type': 'MultiPolygon', 'coordinates': dissolved[key]}
+        })
+    return features
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+县级要素元数据：外包矩形、质心、面积、标注点
+
+每个 GeoJSON 版本只计算一次，输出为紧凑的表格（字段名 + 行数组），
+前端无需下载或遍历多边形即可缩放定位、放置标注。
+"""
+import math
+
+import numpy as np
+
+from utils.geo_topology import geometry_polygons
+from utils.spatial_index import points_in_edges
+
+META_FIELDS = ['index', 'name', 'minx', 'miny', 'maxx', 'maxy', 'cx', 'cy', 'area_km2', 'lx', 'ly']
+
+EARTH_RADIUS_KM = 6371.0088
+
+# 标注点搜索：初始网格边长与每轮细化的网格边长、细化轮数
+_LABEL_GRID = 12
+_REFINE_GRID = 6
+_REFINE_ROUNDS = 3
+
+
+def _ring_array(ring):
+    ring = np.asarray(ring, dtype=np.float64)[:, :2]
+    if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+        ring = ring[:-1]
+    return ring
+
+
+def _signed_area_and_centroid(ring):
+    """平面（经纬度）多边形的有向面积与质心"""
+    x, y = ring[:, 0], ring[:, 1]
+    xn, yn = np.roll(x, -1), np.roll(y, -1)
+    cross = x * yn - xn * y
+    area = cross.sum() / 2.0
+    if area == 0:
+        return 0.0, ring.mean(axis=0)
+    cx = ((x + xn) * cross).sum() / (6.0 * area)
+    cy = ((y + yn) * cross).sum() / (6.0 * area)
+    return float(area), np.array([cx, cy])
+
+
+def _ring_area_km2(ring):
+    """正弦（等积）投影下的环面积，平方公里"""
+    lat = np.radians(ring[:, 1])
+    x = np.radians(ring[:, 0]) * np.cos(lat) * EARTH_RADIUS_KM
+    y = lat * EARTH_RADIUS_KM
+    return abs(float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))) / 2.0
+
+
+def _edges(rings):
+    return np.concatenate([np.hstack((ring, np.roll(ring, -1, axis=0))) for ring in rings])
+
+
+def _signed_distances(edges, points):
+    """点到多边形边界的距离，面内为正、面外为负"""
+    x1, y1 = edges[:, 0], edges[:, 1]
+    dx, dy = edges[:, 2] - x1, edges[:, 3] - y1
+    length2 = dx * dx + dy * dy
+    px, py = points[:, 0:1], points[:, 1:2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(((px - x1) * dx + (py - y1) * dy) / length2, 0.0, 1.0)
+    t = np.nan_to_num(t)
+    distance = np.hypot(px - (x1 + t * dx), py - (y1 + t * dy)).min(axis=1)
+    inside = points_in_edges(edges, points[:, 0], points[:, 1])
+    return np.where(inside, distance, -distance)
+
+
+def label_point(rings, centroid):
+    """近似的“最远离边界”点（polylabel 思路的网格逐级细化版），保证落在面内"""
+    edges = _edges(rings)
+    outer = rings[0]
+    lower, upper = outer.min(axis=0), outer.max(axis=0)
+    size = upper - lower
+    if not (size > 0).all():
+        return outer[0]
+
+    xs = lower[0] + (np.arange(_LABEL_GRID) + 0.5) * size[0] / _LABEL_GRID
+    ys = lower[1] + (np.arange(_LABEL_GRID) + 0.5) * size[1] / _LABEL_GRID
+    candidates = np.vstack((np.array(np.meshgrid(xs, ys)).reshape(2, -1).T, centroid))
+    scores = _signed_distances(edges, candidates)
+    best = candidates[int(np.argmax(scores))]
+    best_score = scores.max()
+
+    step = size / _LABEL_GRID
+    for _ in range(_REFINE_ROUNDS):
+        offsets = (np.arange(_REFINE_GRID) + 0.5) / _REFINE_GRID - 0.5
+        xs = best[0] + offsets * step[0] * 2
+        ys = best[1] + offsets * step[1] * 2
+        candidates = np.array(np.meshgrid(xs, ys)).reshape(2, -1).T
+        scores = _signed_distances(edges, candidates)
+        if scores.max() > best_score:
+            best_score = scores.max()
+            best = candidates[int(np.argmax(scores))]
+        step = step * 2 / _REFINE_GRID
+    if best_score <= 0:
+        # 极窄的面在网格上取不到内点时，退回到外环上的顶点
+        return outer[0]
+    return best
+
+
+def _largest_polygon(feature):
+    best, best_area = None, -1.0
+    for polygon in geometry_polygons(feature.get('geometry')) or ():
+        rings = [_ring_array(ring) for ring in polygon]
+        rings = [ring for ring in rings if len(ring) >= 3]
+        if rings:
+            area = abs(_signed_area_and_centroid(rings[0])[0])
+            if area > best_area:
+                best, best_area = rings, area
+    return best
+
+
+def feature_meta(feature, label_feature=None):
+    """单个要素的元数据；非面要素返回 None
+
+    label_feature 为同一要素的简化几何，标注点在其上搜索以降低计算量（标注点无需全精度边界）。
+    """
+    polygons = geometry_polygons(feature.get('geometry'))
+    if not polygons:
+        return None
+
+    total_area = 0.0
+    weighted = np.zeros(2)
+    area_km2 = 0.0
+    largest, largest_area = None, -1.0
+    lower, upper = np.full(2, np.inf), np.full(2, -np.inf)
+    for polygon in polygons:
+        rings = [_ring_array(ring) for ring in polygon]
+        rings = [ring for ring in rings if len(ring) >= 3]
+        if not rings:
+            continue
+        polygon_area = 0.0
+        for index, ring in enumerate(rings):
+            area, centroid = _signed_area_and_centroid(ring)
+            # 内环面积取负，外环取正（与环的存储方向无关）
+            sign = 1.0 if index == 0 else -1.0
+            weighted += centroid * abs(area) * sign
+            polygon_area += abs(area) * sign
+            area_km2 += _ring_area_km2(ring) * sign
+        total_area += polygon_area
+        lower = np.minimum(lower, rings[0].min(axis=0))
+        upper = np.maximum(upper, rings[0].max(axis=0))
+        if polygon_area > largest_area:
+            largest, largest_area = rings, polygon_area
+    if largest is None:
+        return None
+
+    centroid = weighted / total_area if total_area > 0 else (lower + upper) / 2
+    if label_feature is not None:
+        largest = _largest_polygon(label_feature) or largest
+    label = label_point(largest, centroid)
+    return {
+        'bbox': [float(v) for v in (lower[0], lower[1], upper[0], upper[1])],
+        'centroid': [float(centroid[0]), float(centroid[1])],
+        'area_km2': area_km2,
+        'label': [float(label[0]), float(label[1])]
+    }
+
+
+def build_meta_table(features, label_features=None):
+    """全部要素的元数据表；行顺序与 /api/geojson 中的要素顺序一致"""
+    rows = []
+    lower, upper = [math.inf, math.inf], [-math.inf, -math.inf]
+    for index, feature in enumerate(features):
+        name = (feature.get('properties') or {}).get('name')
+        meta = feature_meta(feature, label_features[index] if label_features is not None else None)
+        if meta is None:
+            rows.append([index, name] + [None] * (len(META_FIELDS) - 2))
+            continue
+        minx, miny, maxx, maxy = meta['bbox']
+        lower = [min(lower[0], minx), min(lower[1], miny)]
+        upper = [max(upper[0], maxx), max(upper[1], maxy)]
+        rows.append([index, name,
+                     round(minx, 5), round(miny, 5), round(maxx, 5), round(maxy, 5),
+                     round(meta['centroid'][0], 5), round(meta['centroid'][1], 5),
+                     round(meta['area_km2'], 1),
+                     round(meta['label'][0], 5), round(meta['label'][1], 5)])
+    bbox = [round(v, 5) for v in lower + upper] if rows and lower[0] != math.inf else None
+    return {'fields': META_FIELDS, 'bbox': bbox, 'rows': rows}
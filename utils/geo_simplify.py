@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+按缩放级别简化县级边界
+
+在共享弧段（见 geo_topology）上执行 Douglas-Peucker 简化，相邻县的公共边界简化结果一致，
+保持拓扑不产生缝隙。只提供少量预设精度级别，每个级别在首次请求时生成并缓存。
+"""
+import math
+from collections.abc import Sequence
+
+import numpy as np
+
+from utils.geo_topology import stitch_ring
+
+# (适用的最大缩放级别, 简化容差/度)。容差约为对应缩放级别下半个像素的经纬度跨度
+SIMPLIFY_LEVELS = (
+    (4, 0.05),
+    (6, 0.01),
+    (8, 0.002),
+    (10, 0.0005),
+)
+
+
+def level_for_zoom(zoom):
+    """缩放级别 -> 简化级别下标；超过最细级别时返回 None（使用原始数据）"""
+    for index, (max_zoom, _) in enumerate(SIMPLIFY_LEVELS):
+        if zoom <= max_zoom:
+            return index
+    return None
+
+
+def level_for_tolerance(tolerance):
+    """容差 -> 不超过该容差的最粗预设级别；比所有级别都小时返回 None（使用原始数据）"""
+    for index, (_, level_tolerance) in enumerate(SIMPLIFY_LEVELS):
+        if level_tolerance <= tolerance:
+            return index
+    return None
+
+
+def douglas_peucker(points, tolerance):
+    """对 n×2 坐标数组做 Douglas-Peucker 简化，始终保留首尾点"""
+    n = len(points)
+    if n <= 2:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end <= start + 1:
+            continue
+        a = points[start]
+        segment = points[start + 1:end] - a
+        dx, dy = points[end] - a
+        length = math.hypot(dx, dy)
+        if length == 0.0:
+            # 闭合弧段首尾重合，退化为到该点的距离
+            distances = np.hypot(segment[:, 0], segment[:, 1])
+        else:
+            distances = np.abs(dx * segment[:, 1] - dy * segment[:, 0]) / length
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+def _round_arc(points, decimals):
+    points = np.round(points, decimals)
+    if len(points) > 2:
+        # 舍入后相邻重复点只保留一个（首尾点不受影响）
+        changed = np.any(points[1:] != points[:-1], axis=1)
+        points = points[np.concatenate(([True], changed))]
+    return points
+
+
+def simplify_arcs(topology, tolerance):
+    """逐条简化共享弧段；输出坐标只保留与容差相称的小数位，进一步缩小响应体"""
+    decimals = max(0, int(math.ceil(-math.log10(tolerance))) + 1)
+    return [_round_arc(douglas_peucker(arc, tolerance), decimals) for arc in topology.arcs]
+
+
+def simplify_geometry(geometry, arcs):
+    """由拓扑中的面几何 (类型, 弧段引用) 与简化后的弧段拼出 GeoJSON 几何；全部退化时返回 None"""
+    geometry_type, polygons = geometry
+    out_polygons = []
+    for rings in polygons:
+        out_rings = []
+        for index, refs in enumerate(rings):
+            ring = stitch_ring(arcs, refs)
+            if len(ring) < 4:
+                # 外环退化则整块面丢弃；内环退化只丢弃该内环
+                if index == 0:
+                    break
+                continue
+            out_rings.append(ring)
+        if out_rings:
+            out_polygons.append(out_rings)
+    if not out_polygons:
+        return None
+    if geometry_type == 'Polygon':
+        return {'type': 'Polygon', 'coordinates': out_polygons[0]}
+    return {'type': 'MultiPolygon', 'coordinates': out_polygons}
+
+
+class SimplifiedFeatures(Sequence):
+    """简化后的要素序列：属性和要素顺序不变，只替换面要素的几何
+
+    访问时才由简化后的共享弧段拼出几何（环为 NumPy 数组），不常驻整套要素字典；
+    需要反复输出的 JSON 由调用方按要素预编码缓存（GeoDataset.encoded_features）。
+    """
+
+    def __init__(self, features, topology, arcs):
+        self._features = features
+        self._topology = topology
+        self._arcs = arcs
+
+    def __len__(self):
+        return len(self._features)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        feature = self._features[index]
+        geometry = self._topology.geometries[index]
+        if geometry is None:
+            return feature
+        simplified = simplify_geometry(geometry, self._arcs)
+        # 整个县都小于容差时保留原始几何，避免要素从地图上消失
+        return feature if simplified is None else dict(feature, geometry=simplified)
+
+
+def simplify_features(features, topology, tolerance, arcs=None):
+    """返回简化后的要素序列（见 SimplifiedFeatures）"""
+    if arcs is None:
+        arcs = simplify_arcs(topology, tolerance)
+    return SimplifiedFeatures(features, topology, arcs)
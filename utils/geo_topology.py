@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+县级面要素的共享边（arc）拓扑
+
+相邻县的公共边界在 GeoJSON 中各存一份。这里把所有环在“连接点”处切分为弧段，
+相同（或方向相反）的弧段只保留一份，每个面改为引用弧段编号。
+弧段引用沿用 TopoJSON 约定：i 表示第 i 条弧正向，~i 表示反向。
+对弧段而不是对环做简化/量化，相邻县的公共边界会得到完全一致的结果，不会出现缝隙或重叠。
+"""
+import numpy as np
+
+
+def _ring_cycle(ring):
+    """环坐标 -> 去掉闭合点和连续重复点后的顶点元组列表"""
+    cycle = []
+    if not len(ring):
+        return cycle
+    # 整环一次转换为 Python 浮点，避免逐点访问 NumPy 数组
+    for x, y in np.asarray(ring, dtype=np.float64)[:, :2].tolist():
+        point = (x, y)
+        if not cycle or cycle[-1] != point:
+            cycle.append(point)
+    if len(cycle) > 1 and cycle[0] == cycle[-1]:
+        cycle.pop()
+    return cycle
+
+
+def geometry_polygons(geometry):
+    """Polygon / MultiPolygon 统一为多边形列表；其它类型返回 None"""
+    if not geometry:
+        return None
+    if geometry.get('type') == 'Polygon':
+        return [geometry.get('coordinates') or []]
+    if geometry.get('type') == 'MultiPolygon':
+        return geometry.get('coordinates') or []
+    return None
+
+
+class Topology:
+    """
+    arcs: 弧段坐标数组列表（每条为 n×2 的 float64 数组）
+    geometries: 与要素一一对应；面要素为 (类型, [[ring_arc_refs, ...], ...])，其它为 None
+    """
+
+    def __init__(self, arcs, geometries):
+        self.arcs = arcs
+        self.geometries = geometries
+
+    @classmethod
+    def from_features(cls, features):
+        polygons_per_feature = [geometry_polygons(f.get('geometry')) for f in features]
+
+        # 第一遍：同一顶点在不同位置出现时前后邻点不一致，即为连接点
+        neighbours = {}
+        junctions = set()
+        cycles_per_feature = []
+        for polygons in polygons_per_feature:
+            if polygons is None:
+                cycles_per_feature.append(None)
+                continue
+            feature_cycles = []
+            for polygon in polygons:
+                rings = []
+                for ring in polygon:
+                    cycle = _ring_cycle(ring)
+                    if len(cycle) < 3:
+                        continue
+                    n = len(cycle)
+                    for i, point in enumerate(cycle):
+                        prev_point, next_point = cycle[i - 1], cycle[(i + 1) % n]
+                        pair = (prev_point, next_point) if prev_point < next_point else (next_point, prev_point)
+                        seen = neighbours.get(point)
+                        if seen is None:
+                            neighbours[point] = pair
+                        elif seen != pair:
+                            junctions.add(point)
+                    rings.append(cycle)
+                if rings:
+                    feature_cycles.append(rings)
+            cycles_per_feature.append(feature_cycles)
+        del neighbours
+
+        # 第二遍：在连接点处切分并去重
+        arcs = []
+        arc_index = {}
+
+        def add_arc(points):
+            key = tuple(points)
+            ref = arc_index.get(key)
+            if ref is not None:
+                return ref
+            ref = arc_index.get(key[::-1])
+            if ref is not None:
+                return ~ref
+            ref = len(arcs)
+            arcs.append(np.array(points, dtype=np.float64))
+            arc_index[key] = ref
+            return ref
+
+        def ring_arcs(cycle):
+            cuts = [i for i, point in enumerate(cycle) if point in junctions]
+            if not cuts:
+                # 无连接点的独立环（海岛、飞地等）：从最小顶点开始，使正反两个方向都能被识别为同一条弧
+                start = cycle.index(min(cycle))
+                forward = cycle[start:] + cycle[:start]
+                return [add_arc(forward + forward[:1])]
+            rotated = cycle[cuts[0]:] + cycle[:cuts[0]]
+            offsets = [i - cuts[0] for i in cuts] + [len(cycle)]
+            rotated.append(rotated[0])
+            return [add_arc(rotated[offsets[k]:offsets[k + 1] + 1]) for k in range(len(cuts))]
+
+        geometries = []
+        for feature, feature_cycles in zip(features, cycles_per_feature):
+            if feature_cycles is None:
+                geometries.append(None)
+                continue
+            geometry_type = feature['geometry']['type']
+            geometries.append((geometry_type, [[ring_arcs(cycle) for cycle in rings] for rings in feature_cycles]))
+        return cls(arcs, geometries)
+
+
+def stitch_ring(arcs, refs):
+    """按弧段引用拼接出闭合环坐标数组"""
+    parts = []
+    for k, ref in enumerate(refs):
+        arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        parts.append(arc if k == 0 else arc[1:])
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+登录密码校验（/api/login）
+
+解密前端 AES 加密的密码并做 pbkdf2 校验需要数十毫秒 CPU，放在请求线程中会在集中登录时占满
+处理地图读取请求的线程。这里把校验交给独立的进程池，并限制同时排队与执行的校验数：
+超出时 submit 立即抛出 LoginVerifierBusy，由调用方返回 503，而不是让请求继续堆积。
+"""
+import base64
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from Crypto.Cipher import AES
+from Crypto.Hash import MD5
+from Crypto.Util.Padding import unpad
+from werkzeug.security import check_password_hash
+
+# 前端 CryptoJS 加密使用的密钥
+SECRET_KEY = "aiheli2023SecretKey"
+
+# 校验进程数与最多同时排队（含执行中）的校验数
+VERIFY_WORKERS = min(4, multiprocessing.cpu_count())
+VERIFY_MAX_PENDING = 32
+
+
+class LoginVerifierBusy(Exception):
+    """校验队列已满"""
+
+
+def decrypt_password(encrypted_password):
+    """解密前端传来的密码（base64），返回其中的 SHA256 哈希字符串"""
+    encrypted_data = base64.b64decode(encrypted_password)
+
+    # CryptoJS 的 Salted 格式: Salted__ + 8字节盐值 + 加密数据，密钥和IV由 EVP_BytesToKey 派生
+    if encrypted_data[:8] == b'Salted__':
+        salt_value = encrypted_data[8:16]
+        ciphertext = encrypted_data[16:]
+        key_iv = b""
+        while len(key_iv) < 32 + 16:  # 32字节密钥 + 16字节IV
+            h = MD5.new()
+            h.update(key_iv[-MD5.digest_size:] if key_iv else b"")
+            h.update(SECRET_KEY.encode('utf-8'))
+            h.update(salt_value)
+            key_iv += h.digest()
+        key = key_iv[:32]
+        iv = key_iv[32:32 + 16]
+    else:
+        # 旧格式: 前16字节为IV，密钥截断到 16/24/32 字节
+        key = SECRET_KEY.encode('utf-8')
+        if len(key) > 32:
+            key = key[:32]
+        elif len(key) > 24:
+            key = key[:24]
+        elif len(key) > 16:
+            key = key[:16]
+        iv = encrypted_data[:16]
+        ciphertext = encrypted_data[16:]
+
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    return unpad(cipher.decrypt(ciphertext), AES.block_size).decode('utf-8')
+
+
+def verify_login(password_hash, encrypted_password):
+    """在校验进程中执行，返回 (结果, 各阶段耗时毫秒)
+    结果: 'ok' 密码正确，'mismatch' 密码错误，'invalid' 无法解密（附带错误信息）
+    """
+    timings = {}
+    started = time.perf_counter()
+    try:
+        hashed_password = decrypt_password(encrypted_password)
+    except Exception as e:
+        timings['decrypt'] = (time.perf_counter() - started) * 1000
+        return ('invalid', str(e)), timings
+    decrypted = time.perf_counter()
+    timings['decrypt'] = (decrypted - started) * 1000
+    # 存储的是 密码+salt 的 SHA256 哈希值再做 pbkdf2，与前端传来的哈希值直接比较
+    matched = check_password_hash(password_hash, hashed_password)
+    timings['kdf'] = (time.perf_counter() - decrypted) * 1000
+    return ('ok' if matched else 'mismatch', None), timings
+
+
+class LoginVerifier:
+
+    def __init__(self, max_workers=VERIFY_WORKERS, max_pending=VERIFY_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _ensure_executor(self):
+        # 首次登录时才启动进程池，避免导入 app 时（包括校验进程自身导入时）创建进程
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, password_hash, encrypted_password):
+        """提交一次校验，返回 Future（结果见 verify_login）；队列已满时抛出 LoginVerifierBusy"""
+        if not self._slots.acquire(blocking=False):
+            raise LoginVerifierBusy()
+        try:
+            try:
+                future = self._ensure_executor().submit(verify_login, password_hash, encrypted_password)
+            except BrokenProcessPool:
+                # 校验进程异常退出后进程池不可再用，换一个新的进程池
+                self.shutdown()
+                future = self._ensure_executor().submit(verify_login, password_hash, encrypted_password)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+县总代数据的单写线程与组提交
+
+所有修改请求把操作提交到队列并等待各自的 Future；唯一的写线程每次取出当前排队的全部请求，
+合并为一次 apply_batch（CSV 引擎一次追加 + 一次 fsync，SQLite 引擎一个事务），
+落盘后再按请求拆分结果、完成各自的 Future。读请求不经过队列，不会被写入阻塞。
+on_commit(ops, results, before) 在写线程中按提交顺序调用（早于 Future 完成），用于发布变更通知、
+增量更新派生索引；before 为提交前的数据版本标识（signature）。
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+# 一次组提交最多合并的操作数
+MAX_GROUP_OPS = 2000
+
+
+class MutationQueue:
+
+    def __init__(self, storage, max_group_ops=MAX_GROUP_OPS, on_commit=None):
+        self._storage = storage
+        self._on_commit = on_commit
+        self.max_group_ops = max_group_ops
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        # 每次提交开始与结束（on_commit 之后）各加一：奇数表示有进行中的提交
+        self._generation = 0
+
+    @property
+    def generation(self):
+        """提交计数。读取数据前后两次取值相同且为偶数时，读到的数据不包含未完成 on_commit 的提交"""
+        return self._generation
+
+    def submit(self, ops):
+        """提交一组操作（格式见 agent_store.apply_mutation），返回 Future，结果为与 ops 对应的 (结果, 记录数) 列表"""
+        future = Future()
+        self._ensure_writer()
+        self._queue.put((list(ops), future))
+        return future
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name='agent-writer', daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            group = [self._queue.get()]
+            count = len(group[0][0])
+            # 把已经排队的请求并入同一次提交
+            while count < self.max_group_ops:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                group.append(item)
+                count += len(item[0])
+            self._generation += 1
+            try:
+                self._commit(group)
+            finally:
+                self._generation += 1
+
+    def _apply(self, ops):
+        before = self._storage.signature
+        results = self._storage.apply_batch(ops)
+        if self._on_commit is not None:
+            try:
+                self._on_commit(ops, results, before)
+            except Exception as e:
+                print(f"处理提交通知失败: {e}")
+        return results
+
+    def _commit(self, group):
+        group = [(ops, future) for ops, future in group if future.set_running_or_notify_cancel()]
+        if not group:
+            return
+        try:
+            results = self._apply([op for ops, _ in group for op in ops])
+        except Exception as e:
+            if len(group) == 1:
+                group[0][1].set_exception(e)
+                return
+            # 整组提交失败时逐个请求单独提交，避免一个请求的错误影响同组的其它请求
+            for ops, future in group:
+                try:
+                    future.set_result(self._apply(ops))
+                except Exception as single_error:
+                    future.set_exception(single_error)
+            return
+        offset = 0
+        for ops, future in group:
+            future.set_result(results[offset:offset + len(ops)])
+            offset += len(ops)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+服务端渲染的县总代覆盖图（/api/render.png）
+
+在 CPU 上用 NumPy 扫描线算法栅格化县级面要素：每个像素行中心与各条边求交，
+交点处的计数按行累加后取奇偶即为面内像素（奇偶规则，内环自动镂空）。
+先得到“要素编号栅格”，再按是否已有县总代着色并在相邻要素交界处描边，编码为调色板 PNG。
+投影与 Leaflet 一致（Web 墨卡托），返回图片可直接作为 imageOverlay 叠加在 bbox 上。
+"""
+import math
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.geo_topology import geometry_polygons
+
+RENDER_MAX_SIZE = 2048
+RENDER_DEFAULT_SIZE = 512
+
+# 调色板：0 透明背景、1 暂无县总代、2 已有县总代、3 县界（与前端图层样式一致）
+PALETTE = ((0, 0, 0), (0xbd, 0xc3, 0xc7), (0x27, 0xae, 0x60), (0xff, 0xff, 0xff))
+
+# 单次求交计算中 行数×边数 的上限，控制临时数组内存
+_MAX_PAIRS_PER_CHUNK = 4000000
+
+# Web 墨卡托的纬度上限
+_MAX_LATITUDE = 85.0511287798
+
+
+def mercator_y(lat):
+    lat = np.radians(np.clip(lat, -_MAX_LATITUDE, _MAX_LATITUDE))
+    return np.log(np.tan(np.pi / 4 + lat / 2))
+
+
+class PixelProjection:
+    """经纬度 -> 图片像素坐标（x 向右、y 向下）"""
+
+    def __init__(self, bbox, width, height):
+        minx, miny, maxx, maxy = bbox
+        self.minx = minx
+        self.top = float(mercator_y(maxy))
+        self.sx = width / (maxx - minx)
+        self.sy = height / (self.top - float(mercator_y(miny)))
+
+    def __call__(self, points):
+        x = (points[:, 0] - self.minx) * self.sx
+        y = (self.top - mercator_y(points[:, 1])) * self.sy
+        return np.column_stack((x, y))
+
+
+def _pixel_edges(geometry, project):
+    parts = []
+    for polygon in geometry_polygons(geometry) or ():
+        for ring in polygon:
+            ring = np.asarray(ring, dtype=np.float64)
+            if len(ring) < 3:
+                continue
+            ring = project(ring[:, :2])
+            parts.append(np.hstack((ring, np.roll(ring, -1, axis=0))))
+    return np.concatenate(parts) if parts else np.empty((0, 4))
+
+
+def fill_edges(raster, edges, value):
+    """扫描线填充：把 edges 围成的面（奇偶规则）内、像素中心落在面内的像素写为 value"""
+    height, width = raster.shape
+    if not len(edges):
+        return
+    x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    row_start = max(0, int(math.ceil(min(y1.min(), y2.min()) - 0.5)))
+    row_end = min(height, int(math.floor(max(y1.max(), y2.max()) - 0.5)) + 1)
+    if row_start >= row_end:
+        return
+    if max(x1.max(), x2.max()) < 0 or min(x1.min(), x2.min()) > width:
+        return
+
+    # 只保留非水平边；水平边不与任何行中心相交
+    sloped = y1 != y2
+    x1, y1, x2, y2 = x1[sloped], y1[sloped], x2[sloped], y2[sloped]
+    inverse_slope = (x2 - x1) / (y2 - y1)
+    step = max(1, _MAX_PAIRS_PER_CHUNK // max(1, len(x1)))
+    for start in range(row_start, row_end, step):
+        stop = min(row_end, start + step)
+        centers = np.arange(start, stop) + 0.5
+        rows, edge_ids = np.nonzero((y1 > centers[:, None]) != (y2 > centers[:, None]))
+        if not len(rows):
+            continue
+        crossing = x1[edge_ids] + (centers[rows] - y1[edge_ids]) * inverse_slope[edge_ids]
+        # 交点右侧第一个像素中心所在列；越界的交点夹到 [0, width]，不影响奇偶
+        columns = np.clip(np.ceil(crossing - 0.5), 0, width).astype(np.int64)
+        counts = np.zeros((stop - start, width + 1), dtype=np.int32)
+        np.add.at(counts, (rows, columns), 1)
+        inside = (np.cumsum(counts, axis=1)[:, :width] & 1).astype(bool)
+        raster[start:stop][inside] = value
+
+
+def rasterize(features, indices, bbox, width, height):
+    """要素编号栅格：0 为空白，k + 1 为第 k 个要素；后绘制的要素覆盖先绘制的"""
+    raster = np.zeros((height, width), dtype=np.int32)
+    project = PixelProjection(bbox, width, height)
+    for index in indices:
+        fill_edges(raster, _pixel_edges(features[index].get('geometry'), project), index + 1)
+    return raster
+
+
+def colorize(raster, statuses):
+    """statuses: {要素下标: 是否已有县总代}；返回调色板下标图像（uint8）"""
+    lookup = np.zeros(int(raster.max()) + 1, dtype=np.uint8)
+    for index, has_agent in statuses.items():
+        lookup[index + 1] = 2 if has_agent else 1
+    image = lookup[raster]
+    # 与右侧/下方像素属于不同要素的像素画为县界
+    border = np.zeros(raster.shape, dtype=bool)
+    border[:, :-1] |= raster[:, :-1] != raster[:, 1:]
+    border[:-1, :] |= raster[:-1, :] != raster[1:, :]
+    image[border & (raster > 0)] = 3
+    return image
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def encode_png(image, palette=PALETTE):
+    """调色板下标图像 -> 8 位索引色 PNG（下标 0 透明）"""
+    height, width = image.shape
+    rows = np.zeros((height, width + 1), dtype=np.uint8)
+    rows[:, 1:] = image
+    header = struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' +
+            _png_chunk(b'IHDR', header) +
+            _png_chunk(b'PLTE', bytes(value for color in palette for value in color)) +
+            _png_chunk(b'tRNS', b'\x00') +
+            _png_chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) +
+            _png_chunk(b'IEND', b''))
+
+
+def render_png(features, candidates, bbox, width, height, status_lookup):
+    """渲染 bbox 范围的覆盖图；返回 (PNG 字节, 图中可见的要素下标数组)
+
+    status_lookup(index, name) 返回该要素对应的县是否已有县总代。
+    """
+    raster = rasterize(features, candidates, bbox, width, height)
+    visible = np.unique(raster)
+    visible = visible[visible > 0] - 1
+    statuses = {}
+    for index in visible.tolist():
+        name = (features[index].get('properties') or {}).get('name') or ''
+        statuses[index] = bool(status_lookup(index, name))
+    return encode_png(colorize(raster, statuses)), visible
+
+
+class RenderCache:
+    """渲染结果的内存 LRU；每个条目记录图中可见的要素，县总代变更时只删除包含这些县的图片
+
+    put 需给出渲染所用县总代数据的版本，与缓存当前版本（_source）不一致时不缓存，
+    失效完成后不会再放入按旧数据渲染的图片。
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dataset_tag = None
+        self._source = None
+
+    def bind(self, dataset_tag):
+        """GeoJSON 版本变化时清空全部渲染结果"""
+        with self._lock:
+            if dataset_tag != self._dataset_tag:
+                self._entries.clear()
+                self._dataset_tag = dataset_tag
+
+    def sync_source(self, signature):
+        """县总代数据被外部修改（未经 invalidate_features）时清空全部渲染结果"""
+        with self._lock:
+            if signature != self._source:
+                self._entries.clear()
+                self._source = signature
+
+    def mark_source(self, signature):
+        with self._lock:
+            self._source = signature
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, visible, payload, signature):
+        with self._lock:
+            if signature != self._source:
+                return
+            self._entries[key] = (visible, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_features(self, indices):
+        """删除可见要素中包含任一 indices 的渲染结果"""
+        if not len(indices):
+            return
+        indices = np.asarray(indices, dtype=np.int64)
+        with self._lock:
+            stale = [key for key, (visible, _) in self._entries.items() if np.isin(visible, indices).any()]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+县级面要素的空间索引与点落区查询
+
+用均匀网格索引各县外包矩形，先按网格和外包矩形筛出候选县，再对候选县的全部边
+用 NumPy 向量化射线法（奇偶规则）判断点是否在面内。批量查询时同一个县的边只参与一次计算。
+"""
+import numpy as np
+
+from utils.geo_topology import geometry_polygons
+
+# 网格单元边长（度）。县级外包矩形通常只覆盖少数几个单元
+GRID_CELL_DEGREES = 0.25
+
+# 单次射线法计算中 点数×边数 的上限，控制临时数组内存
+_MAX_PAIRS_PER_CHUNK = 4000000
+
+
+def _feature_edges(geometry):
+    """面要素全部环（外环、内环、多个面）的边，n×4 数组 [x1, y1, x2, y2]"""
+    parts = []
+    for polygon in geometry_polygons(geometry) or ():
+        for ring in polygon:
+            ring = np.asarray(ring, dtype=np.float64)
+            if len(ring) < 3:
+                continue
+            ring = ring[:, :2]
+            following = np.roll(ring, -1, axis=0)
+            parts.append(np.hstack((ring, following)))
+    if not parts:
+        return np.empty((0, 4))
+    return np.concatenate(parts)
+
+
+def points_in_edges(edges, px, py):
+    """奇偶规则射线法：返回每个点是否落在由 edges 组成的面内"""
+    inside = np.zeros(len(px), dtype=bool)
+    if not len(edges) or not len(px):
+        return inside
+    x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    step = max(1, _MAX_PAIRS_PER_CHUNK // len(edges))
+    for start in range(0, len(px), step):
+        cx = px[start:start + step, None]
+        cy = py[start:start + step, None]
+        straddle = (y1 > cy) != (y2 > cy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (cy - y1) * (x2 - x1) / (y2 - y1)
+        crossings = np.count_nonzero(straddle & (cx < x_cross), axis=1)
+        inside[start:start + step] = crossings % 2 == 1
+    return inside
+
+
+class CountyIndex:
+    """基于均匀网格的县级面要素索引"""
+
+    def __init__(self, features, bboxes, cell=GRID_CELL_DEGREES):
+        self.features = features
+        self.bboxes = bboxes
+        self.cell = cell
+        valid = ~np.isnan(bboxes).any(axis=1)
+        if valid.any():
+            self.origin = bboxes[valid, :2].min(axis=0)
+            upper = bboxes[valid, 2:].max(axis=0)
+        else:
+            self.origin = upper = np.zeros(2)
+        self.columns, self.rows = (np.floor((upper - self.origin) / cell).astype(int) + 1).tolist()
+
+        cells = {}
+        for index in np.nonzero(valid)[0].tolist():
+            x0, y0 = self._cell_of(bboxes[index, 0], bboxes[index, 1])
+            x1, y1 = self._cell_of(bboxes[index, 2], bboxes[index, 3])
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    cells.setdefault(cx * self.rows + cy, []).append(index)
+        self._cells = {key: np.array(value, dtype=np.int32) for key, value in cells.items()}
+        self._edges = {}
+
+    def _cell_of(self, x, y):
+        cx = int((x - self.origin[0]) // self.cell)
+        cy = int((y - self.origin[1]) // self.cell)
+        return min(max(cx, 0), self.columns - 1), min(max(cy, 0), self.rows - 1)
+
+    def edges(self, index):
+        edges = self._edges.get(index)
+        if edges is None:
+            edges = _feature_edges(self.features[index].get('geometry'))
+            self._edges[index] = edges
+        return edges
+
+    def candidates(self, bbox):
+        """外包矩形与 bbox 相交的要素下标（升序）"""
+        minx, miny, maxx, maxy = bbox
+        x0, y0 = self._cell_of(minx, miny)
+        x1, y1 = self._cell_of(maxx, maxy)
+        found = [self._cells[key] for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)
+                 for key in (cx * self.rows + cy,) if key in self._cells]
+        if not found:
+            return np.empty(0, dtype=np.int32)
+        hits = np.unique(np.concatenate(found))
+        boxes = self.bboxes[hits]
+        keep = (boxes[:, 0] <= maxx) & (boxes[:, 2] >= minx) & (boxes[:, 1] <= maxy) & (boxes[:, 3] >= miny)
+        return hits[keep]
+
+    def locate(self, points):
+        """points: m×2 数组 [lng, lat]；返回每个点所在要素的下标，未命中为 -1"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        result = np.full(len(points), -1, dtype=np.int64)
+        if not len(points) or not self._cells:
+            return result
+        px, py = points[:, 0], points[:, 1]
+
+        # 网格范围外的点不可能命中
+        cx = np.floor((px - self.origin[0]) / self.cell)
+        cy = np.floor((py - self.origin[1]) / self.cell)
+        in_grid = (cx >= 0) & (cx < self.columns) & (cy >= 0) & (cy < self.rows)
+        cell_ids = np.where(in_grid, cx * self.rows + cy, -1).astype(np.int64)
+
+        # 生成 (点, 候选要素) 对
+        order = np.argsort(cell_ids, kind='stable')
+        unique_cells, starts = np.unique(cell_ids[order], return_index=True)
+        pair_points, pair_features = [], []
+        for cell_id, group in zip(unique_cells.tolist(), np.split(order, starts[1:])):
+            features = self._cells.get(cell_id) if cell_id >= 0 else None
+            if features is None:
+                continue
+            pair_points.append(np.repeat(group, len(features)))
+            pair_features.append(np.tile(features, len(group)))
+        if not pair_points:
+            return result
+        pair_points = np.concatenate(pair_points)
+        pair_features = np.concatenate(pair_features)
+
+        # 外包矩形过滤
+        boxes = self.bboxes[pair_features]
+        px_pairs, py_pairs = px[pair_points], py[pair_points]
+        keep = (boxes[:, 0] <= px_pairs) & (px_pairs <= boxes[:, 2]) & (boxes[:, 1] <= py_pairs) & (py_pairs <= boxes[:, 3])
+        pair_points, pair_features = pair_points[keep], pair_features[keep]
+
+        # 按要素分组，每个要素的边只做一次向量化射线法
+        order = np.argsort(pair_features, kind='stable')
+        pair_points, pair_features = pair_points[order], pair_features[order]
+        unique_features, starts = np.unique(pair_features, return_index=True)
+        for feature_index, group in zip(unique_features.tolist(), np.split(pair_points, starts[1:])):
+            group = group[result[group] < 0]
+            if not len(group):
+                continue
+            inside = points_in_edges(self.edges(feature_index), px[group], py[group])
+            result[group[inside]] = feature_index
+        return result
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+JWT 校验结果缓存与令牌撤销列表（token_required / /api/logout）
+
+VerifiedTokenCache 以令牌的 SHA256 摘要为键保存已通过签名校验的声明，容量有限（LRU），
+条目随令牌的 exp 一起失效，管理员连续编辑时同一令牌不必反复做 HMAC 校验与解码。
+TokenRevocationList 保存退出登录的令牌（按 jti）直到其原本的过期时间：查询为一次字典查找，
+过期条目按 exp 放入最小堆，每次写入或查询时从堆顶批量清除。
+两者都只保存在本进程内存中，不跨工作进程、不跨重启共享（见 README“管理员登录”）。
+"""
+import collections
+import hashlib
+import heapq
+import threading
+import time
+
+# 缓存的已校验令牌数
+VERIFIED_TOKEN_CACHE_SIZE = 1024
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+def token_id(claims, token):
+    """撤销列表中令牌的标识：jti，没有时使用令牌摘要"""
+    return claims.get('jti') or token_digest(token).hex()
+
+
+class VerifiedTokenCache:
+
+    def __init__(self, maxsize=VERIFIED_TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token, now=None):
+        """返回缓存的声明；未缓存、已过期或尚未生效时返回 None"""
+        now = time.time() if now is None else now
+        key = token_digest(token)
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is None:
+                return None
+            if now >= claims['exp']:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        if now < claims.get('nbf', 0):
+            return None
+        return claims
+
+    def put(self, token, claims):
+        key = token_digest(token)
+        with self._lock:
+            self._entries[key] = claims
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token_digest(token), None)
+
+
+class TokenRevocationList:
+
+    def __init__(self):
+        # 令牌标识 -> 过期时间
+        self._revoked = {}
+        # (过期时间, 令牌标识) 最小堆
+        self._expiry = []
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, exp):
+        with self._lock:
+            self._evict(time.time())
+            if exp > self._revoked.get(jti, 0):
+                self._revoked[jti] = exp
+                heapq.heappush(self._expiry, (exp, jti))
+
+    def is_revoked(self, jti):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            exp = self._revoked.get(jti)
+        return exp is not None and now < exp
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def _evict(self, now):
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            exp, jti = heapq.heappop(expiry)
+            # 同一令牌重复撤销时堆中可能留有较早的过期时间，以字典中的为准
+            if self._revoked.get(jti) == exp:
+                del self._revoked[jti]
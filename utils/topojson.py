@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+GeoJSON -> TopoJSON 转换
+
+基于 geo_topology 的共享弧段：公共边界只存一份，坐标按 transform 量化为整数并做差分编码，
+输出格式与 topojson-client 兼容（对象名为 counties）。
+"""
+import numpy as np
+
+TOPOJSON_OBJECT = 'counties'
+
+# 原始精度下的量化网格数；简化级别按容差换算，保证量化误差远小于简化误差
+FULL_QUANTIZATION = 1000000
+
+
+def quantization_for_tolerance(extent, tolerance):
+    return int(min(FULL_QUANTIZATION, max(1000, np.ceil(extent / (tolerance / 4)))))
+
+
+def _quantize_arc(arc, translate, scale):
+    points = np.rint((arc - translate) / scale).astype(np.int64)
+    if len(points) > 2:
+        # 量化后重合的相邻点只保留一个（弧段首尾点保持不变，保证拼接一致）
+        changed = np.any(points[1:] != points[:-1], axis=1)
+        changed[-1] = True
+        points = points[np.concatenate(([True], changed))]
+    deltas = points.copy()
+    deltas[1:] -= points[:-1]
+    return deltas.tolist()
+
+
+def build_topojson(features, topology, arcs, tolerance=None):
+    """arcs 与 topology.arcs 一一对应（可以是简化后的弧段）；tolerance 为 None 时按原始精度量化"""
+    valid = [arc for arc in arcs if len(arc)]
+    if valid:
+        points = np.concatenate(valid)
+        lower = points.min(axis=0)
+        upper = points.max(axis=0)
+    else:
+        lower = upper = np.zeros(2)
+    extent = float(max(upper[0] - lower[0], upper[1] - lower[1])) or 1.0
+    quantization = FULL_QUANTIZATION if tolerance is None else quantization_for_tolerance(extent, tolerance)
+    span = np.where(upper > lower, upper - lower, 1.0)
+    scale = span / (quantization - 1)
+
+    geometries = []
+    for feature, geometry in zip(features, topology.geometries):
+        out = {'properties': feature.get('properties') or {}}
+        if 'id' in feature:
+            out['id'] = feature['id']
+        if geometry is None:
+            out['type'] = None
+        else:
+            geometry_type, polygons = geometry
+            if geometry_type == 'Polygon':
+                out['type'] = 'Polygon'
+                out['arcs'] = polygons[0] if polygons else []
+            else:
+                out['type'] = 'MultiPolygon'
+                out['arcs'] = polygons
+        geometries.append(out)
+
+    return {
+        'type': 'Topology',
+        'bbox': [float(lower[0]), float(lower[1]), float(upper[0]), float(upper[1])],
+        'transform': {
+            'scale': [float(scale[0]), float(scale[1])],
+            'translate': [float(lower[0]), float(lower[1])]
+        },
+        'objects': {
+            TOPOJSON_OBJECT: {'type': 'GeometryCollection', 'geometries': geometries}
+        },
+        'arcs': [_quantize_arc(arc, lower, scale) for arc in arcs]
+    }
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""
+县级边界矢量切片（/api/tiles/<z>/<x>/<y>）
+
+按 Web 墨卡托 z/x/y 切片裁剪县级面要素，默认编码为 Mapbox Vector Tile（MVT v2，
+这里直接手写 protobuf 编码，不引入额外依赖），也可输出每片一个 GeoJSON。
+切片同时缓存在内存 LRU 与磁盘上；县总代数据变更时只删除与该县外包矩形相交的切片。
+"""
+import math
+import os
+import shutil
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.geo_cache import EncodedPayload
+from utils.geo_simplify import level_for_zoom
+from utils.geo_topology import geometry_polygons
+
+MVT_LAYER = 'counties'
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MAX_TILE_ZOOM = 18
+
+TILE_FORMATS = {
+    'mvt': 'application/vnd.mapbox-vector-tile',
+    'geojson': 'application/geo+json',
+}
+
+
+def tile_bounds(z, x, y):
+    """切片的经纬度范围 (west, south, east, north)"""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def tile_range(bbox, z, buffered=False):
+    """与经纬度外包矩形相交的切片下标范围 (x0, y0, x1, y1)，均为闭区间
+
+    buffered=True 时把切片缓冲区也计算在内（切片会包含缓冲区内的要素）。
+    """
+    n = 2 ** z
+    minx, miny, maxx, maxy = bbox
+    if buffered:
+        # 纬度方向按经度跨度外扩，墨卡托下切片纬度跨度不大于经度跨度，结果偏保守
+        pad = 360.0 / n * MVT_BUFFER / MVT_EXTENT
+        minx, miny, maxx, maxy = minx - pad, miny - pad, maxx + pad, maxy + pad
+
+    def column(lon):
+        return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+    def row(lat):
+        lat = max(-85.0511, min(85.0511, lat))
+        rad = math.radians(lat)
+        return min(n - 1, max(0, int((1 - math.log(math.tan(rad) + 1 / math.cos(rad)) / math.pi) / 2 * n)))
+
+    return column(minx), row(maxy), column(maxx), row(miny)
+
+
+def _clip_half_plane(ring, axis, value, keep_greater):
+    """Sutherland-Hodgman 对单条边界的向量化实现，ring 为不闭合的 n×2 数组"""
+    following = np.roll(ring, -1, axis=0)
+    current_values = ring[:, axis]
+    following_values = following[:, axis]
+    if keep_greater:
+        current_in = current_values >= value
+        following_in = following_values >= value
+    else:
+        current_in = current_values <= value
+        following_in = following_values <= value
+    crossing = current_in != following_in
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (value - current_values) / (following_values - current_values)
+        intersections = ring + (following - ring) * t[:, None]
+    intersections[:, axis] = value
+    # 每条边最多输出两个点：穿越边界时的交点，以及位于内侧的终点
+    points = np.stack([intersections, following], axis=1).reshape(-1, 2)
+    mask = np.stack([crossing, following_in], axis=1).reshape(-1)
+    return points[mask]
+
+
+def clip_ring(ring, bounds):
+    minx, miny, maxx, maxy = bounds
+    for axis, value, keep_greater in ((0, minx, True), (0, maxx, False), (1, miny, True), (1, maxy, False)):
+        if len(ring) < 3:
+            break
+        ring = _clip_half_plane(ring, axis, value, keep_greater)
+    return ring
+
+
+def _ring_area2(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def clip_feature(geometry, bounds):
+    """把面要素裁剪到 bounds，返回多边形列表（每个为不闭合环数组的列表）"""
+    polygons = []
+    for polygon in geometry_polygons(geometry) or ():
+        rings = []
+        for index, ring in enumerate(polygon):
+            ring = np.asarray(ring, dtype=np.float64)[:, :2]
+            if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+                ring = ring[:-1]
+            ring = clip_ring(ring, bounds)
+            if len(ring) < 3:
+                if index == 0:
+                    break
+                continue
+            rings.append(ring)
+        if rings:
+            polygons.append(rings)
+    return polygons
+
+
+# ---- MVT（protobuf）编码 ----
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+
+def _bytes_field(number, payload):
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _bytes_field(number, b''.join(_varint(v) for v in values))
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def _mvt_value(value):
+    if isinstance(value, bool):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        return _field(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _field(3, 1) + struct.pack('<d', value)
+    return _bytes_field(1, str(value).encode('utf-8'))
+
+
+def _project(rings, z, x, y):
+    """经纬度 -> 切片内整数坐标（左上角为原点，y 向下）"""
+    scale = MVT_EXTENT * 2 ** z
+    projected = []
+    for ring in rings:
+        lon = ring[:, 0]
+        lat = np.radians(np.clip(ring[:, 1], -85.0511, 85.0511))
+        px = (lon + 180.0) / 360.0 * scale - x * MVT_EXTENT
+        py = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * scale - y * MVT_EXTENT
+        points = np.rint(np.column_stack((px, py))).astype(np.int64)
+        changed = np.any(points != np.roll(points, 1, axis=0), axis=1)
+        points = points[changed] if changed.any() else points[:1]
+        projected.append(points)
+    return projected
+
+
+def _polygon_commands(polygons):
+    commands = []
+    cursor_x = cursor_y = 0
+    for rings in polygons:
+        for index, ring in enumerate(rings):
+            area = _ring_area2(ring) if len(ring) >= 3 else 0
+            if area == 0:
+                # 外环退化时整块面跳过，避免其内环变成孤立的外环
+                if index == 0:
+                    break
+                continue
+            # MVT v2：外环在切片坐标下面积为正，内环为负
+            if (index == 0) != (area > 0):
+                ring = ring[::-1]
+            commands.append((1 << 3) | 1)  # MoveTo, count=1
+            dx, dy = int(ring[0][0]) - cursor_x, int(ring[0][1]) - cursor_y
+            commands += [_zigzag(dx), _zigzag(dy)]
+            cursor_x, cursor_y = int(ring[0][0]), int(ring[0][1])
+            commands.append(((len(ring) - 1) << 3) | 2)  # LineTo
+            for px, py in ring[1:]:
+                px, py = int(px), int(py)
+                commands += [_zigzag(px - cursor_x), _zigzag(py - cursor_y)]
+                cursor_x, cursor_y = px, py
+            commands.append((1 << 3) | 7)  # ClosePath
+    return commands
+
+
+def encode_mvt(features, z, x, y):
+    """features: [(id, properties, polygons)]，polygons 为经纬度坐标的裁剪结果"""
+    keys, key_index = [], {}
+    values, value_index = [], {}
+    encoded_features = []
+    for feature_id, properties, polygons in features:
+        commands = _polygon_commands([_project(rings, z, x, y) for rings in polygons])
+        if not commands:
+            continue
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            if key not in key_index:
+                key_index[key] = len(keys)
+                keys.append(key)
+            value_key = (type(value), value)
+            if value_key not in value_index:
+                value_index[value_key] = len(values)
+                values.append(value)
+            tags += [key_index[key], value_index[value_key]]
+        body = _field(1, 0) + _varint(feature_id) + _packed(2, tags) + _field(3, 0) + _varint(3) + _packed(4, commands)
+        encoded_features.append(_bytes_field(2, body))
+
+    layer = _field(15, 0) + _varint(2) + _bytes_field(1, MVT_LAYER.encode('utf-8'))
+    layer += b''.join(encoded_features)
+    layer += b''.join(_bytes_field(3, key.encode('utf-8')) for key in keys)
+    layer += b''.join(_bytes_field(4, _mvt_value(value)) for value in values)
+    layer += _field(5, 0) + _varint(MVT_EXTENT)
+    return _bytes_field(3, layer)
+
+
+def encode_geojson_tile(features):
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'id': feature_id,
+            'properties': properties,
+            'geometry': {
+                'type': 'MultiPolygon',
+                'coordinates': [[np.vstack((ring, ring[:1])).tolist() for ring in rings] for rings in polygons]
+            }
+        } for feature_id, properties, polygons in features]
+    }
+
+
+def build_tile(dataset, z, x, y, fmt, status_lookup):
+    """生成一个切片（MVT 为字节，GeoJSON 为对象）；status_lookup(要素下标, 县名) 返回该县是否已有县总代"""
+    west, south, east, north = tile_bounds(z, x, y)
+    pad_x = (east - west) * MVT_BUFFER / MVT_EXTENT
+    pad_y = (north - south) * MVT_BUFFER / MVT_EXTENT
+    bounds = (west - pad_x, south - pad_y, east + pad_x, north + pad_y)
+
+    bboxes = dataset.feature_bboxes()
+    with np.errstate(invalid='ignore'):
+        hits = np.nonzero((bboxes[:, 0] <= bounds[2]) & (bboxes[:, 2] >= bounds[0]) &
+                          (bboxes[:, 1] <= bounds[3]) & (bboxes[:, 3] >= bounds[1]))[0]
+
+    # 低缩放级别使用预简化的几何，减少裁剪与编码的顶点数
+    source = dataset.simplified_features(level_for_zoom(z))
+    features = []
+    for index in hits.tolist():
+        feature = source[index]
+        polygons = clip_feature(feature.get('geometry'), bounds)
+        if not polygons:
+            continue
+        name = (feature.get('properties') or {}).get('name') or ''
+        properties = {'name': name, 'has_agent': bool(status_lookup(index, name))}
+        features.append((index, properties, polygons))
+
+    if fmt == 'mvt':
+        return encode_mvt(features, z, x, y)
+    return encode_geojson_tile(features)
+
+
+class TileCache:
+    """切片的内存 LRU（EncodedPayload）+ 磁盘缓存（原始字节），磁盘目录按 GeoJSON 文件签名区分版本
+
+    缓存内容对应一个县总代数据版本（_source）。put 需给出生成切片所用数据的版本，与当前不一致
+    （生成期间数据已更新并完成失效）的切片直接丢弃；写入、失效与切换版本由 _disk_lock 串行化，
+    失效之后不会再写入按旧数据生成的切片。
+    读取磁盘文件时不持有 _disk_lock：每次删除切片（失效、清空、切换目录）都递增 _generation，
+    读取完成后在锁内核对，期间发生过删除时丢弃读到的内容，不会把已失效的旧切片放回内存。
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.RLock()
+        self._directory = None
+        self._source = None
+        self._generation = 0
+
+    def bind(self, directory):
+        """切换到某个 GeoJSON 版本对应的磁盘目录；版本变化时清空内存并删除旧版本目录"""
+        if directory == self._directory:
+            return
+        with self._disk_lock, self._lock:
+            if directory == self._directory:
+                return
+            self._entries.clear()
+            self._generation += 1
+            self._directory = directory
+            self._source = self._read_marker()
+        parent = os.path.dirname(directory)
+        if os.path.isdir(parent):
+            for name in os.listdir(parent):
+                path = os.path.join(parent, name)
+                if path != directory:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def sync_source(self, signature):
+        """缓存内容对应的县总代数据签名与当前不一致（如数据文件被外部修改）时，清空全部切片"""
+        with self._disk_lock:
+            if repr(signature) != self._source:
+                self.clear()
+                self.mark_source(signature)
+
+    def mark_source(self, signature):
+        """记录缓存已与该版本县总代数据一致（精确失效完成后调用）"""
+        with self._disk_lock:
+            if not self._directory:
+                return
+            self._source = repr(signature)
+            self._write_marker(signature)
+
+    def _write_marker(self, signature):
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            with open(os.path.join(self._directory, 'agents.sig'), 'w', encoding='utf-8') as f:
+                f.write(repr(signature))
+        except OSError:
+            pass
+
+    def _read_marker(self):
+        try:
+            with open(os.path.join(self._directory, 'agents.sig'), 'r', encoding='utf-8') as f:
+                return f.read()
+        except (OSError, TypeError):
+            return None
+
+    def _path(self, key):
+        z, x, y, fmt = key
+        return os.path.join(self._directory, str(z), str(x), f'{y}.{fmt}')
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                return payload
+        # 先取代数再取目录：读取期间切换了目录时代数必然不同
+        generation = self._generation
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+            modified = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+        except OSError:
+            return None
+        payload = EncodedPayload(body, modified, TILE_FORMATS[key[3]])
+        with self._disk_lock:
+            # 读取期间切片被失效或删除，读到的可能是旧数据生成的内容，交由调用方重新生成
+            if self._generation != generation:
+                return None
+            self._remember(key, payload)
+        return payload
+
+    def put(self, key, payload, signature):
+        """缓存按 signature 版本的县总代数据生成的切片；版本与缓存当前版本不一致时不缓存"""
+        with self._disk_lock:
+            if repr(signature) != self._source:
+                return
+            self._remember(key, payload)
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f'{path}.{threading.get_ident()}.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(payload.body)
+                os.replace(temp_path, path)
+            except OSError as e:
+                # 磁盘缓存只是加速手段，写入失败时仅保留内存缓存
+                print(f"写入切片缓存失败: {e}")
+
+    def _remember(self, key, payload):
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._disk_lock:
+            with self._lock:
+                self._entries.clear()
+                self._generation += 1
+                directory = self._directory
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def invalidate_bboxes(self, bboxes):
+        """删除与任一外包矩形相交的所有已缓存切片（内存与磁盘）"""
+        bboxes = [tuple(b) for b in bboxes if not any(math.isnan(v) for v in b)]
+        if not bboxes:
+            return
+        with self._disk_lock:
+            self._invalidate_bboxes(bboxes)
+
+    def _invalidate_bboxes(self, bboxes):
+        with self._lock:
+            self._generation += 1
+            for key in list(self._entries):
+                z, x, y, _ = key
+                if any(self._in_range(tile_range(bbox, z, buffered=True), x, y) for bbox in bboxes):
+                    del self._entries[key]
+            directory = self._directory
+        if not directory or not os.path.isdir(directory):
+            return
+        for z_name in os.listdir(directory):
+            if not z_name.isdigit():
+                continue
+            z = int(z_name)
+            ranges = [tile_range(bbox, z, buffered=True) for bbox in bboxes]
+            z_dir = os.path.join(directory, z_name)
+            for x_name in os.listdir(z_dir):
+                if not x_name.isdigit() or not any(r[0] <= int(x_name) <= r[2] for r in ranges):
+                    continue
+                x_dir = os.path.join(z_dir, x_name)
+                for file_name in os.listdir(x_dir):
+                    y_name = file_name.split('.', 1)[0]
+                    if y_name.isdigit() and any(self._in_range(r, int(x_name), int(y_name)) for r in ranges):
+                        try:
+                            os.remove(os.path.join(x_dir, file_name))
+                        except OSError:
+                            pass
+
+    @staticmethod
+    def _in_range(tile_range_, x, y):
+        x0, y0, x1, y1 = tile_range_
+        return x0 <= x <= x1 and y0 <= y <= y1